@@ -0,0 +1,345 @@
+import argparse
+import json
+import os
+import queue
+import signal
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+import analyze_image
+from utilities.face_engine import warm_up_face_engine
+from utilities.image_utils import is_zoomed_out_copy
+from utilities.instrumentation import get_tracer
+from utilities.ollama_utils import install_and_setup_ollama, preload_model, release_model, stop_ollama_service
+import utilities.ollama_utils as ollama_utils
+from utilities.profile_store import load_profile
+from utilities.scanner import iter_entries, IMAGE_EXTENSIONS
+
+DAEMON_HOST = "127.0.0.1"  # the API accepts local file paths, so only listen on loopback unless told otherwise
+DAEMON_PORT = 8765
+WATCH_INTERVAL = 2.0  # seconds between scans of IMAGES_DIR (including its subfolders)
+DAEMON_WORKERS = 1
+UPLOAD_DIR = os.path.join(".cache", "uploads")
+MAX_UPLOAD_BYTES = 50 * 2**20
+MAX_FINISHED_JOBS = 10000  # finished jobs remembered for status/profile lookups; the oldest are forgotten first
+
+class AnalysisDaemon:
+    """Keeps the detector, client pool and model warm and processes images as they are submitted.
+
+    Images arrive through submit() (the HTTP API) or from the IMAGES_DIR watcher and run one job each through
+    analyze_image.process_image on a pool of worker threads. Every job records when it was submitted, started
+    and finished, so latency is measured from submission rather than from process start.
+    """
+
+    def __init__(self, watch_dir=None, watch_interval=WATCH_INTERVAL, workers=DAEMON_WORKERS, manifest=None):
+        self.watch_dir = watch_dir
+        self.watch_interval = watch_interval
+        self.workers = max(1, workers)
+        self.manifest = manifest
+        self.started_at = time.time()
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()  # job id -> job dict, oldest first
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+        self._seen = {}  # watched path -> (size, mtime_ns) it was last submitted with
+        self._pending = {}  # watched path -> (size, mtime_ns) seen once; submitted when unchanged on the next scan
+        self._latencies = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"analyze-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self.watch_dir:
+            thread = threading.Thread(target=self._watch, name="watch-folder", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        """Stop watching and accepting work; the job each worker is running is allowed to finish.
+
+        Jobs still queued are not started: they are marked "cancelled".
+        """
+        self._stop.set()
+        for _ in range(self.workers):
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def submit(self, image_path, source="api"):
+        """Queue an image and return its job record."""
+        job = {
+            "id": uuid.uuid4().hex[:12],
+            "image_path": image_path,
+            "source": source,
+            "status": "queued",
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "queue_seconds": None,
+            "latency_seconds": None,
+            "outputs": [],
+            "error": None,
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+            self._forget_finished()
+            if self._stop.is_set():
+                job.update(status="cancelled", finished_at=job["submitted_at"])
+                return dict(job)
+        self._queue.put(job["id"])
+        return dict(job)
+
+    def job(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _forget_finished(self):
+        excess = len(self._jobs) - MAX_FINISHED_JOBS
+        for job_id in [job_id for job_id, job in self._jobs.items() if job["finished_at"]][:max(0, excess)]:
+            del self._jobs[job_id]
+
+    def _work(self):
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    continue
+                if self._stop.is_set():
+                    # Shutting down: skip the backlog so the workers reach their stop sentinels promptly
+                    job.update(status="cancelled", finished_at=time.time())
+                    continue
+                job["status"] = "running"
+                job["started_at"] = time.time()
+                job["queue_seconds"] = round(job["started_at"] - job["submitted_at"], 4)
+            try:
+                analyze_image.process_image(job["image_path"], manifest=self.manifest)
+                outputs, status, error = output_paths(job["image_path"]), "done", None
+            except Exception as e:
+                print(f"An error occurred while processing {os.path.basename(job['image_path'])}: {e}")
+                outputs, status, error = [], "failed", str(e)
+            with self._lock:
+                job.update(status=status, outputs=outputs, error=error, finished_at=time.time())
+                job["latency_seconds"] = round(job["finished_at"] - job["submitted_at"], 4)
+                self._latencies.append(job["latency_seconds"])
+                del self._latencies[:-MAX_FINISHED_JOBS]
+            print(f"Job {job_id} {status} in {job['latency_seconds']:.2f}s from submission "
+                  f"({job['queue_seconds']:.2f}s queued): {job['image_path']}")
+
+    def _watch(self):
+        while not self._stop.is_set():
+            try:
+                self.scan_once()
+            except OSError as e:
+                print(f"Unable to scan {self.watch_dir}: {e}")
+            self._stop.wait(self.watch_interval)
+
+    def scan_once(self):
+        """Submit watched images that are new or changed and were unchanged since the previous scan.
+
+        Waiting for one stable scan keeps half-copied files from being analysed.
+        """
+        listed = set()
+        for entry in iter_entries(self.watch_dir, IMAGE_EXTENSIONS, exclude=is_zoomed_out_copy,
+                                  skip_dirs=[analyze_image.JSON_FILE_LOCATION]):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # removed since it was listed
+            listed.add(entry.path)
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if self._seen.get(entry.path) == signature:
+                continue
+            if self._pending.get(entry.path) != signature:
+                self._pending[entry.path] = signature
+                continue
+            del self._pending[entry.path]
+            self._seen[entry.path] = signature
+            self.submit(entry.path, source="watch")
+
+        # Forget deleted files so the bookkeeping doesn't grow with every file that ever passed through the folder
+        for tracked in (self._seen, self._pending):
+            for path in [path for path in tracked if path not in listed and not os.path.exists(path)]:
+                del tracked[path]
+
+    def status(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            latencies = np.asarray(self._latencies)
+        return {
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "workers": self.workers,
+            "watch_dir": self.watch_dir,
+            "queue_depth": self._queue.qsize(),
+            "jobs": counts,
+            "latency_from_submission": {
+                "count": len(latencies),
+                "p50_seconds": round(float(np.percentile(latencies, 50)), 4),
+                "p95_seconds": round(float(np.percentile(latencies, 95)), 4),
+                "max_seconds": round(float(latencies.max()), 4),
+            } if len(latencies) else None,
+            "trace": get_tracer().summary(),
+        }
+
+# Function to list the profile files an image's job produced (one per face in multi-face mode)
+def output_paths(image_path):
+    if analyze_image._PROFILE_STREAM is not None:
+        return [analyze_image._PROFILE_STREAM.path]
+    if not analyze_image.MULTI_FACE_MODE:
+        return [analyze_image.output_path_for(image_path)]
+    paths = []
+    while os.path.exists(analyze_image.output_path_for(image_path, len(paths))):
+        paths.append(analyze_image.output_path_for(image_path, len(paths)))
+    return paths
+
+# Function to save an uploaded image under a job-unique name and return its path
+def save_upload(data, filename):
+    name = os.path.basename(filename or "") or "upload.jpg"
+    if not name.lower().endswith(IMAGE_EXTENSIONS):
+        raise ValueError(f"Unsupported image type: {name}")
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex[:8]}_{name}")
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+class _DaemonHandler(BaseHTTPRequestHandler):
+    """POST /submit (JSON {"path": ...} or raw image bytes with ?filename=), GET /jobs/<id>, GET /profiles/<id>,
+    GET /status and GET /metrics."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload, default=_json_default).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/submit":
+            self._send_json({"error": f"unknown endpoint {url.path}"}, status=404)
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_UPLOAD_BYTES:
+            self._send_json({"error": f"body larger than {MAX_UPLOAD_BYTES} bytes"}, status=413)
+            return
+        body = self.rfile.read(length)
+        try:
+            if (self.headers.get("Content-Type") or "").startswith("application/json"):
+                image_path = json.loads(body or b"{}").get("path")
+                if not image_path or not os.path.isfile(image_path):
+                    raise ValueError(f"No such image: {image_path}")
+            else:
+                image_path = save_upload(body, (parse_qs(url.query).get("filename") or [None])[0])
+        except ValueError as e:
+            self._send_json({"error": str(e)}, status=400)
+            return
+        self._send_json(self.server.analysis.submit(image_path), status=202)
+
+    def do_GET(self):
+        daemon = self.server.analysis
+        parts = urlparse(self.path).path.strip("/").split("/")
+        if parts == ["status"]:
+            self._send_json(daemon.status())
+        elif parts == ["metrics"]:
+            body = get_tracer().prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif len(parts) == 2 and parts[0] in ("jobs", "profiles"):
+            job = daemon.job(parts[1])
+            if job is None:
+                self._send_json({"error": f"unknown job {parts[1]}"}, status=404)
+            elif parts[0] == "jobs":
+                self._send_json(job)
+            elif job["status"] != "done":
+                self._send_json({"error": f"job is {job['status']}", "job": job}, status=409)
+            else:
+                self._send_json({"job": job, "profiles": [load_profile(path) for path in job["outputs"]
+                                                          if not path.endswith(".jsonl")]})
+        else:
+            self._send_json({"error": f"unknown endpoint {self.path}"}, status=404)
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+# Function to serve the daemon's API from a background thread; returns the HTTP server
+def serve_api(daemon, host=DAEMON_HOST, port=DAEMON_PORT):
+    httpd = ThreadingHTTPServer((host, port), _DaemonHandler)
+    httpd.daemon_threads = True
+    httpd.analysis = daemon
+    threading.Thread(target=httpd.serve_forever, name="daemon-api", daemon=True).start()
+    print(f"Analysis daemon listening on http://{host}:{httpd.server_address[1]}")
+    return httpd
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Keep the face detector and the model warm and profile images as they arrive.")
+    parser.add_argument("--host", default=DAEMON_HOST)
+    parser.add_argument("--port", type=int, default=DAEMON_PORT)
+    parser.add_argument("--watch-dir", default=analyze_image.IMAGES_DIR,
+                        help="Folder polled for new or changed images.")
+    parser.add_argument("--no-watch", action="store_true", help="Only accept images through the HTTP API.")
+    parser.add_argument("--watch-interval", type=float, default=WATCH_INTERVAL)
+    parser.add_argument("--workers", type=int, default=DAEMON_WORKERS,
+                        help="Images processed concurrently (each still spreads its prompts over the client pool).")
+    parser.add_argument("--full", action="store_true", help="Re-process images even when the manifest has them.")
+    parser.add_argument("--query-mode", choices=["batched", "sequential", "session"], default=analyze_image.QUERY_MODE)
+    parser.add_argument("--multi-face", action="store_true", default=analyze_image.MULTI_FACE_MODE)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    analyze_image.QUERY_MODE = args.query_mode
+    analyze_image.MULTI_FACE_MODE = args.multi_face
+
+    # Pay every start-up cost once: server, pinned model and detector stay warm for the daemon's lifetime
+    if not install_and_setup_ollama(analyze_image.MODEL_NAME):
+        print("Ollama service failed to start. Exiting.")
+        return
+    preload_model(analyze_image.MODEL_NAME)
+    warm_up_face_engine()
+
+    manifest = analyze_image.get_manifest() if analyze_image.INCREMENTAL_MODE and not args.full else None
+    daemon = AnalysisDaemon(None if args.no_watch else args.watch_dir, args.watch_interval, args.workers,
+                            manifest).start()
+    httpd = serve_api(daemon, args.host, args.port)
+
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+    while not stop.wait(1.0):  # a timed wait lets signals through on every platform
+        pass
+
+    print("Shutting down; waiting for running jobs to finish.")
+    httpd.shutdown()
+    daemon.stop()
+    if ollama_utils.OLLAMA_PROCESS is None:
+        release_model(analyze_image.MODEL_NAME)
+    stop_ollama_service()
+
+if __name__ == "__main__":
+    main()
@@ -2,40 +2,139 @@ import os
 import json
 import re
 import time
+import hashlib
+import argparse
+import functools
+import threading
 from datetime import datetime
-from PIL import Image
 from utilities.ollama_utils import (
     install_and_setup_ollama,
     kill_existing_ollama_service,
     clear_gpu_memory,
-    start_ollama_service_windows,
     stop_ollama_service,
-    is_windows,
-    get_story_response_from_model
+    preload_model,
+    release_model,
+    get_story_response_from_model,
+    get_json_response_from_model
 )
-from utilities.standard_image_detection_utils import generate_face_profile
-from utilities.image_utils import zoom_out_and_pad
+import utilities.ollama_utils as ollama_utils
+from utilities.ollama_utils import MODEL_KEEP_ALIVE
+from utilities.image_session import ImageSession, SESSION_PRIMER
+from utilities.image_payload import get_payload_cache, PAYLOAD_MAX_SIDE, PAYLOAD_JPEG_QUALITY
+from utilities.standard_image_detection_utils import (generate_face_profile, generate_face_profiles, detect_faces,
+                                                      profile_faces, select_landmarks)
+from utilities.image_loader import MAX_DECODE_SIDE, load_image
+import utilities.standard_image_detection_utils as detection_utils
+from utilities.face_engine import warm_up_face_engine
+from utilities.attribute_query import query_attributes_batched, parse_batched_response, BATCHED_PROMPT_HEADER
+from utilities.manifest import RunManifest, MANIFEST_FILE_NAME
+from utilities.pipeline import run_pipelined
+from utilities.profile_store import write_profile, STORAGE_MODES, ProfileStreamWriter
+from utilities.ollama_client import get_default_client
+from utilities.response_cache import ResponseCache, image_content_hash
+from utilities.image_utils import is_zoomed_out_copy
+from utilities.instrumentation import get_tracer, trace_stage, serve_metrics
+from utilities.video_ingest import (iter_video_frames, pose_bucket, is_video_file, FaceDeduplicator, VIDEO_EXTENSIONS,
+                                    DEFAULT_SAMPLE_FPS, DEFAULT_MATCH_THRESHOLD)
+from utilities.scanner import (iter_files, output_relpath, ProgressReporter, IMAGE_EXTENSIONS, OUTPUT_LAYOUTS,
+                               PROGRESS_INTERVAL)
 import atexit
 
 # GLOBAL VARIABLES section
 IMAGES_DIR = "images"  # Directory where images are stored
 JSON_FILE_LOCATION = "json_profiles"
 MODEL_NAME = "llava:13b"
+# Incremental mode skips images whose content and stage versions match the manifest
+INCREMENTAL_MODE = True
+# Bump these when the code of a stage (or the profile layout) changes in a way the config fingerprint can't see
+PIPELINE_VERSION = "1"
+FACE_STAGE_VERSION = "2"
+LLM_STAGE_VERSION = "1"
+STAGES = ("face", "llm")
+# Multi-face mode writes one profile per detected face (<image>_face<i>.json) instead of profiling only the first face
+MULTI_FACE_MODE = False
+# "json" writes pretty-printed profiles as before; "compact" writes compact JSON plus a float32 embedding sidecar
+PROFILE_STORAGE = "json"
+# Where profiles go under JSON_FILE_LOCATION: "flat" (images at the top of IMAGES_DIR keep their historical
+# names), "mirror" (the IMAGES_DIR folder tree) or "sharded" (hash-named folders for very large trees)
+OUTPUT_LAYOUT = "flat"
+# When set (via --output-jsonl), profiles are appended to this single JSONL stream instead of one file per image
+_PROFILE_STREAM = None
+# Worker processes running the face stage ahead of the LLM stage (0 = fully serial) and how many images they may run ahead
+PIPELINE_WORKERS = 1
+PIPELINE_PREFETCH = 2
+# "batched" asks every attribute and its certainty in one structured JSON call;
+# "sequential" is the original one-prompt-per-question flow plus a certainty prompt per answer;
+# "session" sends the image once per image and asks every question as a turn reusing that context
+QUERY_MODE = "batched"
+SESSION_CACHE_OPTIONS = {"mode": "session"}  # keeps session replies apart from single-prompt replies in the cache
+# Videos: frames sampled per second, and the embedding similarity at which a face counts as already profiled
+VIDEO_SAMPLE_FPS = DEFAULT_SAMPLE_FPS
+VIDEO_MATCH_THRESHOLD = DEFAULT_MATCH_THRESHOLD
+VIDEO_STAGE_VERSION = "1"
 
-# Create output directory if it does not exist
-if not os.path.exists(JSON_FILE_LOCATION):
-    os.makedirs(JSON_FILE_LOCATION)
+# Persistent cache of model responses keyed by model, image content, prompt and options
+USE_RESPONSE_CACHE = True
+RESPONSE_CACHE_PATH = os.path.join(".cache", "model_responses.sqlite3")
+_RESPONSE_CACHE = None
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+INSTRUCTIONS = {
+    "description": "Describe this image. ONLY respond with descriptive features. No extra texts.",
+    "wearing_hat": "Is this person wearing a hat? Respond with only 'yes' or 'no'.",
+    "eye_color": "What is the eye color of this person? Provide only one of these colors: blue, green, brown, hazel, gray.",
+    "hair_color": "What color is the person's hair? Provide only one of these colors: blonde, brunette, black, red or specify 'none'.",
+    "facial_hair_color": "What color is the person's facial hair, if any? Provide only one of these colors: blonde, brunette, black, red or 'none'.",
+    "pose": "What pose is the person in? Provide a single word: front, side, or back.",
+    "age_estimation": "Estimate this person's age in years. Provide only the number.",
+    "gender": "What is the gender of this person? Respond with only 'male' or 'female'.",
+    "skin_tone": "What is the skin tone of this person? Provide one of these: white, yellow, brown, black, tan, olive, pale.",
+    "wearing_glasses": "Is this person wearing glasses? Respond with only 'yes' or 'no'.",
+    "upper_body_visible": "Is the person's upper body visible? Respond with only 'yes' or 'no'.",
+    "lower_body_visible": "Is the person's lower body visible? Respond with only 'yes' or 'no'."
+}
+
+CERTAINTY_PROMPT_TEMPLATE = "On a scale of 1-100, how certain are you about the answer '{answer}' to the question '{question}'? Respond with just a number."
+
+# Attributes whose answers get a llava13b_certainty in the profile
+CERTAINTY_KEYS = ["eye_color", "facial_hair_color", "hair_color", "skin_tone", "wearing_hat", "gender",
+                  "wearing_glasses", "age_estimation"]
 
 # Function to clean response
 def clean_response(response):
     response = re.sub(r"^.*?(yes|no|male|female|blue|green|brown|hazel|gray|blonde|brunette|black|red|(\d{1,3})|white|yellow|brown|black|tan|olive|pale|swimwear|shirt|jacket|pants|shorts|plain|striped|checked|polka-dot)\b.*$", r"\1", response, flags=re.IGNORECASE)
     return response.strip()
 
+# Function to get the shared response cache (None when caching is disabled)
+def get_response_cache():
+    global _RESPONSE_CACHE
+    if USE_RESPONSE_CACHE and _RESPONSE_CACHE is None:
+        with _RESPONSE_CACHE_LOCK:
+            if _RESPONSE_CACHE is None:
+                _RESPONSE_CACHE = ResponseCache(RESPONSE_CACHE_PATH)
+    return _RESPONSE_CACHE
+
+# Function to ask the model through the response cache; each call is traced as one span of the given stage
+def cached_model_call(image_path, prompt, compute, options=None, stage="prompt", validate=None):
+    with trace_stage(stage, image=image_path) as span:
+        cache = get_response_cache()
+        if cache is None:
+            return compute()
+        span["cache_hit"] = True
+
+        def compute_and_note_miss():
+            span["cache_hit"] = False
+            return compute()
+
+        return cache.get_or_compute(MODEL_NAME, image_content_hash(image_path), prompt, compute_and_note_miss, options,
+                                    validate)
+
 # Function to get certainty for model responses
-def get_certainty(instruction, answer):
-    CERTAINTY_PROMPT_TEMPLATE = "On a scale of 1-100, how certain are you about the answer '{answer}' to the question '{question}'? Respond with just a number."
+def get_certainty(instruction, answer, image_path=None):
     certainty_instruction = CERTAINTY_PROMPT_TEMPLATE.format(question=instruction, answer=answer)
-    certainty_response = get_story_response_from_model(MODEL_NAME, certainty_instruction)
+    certainty_response = cached_model_call(
+        image_path, certainty_instruction, lambda: get_story_response_from_model(MODEL_NAME, certainty_instruction),
+        stage="certainty")
     clean_certainty_response = clean_response(certainty_response)
     print(f"\nCertainty Question: {certainty_instruction}\nCertainty: {clean_certainty_response}")
     return clean_certainty_response
@@ -43,13 +142,15 @@ def get_certainty(instruction, answer):
 # Function to generate image description
 def generate_image_description(image_path, prompt):
     try:
-        result = get_story_response_from_model(MODEL_NAME, prompt)
+        result = cached_model_call(image_path, prompt, lambda: get_story_response_from_model(MODEL_NAME, prompt))
     except Exception as e:
         raise
     return result
 
 # Function to handle common fallback response checks and replacements
 def preprocess_response(response, fallback_value="Unknown"):
+    if response is None:
+        return fallback_value
     default_responses = [
         "I'm sorry", "I am not able to see images",
         "privacy", "general information", "I do not have personal opinions",
@@ -60,55 +161,433 @@ def preprocess_response(response, fallback_value="Unknown"):
             return fallback_value
     return response
 
+# Function to ask every question in one per-image session; certainty questions follow up on their answer's turn
+def query_model_session(image_path, instructions=INSTRUCTIONS, region=None):
+    # The payload is normally prepared by the face stage; it is only built here when that stage was skipped.
+    # With a region (a face bbox) the session is about a crop around that face.
+    session = ImageSession(MODEL_NAME, lambda: get_payload_cache().get(image_path, region=region),
+                           keep_alive=MODEL_KEEP_ALIVE)
+    cache_options = SESSION_CACHE_OPTIONS if region is None else dict(SESSION_CACHE_OPTIONS, region=region)
+    descriptions = {}
+    certainties = {}
+    for key, instruction in instructions.items():
+        answer = cached_model_call(image_path, instruction, lambda: session.ask(instruction), options=cache_options)
+        descriptions[instruction] = clean_response(preprocess_response(answer, fallback_value="Unknown"))
+        if key not in CERTAINTY_KEYS:
+            continue
+        certainty_prompt = CERTAINTY_PROMPT_TEMPLATE.format(question=instruction, answer=descriptions[instruction])
+        certainty = cached_model_call(image_path, certainty_prompt,
+                                      lambda: session.ask(certainty_prompt, follow_up_of=instruction),
+                                      options=cache_options, stage="certainty")
+        certainties[instruction] = clean_response(preprocess_response(certainty, fallback_value="Unknown"))
+
+    if session.turns:
+        print(f"Session token accounting for {image_path}: {json.dumps(session.stats())}")
+    return descriptions, certainties
+
+# Function to ask the model every attribute question; returns descriptions and certainties keyed by instruction
+def query_model(image_path, instructions=INSTRUCTIONS):
+    if QUERY_MODE == "session":
+        return query_model_session(image_path, instructions)
+
+    descriptions = {}
+    certainties = {}
+    pending = dict(instructions)
+
+    if QUERY_MODE == "batched":
+        answers, batched_certainties, errors = query_attributes_batched(
+            instructions, lambda prompt, schema: cached_model_call(
+                image_path, prompt, lambda: get_json_response_from_model(MODEL_NAME, prompt, schema),
+                options={"format": schema},
+                # Only replies that pass validation are cached; a bad one is asked again rather than replayed
+                validate=lambda reply: not parse_batched_response(reply, schema["required"])[2]))
+        for key, answer in answers.items():
+            instruction = instructions[key]
+            descriptions[instruction] = clean_response(preprocess_response(answer, fallback_value="Unknown"))
+            certainties[instruction] = str(batched_certainties[key])
+            pending.pop(key)
+        if errors:
+            print(f"Falling back to single prompts for: {', '.join(errors)}")
+
+    # Remaining prompts are independent, so run them concurrently on the client's pool
+    client = get_default_client()
+    futures = {key: client.submit(generate_image_description, image_path, instruction)
+               for key, instruction in pending.items()}
+    for key, future in futures.items():
+        clean_response_text = preprocess_response(future.result(), fallback_value="Unknown")
+        descriptions[pending[key]] = clean_response(clean_response_text)
+
+    futures = {pending[key]: client.submit(get_certainty, pending[key], descriptions[pending[key]], image_path)
+               for key in pending if key in CERTAINTY_KEYS}
+    for instruction, future in futures.items():
+        certainties[instruction] = future.result()
+
+    return descriptions, certainties
+
+# Function to run the face stage (insightface landmarks, region colors and color names)
+def run_face_stage(image_path):
+    # Decode once (reduced-size for oversized JPEGs); detection, the zoom-out fallback and the regions share the buffer
+    with trace_stage("decode", image=image_path):
+        image = load_image(image_path)
+    if MULTI_FACE_MODE:
+        face_output = {"faces": generate_face_profiles(image)}
+        print(f"Detected {len(face_output['faces'])} face(s) in {image_path}")
+    else:
+        face_output = generate_face_profile(image)
+    if QUERY_MODE == "session":
+        # Prepare the vision payloads from the same buffer while it is decoded; the disk tier hands them to the LLM stage
+        with trace_stage("payload", image=image_path):
+            for region in payload_regions(face_output):
+                get_payload_cache().get(image_path, image, region=region)
+    report_image_stats(image_path, image.stats())
+    return face_output
+
+# Function to list the payload regions the LLM stage will ask about: each face's bbox, or the whole image
+def payload_regions(face_output):
+    if MULTI_FACE_MODE:
+        return [face["bbox"] for face in face_output["faces"]]
+    return [None]
+
+# Function to print how long an image took to decode and how much memory it needed
+def report_image_stats(image_path, stats):
+    original = "x".join(str(side) for side in stats["original_size"])
+    decoded = "x".join(str(side) for side in stats["decoded_size"])
+    peak = f"{stats['peak_rss_bytes'] / 2**20:.0f} MB" if stats["peak_rss_bytes"] else "n/a"
+    print(f"Decoded {image_path}: {original} -> {decoded} in {stats['decode_ms']} ms, "
+          f"buffer {stats['buffer_bytes'] / 2**20:.1f} MB, peak RSS {peak}")
+
+# Function to capture the settings the face stage reads from this module, as main() left them
+def face_stage_settings():
+    return {
+        "multi_face_mode": MULTI_FACE_MODE,
+        "query_mode": QUERY_MODE,
+        "dominant_color_backend": detection_utils.DOMINANT_COLOR_BACKEND,
+        "color_naming_backend": detection_utils.COLOR_NAMING_BACKEND,
+        "payload_dir": get_payload_cache().directory if QUERY_MODE == "session" else None,
+    }
+
+# Function to set up a pipeline worker: spawn and forkserver workers re-import this module with its defaults, so
+# the parent's settings are applied explicitly before the usual initializer (e.g. warming up the face engine)
+def init_face_worker(settings, initializer=None):
+    global MULTI_FACE_MODE, QUERY_MODE
+    MULTI_FACE_MODE = settings["multi_face_mode"]
+    QUERY_MODE = settings["query_mode"]
+    detection_utils.DOMINANT_COLOR_BACKEND = settings["dominant_color_backend"]
+    detection_utils.COLOR_NAMING_BACKEND = settings["color_naming_backend"]
+    if settings["payload_dir"] is not None:
+        get_payload_cache(directory=settings["payload_dir"])
+    if initializer is not None:
+        initializer()
+
+# Function to run the face stage in a pipeline worker; ships the worker's trace spans back with the output
+def run_face_stage_traced(image_path):
+    tracer = get_tracer()
+    tracer.take_events()  # drop spans inherited from the parent or left over from warm-up
+    face_output = run_face_stage(image_path)
+    return face_output, tracer.take_events()
+
+# Function to run the LLM stage (attribute answers and certainties)
+def run_llm_stage(image_path, face_output=None):
+    if MULTI_FACE_MODE and QUERY_MODE == "session":
+        # Each face gets its own session on a crop around it, so the answers describe that person.
+        # The other query modes don't send the image, so their answers are shared by every face.
+        faces = []
+        for region in payload_regions(face_output):
+            descriptions, certainties = query_model_session(image_path, INSTRUCTIONS, region=region)
+            faces.append({"descriptions": descriptions, "certainties": certainties})
+        return {"faces": faces}
+    descriptions, certainties = query_model(image_path, INSTRUCTIONS)
+    return {"descriptions": descriptions, "certainties": certainties}
+
+# Function to fingerprint each stage's configuration so prompt or backend changes invalidate only that stage
+def current_stage_versions():
+    face_config = [FACE_STAGE_VERSION, MAX_DECODE_SIDE, detection_utils.DOMINANT_COLOR_BACKEND,
+                   detection_utils.COLOR_NAMING_BACKEND, MULTI_FACE_MODE]
+    llm_config = [LLM_STAGE_VERSION, MODEL_NAME, QUERY_MODE, INSTRUCTIONS, CERTAINTY_KEYS, CERTAINTY_PROMPT_TEMPLATE,
+                  BATCHED_PROMPT_HEADER, SESSION_PRIMER, PAYLOAD_MAX_SIDE, PAYLOAD_JPEG_QUALITY, MULTI_FACE_MODE]
+    return {
+        "face": hashlib.sha256(json.dumps(face_config, sort_keys=True).encode('utf-8')).hexdigest()[:16],
+        "llm": hashlib.sha256(json.dumps(llm_config, sort_keys=True).encode('utf-8')).hexdigest()[:16],
+    }
+
+# Function to get the version of the profile layout; switching storage modes rewrites existing profiles
+def current_pipeline_version():
+    storage = "jsonl" if _PROFILE_STREAM is not None else PROFILE_STORAGE
+    layout = ":multi_face" if MULTI_FACE_MODE else ""
+    if OUTPUT_LAYOUT != "flat":
+        layout += f":{OUTPUT_LAYOUT}"
+    return f"{PIPELINE_VERSION}:{storage}{layout}"
+
+# Function to build the output JSON path for an image (or for one of its faces in multi-face mode)
+def output_path_for(image_path, face_index=None):
+    suffix = f"_face{face_index}" if face_index is not None else ""
+    return os.path.join(JSON_FILE_LOCATION, f"{output_relpath(image_path, IMAGES_DIR, OUTPUT_LAYOUT, suffix)}.json")
+
+# Function to get the path the manifest checks for an image's output (the first face's in multi-face mode)
+def primary_output_path(image_path):
+    return output_path_for(image_path, 0 if MULTI_FACE_MODE else None)
+
+# Function to get the incremental-run manifest stored next to the profiles
+def get_manifest():
+    return RunManifest(os.path.join(JSON_FILE_LOCATION, MANIFEST_FILE_NAME))
+
+# Function to decide which stages an image needs; returns None when the existing profile is current
+def plan_image(image_path, manifest=None, force_stages=()):
+    plan = {
+        "json_file": primary_output_path(image_path),
+        "stage_versions": current_stage_versions(),
+        "content_hash": None,
+    }
+    plan["stages"] = list(plan["stage_versions"])
+
+    if manifest is not None:
+        content_hash, stages, skip = manifest.plan(image_path, current_pipeline_version(), plan["stage_versions"], force_stages)
+        if skip:
+            print(f"Skipping unchanged image: {image_path}")
+            return None
+        plan["content_hash"] = content_hash
+        plan["stages"] = stages
+        manifest.mark_started(image_path, content_hash, current_pipeline_version(), plan["json_file"])
+    return plan
+
+# Function to run the remaining stages of a planned image and write its profile
+def finish_image(image_path, plan, manifest=None, face_output=None):
+    if manifest is None:
+        print(f"Processing image: {image_path}")
+    else:
+        print(f"Processing image: {image_path} (stages: {', '.join(plan['stages']) or 'none, rebuilding profile'})")
+
+    outputs = {"face": face_output} if face_output is not None else {}
+    stage_runners = {
+        "face": lambda: run_face_stage(image_path),
+        "llm": lambda: run_llm_stage(image_path, outputs["face"]),
+    }
+    for stage, runner in stage_runners.items():
+        if stage not in outputs and stage not in plan["stages"]:
+            # Stage is current: reuse the output the manifest kept from an earlier run
+            outputs[stage] = manifest.load_stage(image_path, stage, plan["content_hash"])
+            if outputs[stage] is not None:
+                continue
+        if outputs.get(stage) is None:
+            with trace_stage(stage, image=image_path):
+                outputs[stage] = runner()
+        if manifest is not None:
+            manifest.save_stage(image_path, stage, plan["stage_versions"][stage], plan["content_hash"], outputs[stage])
+
+    json_files = []
+    with trace_stage("write", image=image_path):
+        for face_index, profile in build_profiles(image_path, outputs["face"], outputs["llm"]):
+            if _PROFILE_STREAM is not None:
+                _PROFILE_STREAM.write(profile)
+                json_files.append(_PROFILE_STREAM.path)
+            else:
+                json_files.append(write_profile(profile, output_path_for(image_path, face_index), PROFILE_STORAGE))
+    if manifest is not None:
+        manifest.mark_done(image_path, json_files[0])
+
+    for json_file in dict.fromkeys(json_files):
+        print(f"Generated JSON file: {json_file}")
+    for answers in outputs["llm"].get("faces") or [outputs["llm"]]:
+        for instruction, description in answers["descriptions"].items():
+            clean_desc = clean_response(description)
+            print(f"\nInstruction: {instruction}\nDescription: {clean_desc}")
+    return json_files[0]
+
 # Main process image function
-def process_image(image_path):
-    print(f"Processing image: {image_path}")
+def process_image(image_path, manifest=None, force_stages=()):
+    plan = plan_image(image_path, manifest, force_stages)
+    if plan is None:
+        return primary_output_path(image_path)
+    return finish_image(image_path, plan, manifest)
+
+# Function to process a batch with the face stage running ahead in worker processes while the LLM stage runs here
+def process_images_pipelined(image_paths, manifest=None, force_stages=(), workers=1, prefetch=2,
+                             initializer=warm_up_face_engine, progress=None, start_method=None):
+    plans = {}
+
+    def planned_images():
+        for image_path in image_paths:
+            try:
+                plan = plan_image(image_path, manifest, force_stages)
+            except Exception as e:
+                print(f"An error occurred while planning {image_path}: {e}")
+                plan = None
+            if plan is not None:
+                plans[image_path] = plan
+                yield image_path
+            elif progress is not None:
+                progress.update()
+
+    def llm_stage(image_path, produced):
+        face_output = None
+        if produced is not None:
+            face_output, events = produced
+            get_tracer().merge(events)
+        try:
+            finish_image(image_path, plans.pop(image_path), manifest, face_output=face_output)
+        finally:
+            if progress is not None:
+                progress.update()
+
+    # A failed face stage never reaches llm_stage, so its plan and progress are settled here
+    def stage_failed(image_path, error):
+        print(f"An error occurred while processing {image_path}: {error}")
+        if plans.pop(image_path, None) is not None and progress is not None:
+            progress.update()
+
+    stats = run_pipelined(planned_images(), run_face_stage_traced, llm_stage, workers=workers, max_pending=prefetch,
+                          needs_producer=lambda image_path: "face" in plans[image_path]["stages"],
+                          initializer=functools.partial(init_face_worker, face_stage_settings(), initializer),
+                          producer_name="face", consumer_name="llm", on_error=stage_failed,
+                          start_method=start_method)
+    print(f"Pipeline throughput: {json.dumps(stats, indent=2)}")
+    return stats
+
+# Function to fingerprint the video settings; a change re-processes every video
+def current_video_version(every_n_frames=None):
+    video_config = [VIDEO_STAGE_VERSION, VIDEO_SAMPLE_FPS, every_n_frames, VIDEO_MATCH_THRESHOLD,
+                    current_stage_versions()]
+    return hashlib.sha256(json.dumps(video_config, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+# Function to ask the model about one face of a video keyframe (a crop around it in session mode)
+def run_video_llm_stage(keyframe_path, image, face_profile):
+    if QUERY_MODE == "session":
+        get_payload_cache().get(keyframe_path, image, region=face_profile["bbox"])
+        return query_model_session(keyframe_path, INSTRUCTIONS, region=face_profile["bbox"])
+    return query_model(keyframe_path, INSTRUCTIONS)
+
+# Function to profile the people in a video: only new identities or poses go to the model, but every frame with a
+# face gets a record in <video>_frames.jsonl linking it to the profile it matched
+def process_video(video_path, manifest=None, force=False, every_n_frames=None):
+    output_base = os.path.join(JSON_FILE_LOCATION, output_relpath(video_path, IMAGES_DIR, OUTPUT_LAYOUT))
+    name = os.path.basename(output_base)
+    links_path = f"{output_base}_frames.jsonl"
+    keyframe_dir = f"{output_base}_keyframes"
+    version = current_video_version(every_n_frames)
+    content_hash = None
+    if manifest is not None:
+        content_hash, stages, skip = manifest.plan(video_path, current_pipeline_version(), {"video": version},
+                                                   ("video",) if force else ())
+        if skip:
+            print(f"Skipping unchanged video: {video_path}")
+            return links_path
+        manifest.mark_started(video_path, content_hash, current_pipeline_version(), links_path)
+    print(f"Processing video: {video_path}")
+
+    deduplicator = FaceDeduplicator(VIDEO_MATCH_THRESHOLD, prefix=f"{name}_id")
+    profile_paths = {}  # (identity, pose) -> profile written for it
+    frames = 0
+    failed_tracks = 0
+    tmp_links_path = f"{links_path}.tmp"
     try:
-        # Try generating face profile
-        face_profile = generate_face_profile(image_path)
-    except ValueError as e:
-        if "No face detected" in str(e):
-            print(f"No face detected in {image_path}. Trying to zoom out and add padding...")
-            new_image_path = zoom_out_and_pad(image_path)
-            print(f"Reprocessing with zoomed-out image: {new_image_path}")
-            face_profile = generate_face_profile(new_image_path)
+        with ProfileStreamWriter(tmp_links_path, fsync=False) as links:
+            for frame in iter_video_frames(video_path, VIDEO_SAMPLE_FPS, every_n_frames):
+                frames += 1
+                # Plain detection: the zoom-out fallback is for close-ups, and most CCTV frames have no face at all
+                faces = detect_faces(frame.image, zoom_out=False)
+                matches = [deduplicator.match(face.embedding, pose_bucket(select_landmarks(
+                    frame.image.to_original(face.landmark_2d_106)))) for face in faces]
+                new_faces = [(face_index, face) for face_index, (face, match) in enumerate(zip(faces, matches))
+                             if match.new_pose]
+                if new_faces:
+                    # Colors and model answers only for faces nobody has profiled yet
+                    keyframe_path = os.path.join(keyframe_dir, f"frame_{frame.index:07d}.jpg")
+                    os.makedirs(keyframe_dir, exist_ok=True)
+                    import cv2
+                    cv2.imwrite(keyframe_path, frame.frame)
+                    try:
+                        face_profiles = profile_faces(frame.image, [face for _, face in new_faces],
+                                                      [face_index for face_index, _ in new_faces])
+                    except Exception as e:
+                        print(f"An error occurred while profiling the faces in frame {frame.index}: {e}")
+                        failed_tracks += len(new_faces)
+                        face_profiles = []
+                    for face_profile in face_profiles:
+                        match = matches[face_profile["face_index"]]
+                        # One failed track is logged and skipped; the rest of the video is still analysed
+                        try:
+                            with trace_stage("llm", image=keyframe_path):
+                                answers = run_video_llm_stage(keyframe_path, frame.image, face_profile)
+                            profile_paths[match.identity, match.pose] = write_video_profile(
+                                video_path, frame, keyframe_path, face_profile, match, answers,
+                                os.path.dirname(output_base))
+                        except Exception as e:
+                            print(f"An error occurred while analysing {match.identity} ({match.pose}) "
+                                  f"in frame {frame.index}: {e}")
+                            failed_tracks += 1
+
+                for face_index, (face, match) in enumerate(zip(faces, matches)):
+                    links.write({
+                        "frame": frame.index,
+                        "seconds": frame.seconds,
+                        "face_index": face_index,
+                        "bbox": [round(float(v), 2)
+                                 for v in frame.image.to_original(face.bbox.reshape(2, 2)).reshape(4)],
+                        "identity": match.identity,
+                        "pose": match.pose,
+                        "similarity": match.similarity,
+                        "analysed": match.new_pose and (match.identity, match.pose) in profile_paths,
+                        "profile": profile_paths.get((match.identity, match.pose)),
+                    })
+        os.replace(tmp_links_path, links_path)
+    finally:
+        # A video that fails part-way leaves no partial links file behind
+        if os.path.exists(tmp_links_path):
+            os.remove(tmp_links_path)
+
+    stats = dict(deduplicator.stats(), frames=frames, failed_tracks=failed_tracks)
+    if manifest is not None:
+        manifest.save_stage(video_path, "video", version, content_hash, stats)
+        manifest.mark_done(video_path, links_path)
+    print(f"Video {video_path}: {json.dumps(stats)}")
+    print(f"Generated frame links: {links_path}")
+    return links_path
+
+# Function to write the profile of a new identity or pose seen in a video and return where it went
+def write_video_profile(video_path, frame, keyframe_path, face_profile, match, answers, output_dir):
+    descriptions, certainties = answers
+    profile = build_profile(keyframe_path, face_profile, descriptions, certainties)
+    profile["reference_images"][0]["pose"] = match.pose
+    profile_id = f"{match.identity}_{match.pose}"
+    profile["metadata"].update(video=video_path, frame=frame.index, seconds=frame.seconds, identity=match.identity,
+                               pose=match.pose, profile_id=profile_id, bbox=face_profile["bbox"],
+                               det_score=face_profile["det_score"])
+    with trace_stage("write", image=keyframe_path):
+        if _PROFILE_STREAM is not None:
+            _PROFILE_STREAM.write(profile)
+            json_file = _PROFILE_STREAM.path
         else:
-            raise e
+            json_file = write_profile(profile, os.path.join(output_dir, f"{profile_id}.json"), PROFILE_STORAGE)
+    print(f"Generated JSON file: {json_file} ({match.identity}, {match.pose}, frame {frame.index})")
+    return json_file
+
+# Function to build the profiles of an image as (face_index, profile) pairs; face_index is None in single-face mode
+def build_profiles(image_path, face_output, llm_output):
+    if not MULTI_FACE_MODE:
+        return [(None, build_profile(image_path, face_output, llm_output["descriptions"], llm_output["certainties"]))]
 
-    # Create output file name based on the input image file
-    output_file_name = f"{os.path.basename(image_path).replace('.', '_')}.json"
-    json_file = os.path.join(JSON_FILE_LOCATION, output_file_name)
+    profiles = []
+    for face_index, face_profile in enumerate(face_output["faces"]):
+        answers = llm_output["faces"][face_index] if "faces" in llm_output else llm_output
+        profile = build_profile(image_path, face_profile, answers["descriptions"], answers["certainties"])
+        profile["metadata"].update(face_index=face_index, face_count=len(face_output["faces"]),
+                                   bbox=face_profile["bbox"], det_score=face_profile["det_score"])
+        profiles.append((face_index, profile))
+    return profiles
 
+def build_profile(image_path, face_profile, descriptions, certainties):
+    instructions = INSTRUCTIONS
     left_eye_color_guess = face_profile["physical_features"]["left_eye_color_guess"]
     right_eye_color_guess = face_profile["physical_features"]["right_eye_color_guess"]
     facial_hair_color_guess = face_profile["physical_features"]["facial_hair"]["color_guess"]
     head_hair_color_guess = face_profile["physical_features"]["head_hair"]["color_guess"]
 
-    instructions = {
-        "description": "Describe this image. ONLY respond with descriptive features. No extra texts.",
-        "wearing_hat": "Is this person wearing a hat? Respond with only 'yes' or 'no'.",
-        "eye_color": "What is the eye color of this person? Provide only one of these colors: blue, green, brown, hazel, gray.",
-        "hair_color": "What color is the person's hair? Provide only one of these colors: blonde, brunette, black, red or specify 'none'.",
-        "facial_hair_color": "What color is the person's facial hair, if any? Provide only one of these colors: blonde, brunette, black, red or 'none'.",
-        "pose": "What pose is the person in? Provide a single word: front, side, or back.",
-        "age_estimation": "Estimate this person's age in years. Provide only the number.",
-        "gender": "What is the gender of this person? Respond with only 'male' or 'female'.",
-        "skin_tone": "What is the skin tone of this person? Provide one of these: white, yellow, brown, black, tan, olive, pale.",
-        "wearing_glasses": "Is this person wearing glasses? Respond with only 'yes' or 'no'.",
-        "upper_body_visible": "Is the person's upper body visible? Respond with only 'yes' or 'no'.",
-        "lower_body_visible": "Is the person's lower body visible? Respond with only 'yes' or 'no'."
-    }
-
-    descriptions = {}
-    for key, instruction in instructions.items():
-        response = generate_image_description(image_path, instruction)
-        clean_response_text = preprocess_response(response, fallback_value="Unknown")
-        descriptions[instruction] = clean_response(clean_response_text)
-
     profile = {
         "metadata": {
             "filename": image_path,
-            "file_location": os.path.abspath(image_path)
+            "file_location": os.path.abspath(image_path),
+            # Collision-free name of the image's output (see output_relpath); streams and indexes key profiles by it
+            "output_key": output_relpath(image_path, IMAGES_DIR, OUTPUT_LAYOUT).replace(os.sep, "/")
         },
         "body_structure": {
             "pose": descriptions[instructions["pose"]]
@@ -122,7 +601,7 @@ def process_image(image_path):
             "physical_features": {
                 "eyes": {
                     "color": descriptions[instructions["eye_color"]],
-                    "llava13b_certainty": get_certainty(instructions["eye_color"], descriptions[instructions["eye_color"]]),
+                    "llava13b_certainty": certainties[instructions["eye_color"]],
                     "left_eye_color": face_profile["physical_features"]["left_eye_color"],
                     "right_eye_color": face_profile["physical_features"]["right_eye_color"],
                     "left_eye_color_guess": left_eye_color_guess,
@@ -132,27 +611,27 @@ def process_image(image_path):
                     "standard_color": face_profile["physical_features"]["facial_hair"]["color"],
                     "standard_guess": facial_hair_color_guess,
                     "llava13b_guess": descriptions[instructions["facial_hair_color"]],
-                    "llava13b_certainty": get_certainty(instructions["facial_hair_color"], descriptions[instructions["facial_hair_color"]])
+                    "llava13b_certainty": certainties[instructions["facial_hair_color"]]
                 },
                 "head_hair": {
                     "standard_color": face_profile["physical_features"]["head_hair"]["color"],
                     "standard_guess": head_hair_color_guess,
                     "llava13b_guess": descriptions[instructions["hair_color"]],
-                    "llava13b_certainty": get_certainty(instructions["hair_color"], descriptions[instructions["hair_color"]])
+                    "llava13b_certainty": certainties[instructions["hair_color"]]
                 },
                 "skin_tone": {
                     "llava13b_guess": descriptions[instructions["skin_tone"]],
-                    "llava13b_certainty": get_certainty(instructions["skin_tone"], descriptions[instructions["skin_tone"]])
+                    "llava13b_certainty": certainties[instructions["skin_tone"]]
                 }
             },
             "wearing_hat": {
                 "present": "yes" in descriptions[instructions["wearing_hat"]].lower(),
                 "llava13b_color_guess": descriptions[instructions["wearing_hat"]],
-                "llava13b_certainty": get_certainty(instructions["wearing_hat"], descriptions[instructions["wearing_hat"]])
+                "llava13b_certainty": certainties[instructions["wearing_hat"]]
             },
             "gender": {
                 "value": descriptions[instructions["gender"]],
-                "llava13b_certainty": get_certainty(instructions["gender"], descriptions[instructions["gender"]])
+                "llava13b_certainty": certainties[instructions["gender"]]
             }
         },
         "accessories": {
@@ -160,7 +639,7 @@ def process_image(image_path):
                 "present": "yes" in descriptions[instructions["wearing_glasses"]].lower(),
                 "type": None,
                 "color": None,
-                "llava13b_certainty": get_certainty(instructions["wearing_glasses"], descriptions[instructions["wearing_glasses"]])
+                "llava13b_certainty": certainties[instructions["wearing_glasses"]]
             }
         },
         "clothing": {
@@ -182,41 +661,154 @@ def process_image(image_path):
         "description": descriptions[instructions["description"]],
         "age_estimation": {
             "value": descriptions[instructions["age_estimation"]],
-            "llava13b_certainty": get_certainty(instructions["age_estimation"], descriptions[instructions["age_estimation"]])
+            "llava13b_certainty": certainties[instructions["age_estimation"]]
         },
         "reference_images": face_profile["reference_images"]
     }
 
-    with open(json_file, 'w') as f:
-        json.dump(profile, f, indent=2)
+    return profile
 
-    print(f"Generated JSON file: {json_file}")
-    for instruction, description in descriptions.items():
-        clean_desc = clean_response(description)
-        print(f"\nInstruction: {instruction}\nDescription: {clean_desc}")
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate JSON profiles for the images under IMAGES_DIR.")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignore the manifest and re-process every image (disables incremental mode).")
+    parser.add_argument("--force-stages", default="",
+                        help=f"Comma-separated stages to re-run even when unchanged: {', '.join(STAGES)}.")
+    parser.add_argument("--workers", type=int, default=PIPELINE_WORKERS,
+                        help="Face-stage worker processes running ahead of the LLM stage (0 = serial).")
+    parser.add_argument("--prefetch", type=int, default=PIPELINE_PREFETCH,
+                        help="Maximum number of images the face stage may run ahead.")
+    parser.add_argument("--storage", choices=STORAGE_MODES, default=PROFILE_STORAGE,
+                        help="Profile storage: pretty JSON, or compact JSON with a binary float32 embedding sidecar.")
+    parser.add_argument("--output-layout", choices=OUTPUT_LAYOUTS, default=OUTPUT_LAYOUT,
+                        help="Profile paths: flat (historical names, path hash for nested images), mirror (the "
+                             "IMAGES_DIR tree) or sharded (hash-named folders for very large trees).")
+    parser.add_argument("--progress-interval", type=float, default=PROGRESS_INTERVAL,
+                        help="Seconds between progress/ETA lines.")
+    parser.add_argument("--output-jsonl", metavar="PATH",
+                        help="Append profiles to one JSONL stream (flushed and fsynced periodically) instead of "
+                             "writing one JSON file per image. Re-processed images append a newer record.")
+    parser.add_argument("--query-mode", choices=["batched", "sequential", "session"], default=QUERY_MODE,
+                        help="How attribute questions are asked (see QUERY_MODE).")
+    parser.add_argument("--multi-face", action="store_true", default=MULTI_FACE_MODE,
+                        help="Write one profile per detected face (<image>_face<i>.json) instead of the first face only.")
+    parser.add_argument("--video", action="append", default=[], metavar="PATH",
+                        help="Also profile the people in this video (repeatable); videos under IMAGES_DIR are picked "
+                             "up automatically.")
+    parser.add_argument("--video-sample-fps", type=float, default=VIDEO_SAMPLE_FPS,
+                        help="Video frames analysed per second (0 = every frame).")
+    parser.add_argument("--video-every", type=int, metavar="N",
+                        help="Analyse every Nth video frame instead of sampling by --video-sample-fps.")
+    parser.add_argument("--video-threshold", type=float, default=VIDEO_MATCH_THRESHOLD,
+                        help="Embedding cosine similarity at which a video face matches an already profiled one.")
+    parser.add_argument("--restart-ollama", action="store_true",
+                        help="Kill running Ollama processes and clear GPU memory first instead of reusing a server.")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="Write per-stage spans and Ollama eval stats to a JSON trace file (Chrome trace format).")
+    parser.add_argument("--metrics-port", type=int,
+                        help="Serve the run's stage and token metrics as Prometheus text on this port.")
+    return parser.parse_args(argv)
 
-def main():
-    kill_existing_ollama_service()
-    clear_gpu_memory()
+# Function to get the scan settings shared by the image stream and the progress count
+def scan_options():
+    # Skip *_zoomed_out.* leftovers of the old on-disk fallback so they aren't profiled a second time, and the
+    # profiles folder (with its video keyframes) should it live inside IMAGES_DIR
+    return {"exclude": is_zoomed_out_copy, "skip_dirs": [JSON_FILE_LOCATION]}
+
+# Function to lazily yield the images under IMAGES_DIR, recursively, setting the videos aside in video_paths
+def scan_images(video_paths):
+    for path in iter_files(IMAGES_DIR, IMAGE_EXTENSIONS + VIDEO_EXTENSIONS, **scan_options()):
+        if is_video_file(path):
+            video_paths.append(path)
+        else:
+            yield path
 
-    install_and_setup_ollama(MODEL_NAME)
-    
-    if is_windows():
-        service_started = start_ollama_service_windows()
-        if not service_started:
-            print("Ollama service failed to start. Exiting.")
-            return
+# Function to print where the run's time went: our own stages vs. model load, prompt evaluation and generation
+def print_trace_summary(summary):
+    for stage, totals in sorted(summary["stages"].items(), key=lambda item: -item[1]["total_seconds"]):
+        print(f"Stage {stage}: {totals['count']} call(s), {totals['total_seconds']:.2f}s total, "
+              f"{totals['mean_ms']:.1f} ms mean, {totals['max_ms']:.1f} ms max")
+    for model, totals in summary["llm"].items():
+        print(f"Model {model}: {totals['requests']} request(s), load {totals['load_seconds']:.2f}s, "
+              f"prompt eval {totals['prompt_eval_seconds']:.2f}s ({totals['prompt_tokens_per_second']} tok/s), "
+              f"generation {totals['eval_seconds']:.2f}s ({totals['eval_tokens_per_second']} tok/s)")
 
-    for filename in os.listdir(IMAGES_DIR):
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+def main(argv=None):
+    global PROFILE_STORAGE, _PROFILE_STREAM, QUERY_MODE, MULTI_FACE_MODE, VIDEO_SAMPLE_FPS, VIDEO_MATCH_THRESHOLD
+    global OUTPUT_LAYOUT
+    args = parse_args(argv)
+    PROFILE_STORAGE = args.storage
+    OUTPUT_LAYOUT = args.output_layout
+    VIDEO_SAMPLE_FPS = args.video_sample_fps
+    VIDEO_MATCH_THRESHOLD = args.video_threshold
+    QUERY_MODE = args.query_mode
+    MULTI_FACE_MODE = args.multi_face
+    force_stages = {stage.strip() for stage in args.force_stages.split(",") if stage.strip()}
+    unknown_stages = force_stages - set(STAGES)
+    if unknown_stages:
+        print(f"Unknown stage(s) in --force-stages: {', '.join(sorted(unknown_stages))}")
+        return
+    manifest = get_manifest() if INCREMENTAL_MODE and not args.full else None
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    if args.output_jsonl:
+        _PROFILE_STREAM = ProfileStreamWriter(args.output_jsonl)
+        atexit.register(_PROFILE_STREAM.close)
+
+    if args.restart_ollama:
+        kill_existing_ollama_service()
+        clear_gpu_memory()
+
+    if not install_and_setup_ollama(MODEL_NAME, restart=args.restart_ollama):
+        print("Ollama service failed to start. Exiting.")
+        return
+    # Load and pin the model now so the first image doesn't pay the model load
+    preload_model(MODEL_NAME)
+
+    # The tree is streamed, not listed up front; a side thread counts the images so the progress lines get an ETA
+    video_paths = list(args.video)
+    image_paths = scan_images(video_paths)
+    progress = ProgressReporter(interval=args.progress_interval).count_in_background(
+        lambda: iter_files(IMAGES_DIR, IMAGE_EXTENSIONS, **scan_options()))
+
+    if args.workers > 0:
+        process_images_pipelined(image_paths, manifest, force_stages, workers=args.workers, prefetch=args.prefetch,
+                                 progress=progress)
+    else:
+        # Load the face detector once up front so the first image doesn't pay the model load
+        warm_up_face_engine()
+        for image_path in image_paths:
             try:
-                image_path = os.path.join(IMAGES_DIR, filename)
-                process_image(image_path)
+                process_image(image_path, manifest=manifest, force_stages=force_stages)
             except Exception as e:
-                print(f"An error occurred while processing {filename}: {e}")
+                print(f"An error occurred while processing {os.path.basename(image_path)}: {e}")
+            progress.update()
+    progress.report()
+
+    for video_path in video_paths:
+        try:
+            process_video(video_path, manifest=manifest, force=bool(force_stages), every_n_frames=args.video_every)
+        except Exception as e:
+            print(f"An error occurred while processing {os.path.basename(video_path)}: {e}")
+
+    if _PROFILE_STREAM is not None:
+        _PROFILE_STREAM.close()
+
+    cache = get_response_cache()
+    if cache is not None:
+        print(f"Response cache: {cache.stats()}")
+    if QUERY_MODE == "session":
+        print(f"Image payload cache: {get_payload_cache().stats()}")
+
+    print_trace_summary(get_tracer().summary())
+    if args.trace:
+        print(f"Trace written to {get_tracer().write_trace(args.trace)}")
 
+    if ollama_utils.OLLAMA_PROCESS is None:
+        release_model(MODEL_NAME)  # shared server: let the model unload after the normal idle time
     stop_ollama_service()
-    clear_gpu_memory()
+    if args.restart_ollama:
+        clear_gpu_memory()
 
 if __name__ == "__main__":
     atexit.register(stop_ollama_service)
@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import time
+import numpy as np
+from utilities.dominant_color import detect_hex_colors, BACKENDS
+from utilities.color_naming import rgb_to_lab, hex_to_rgb_array, get_color_names
+
+IMAGES_DIR = "images"
+REGIONS_PER_IMAGE = 4  # left eye, right eye, facial hair, head hair
+AGREEMENT_DELTA_E = 10.0  # CIE76 distance under which two backends count as agreeing
+
+# Function to build synthetic face-like regions: one dominant color, a secondary color and noise
+def synthetic_regions(count, seed=0):
+    rng = np.random.default_rng(seed)
+    regions = []
+    for _ in range(count):
+        height, width = rng.integers(15, 60, size=2)
+        dominant, secondary = rng.integers(0, 256, size=(2, 3))
+        region = np.empty((height, width, 3), dtype=np.int16)
+        region[:] = dominant
+        mask = rng.random((height, width)) < 0.3
+        region[mask] = secondary
+        region += rng.normal(0, 8, size=region.shape).astype(np.int16)
+        regions.append(np.clip(region, 0, 255).astype(np.uint8))
+    return regions
+
+# Function to sample random crops from the images directory so the benchmark also sees real pixels
+def image_regions(count, seed=0):
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    images = [cv2.imread(os.path.join(IMAGES_DIR, f)) for f in sorted(os.listdir(IMAGES_DIR))
+              if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+    images = [img for img in images if img is not None]
+    regions = []
+    for i in range(count if images else 0):
+        img = images[i % len(images)]
+        height, width = rng.integers(20, 60, size=2)
+        y = rng.integers(0, max(1, img.shape[0] - height))
+        x = rng.integers(0, max(1, img.shape[1] - width))
+        regions.append(img[y:y + height, x:x + width])
+    return regions
+
+def run_backend(regions, backend):
+    """Time one backend over the regions, one call per image (REGIONS_PER_IMAGE regions at a time)."""
+    colors = []
+    start = time.perf_counter()
+    for i in range(0, len(regions), REGIONS_PER_IMAGE):
+        colors.extend(detect_hex_colors(regions[i:i + REGIONS_PER_IMAGE], backend=backend))
+    return colors, time.perf_counter() - start
+
+def agreement(colors_a, colors_b):
+    """Fraction of regions where two backends agree, by CIELAB distance and by bundled color name."""
+    lab_a = rgb_to_lab(hex_to_rgb_array(colors_a))
+    lab_b = rgb_to_lab(hex_to_rgb_array(colors_b))
+    delta_e = np.sqrt(((lab_a - lab_b) ** 2).sum(axis=1))
+    same_name = np.mean([a == b for a, b in zip(get_color_names(colors_a), get_color_names(colors_b))])
+    return {
+        "within_delta_e": float(np.mean(delta_e < AGREEMENT_DELTA_E)),
+        "same_color_name": float(same_name),
+        "median_delta_e": float(np.median(delta_e)),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare dominant-color backends for speed and agreement.")
+    parser.add_argument("--images", type=int, default=200, help="Number of simulated images (4 regions each).")
+    parser.add_argument("--source", choices=["synthetic", "images"], default="synthetic")
+    parser.add_argument("--baseline", choices=BACKENDS, default="sklearn")
+    parser.add_argument("--output", help="Optional path for the JSON report.")
+    args = parser.parse_args(argv)
+
+    count = args.images * REGIONS_PER_IMAGE
+    regions = synthetic_regions(count) if args.source == "synthetic" else image_regions(count)
+    if not regions:
+        print(f"No regions to benchmark (source={args.source}).")
+        return
+
+    results = {}
+    for backend in BACKENDS:
+        colors, seconds = run_backend(regions, backend)
+        results[backend] = {"colors": colors, "seconds": seconds}
+
+    baseline = results[args.baseline]
+    report = {"images": len(regions) // REGIONS_PER_IMAGE, "regions": len(regions), "source": args.source,
+              "baseline": args.baseline, "backends": {}}
+    for backend, result in results.items():
+        report["backends"][backend] = {
+            "seconds": round(result["seconds"], 4),
+            "ms_per_image": round(1000 * result["seconds"] * REGIONS_PER_IMAGE / len(regions), 3),
+            "speedup_vs_baseline": round(baseline["seconds"] / result["seconds"], 2) if result["seconds"] else None,
+            "agreement_with_baseline": agreement(result["colors"], baseline["colors"]),
+        }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import argparse
+import contextlib
+import functools
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+import analyze_image
+from compare_two_profiles import calculate_similarity, calculate_similarity_matrix, load_profiles
+from utilities.face_engine import set_face_engine, warm_up_face_engine
+from utilities.instrumentation import get_tracer
+from utilities.image_payload import get_payload_cache
+from utilities.fake_ollama_server import FakeOllamaServer
+from utilities.ollama_client import OllamaClient, set_default_client, DEFAULT_CONCURRENCY
+from utilities.ollama_router import ROUTING_STRATEGIES, DEFAULT_STRATEGY
+from utilities.image_utils import is_zoomed_out_copy
+from utilities.scanner import iter_files
+from utilities.synthetic_faces import SyntheticFaceEngine, write_synthetic_faces
+
+IMAGES_DIR = "images"
+REGRESSION_TOLERANCE = 0.2  # fractional slowdown vs. the baseline report that counts as a regression
+MAX_SCALAR_PAIRS = 2000  # pairs timed through the scalar calculate_similarity
+# Images re-run with spawn-started workers (the Windows and macOS default), where settings only reach the face
+# stage if they are handed to the workers explicitly; any failure there fails the benchmark
+SPAWN_CHECK_IMAGES = 4
+
+# Function to summarize a list of durations in seconds
+def latency_summary(seconds):
+    if not seconds:
+        return None
+    values = np.asarray(seconds)
+    return {
+        "count": len(seconds),
+        "total_seconds": round(float(values.sum()), 4),
+        "mean_ms": round(1000 * float(values.mean()), 3),
+        "p50_ms": round(1000 * float(np.percentile(values, 50)), 3),
+        "p95_ms": round(1000 * float(np.percentile(values, 95)), 3),
+        "max_ms": round(1000 * float(values.max()), 3),
+    }
+
+@contextlib.contextmanager
+def timed_stages(durations):
+    """Temporarily wrap analyze_image's stage functions so each call's wall time lands in durations[stage]."""
+    originals = {"face": analyze_image.run_face_stage, "llm": analyze_image.run_llm_stage}
+
+    def wrap(stage, fn):
+        def timed(*args):
+            start = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                durations[stage].append(time.perf_counter() - start)
+        return timed
+
+    analyze_image.run_face_stage = wrap("face", originals["face"])
+    analyze_image.run_llm_stage = wrap("llm", originals["llm"])
+    try:
+        yield durations
+    finally:
+        analyze_image.run_face_stage = originals["face"]
+        analyze_image.run_llm_stage = originals["llm"]
+
+# Function to collect the benchmark inputs: synthetic faces, or the real photos in IMAGES_DIR
+def benchmark_images(args, work_dir):
+    if args.source == "synthetic":
+        return write_synthetic_faces(os.path.join(work_dir, "images"), args.images, size=(args.size * args.faces, args.size),
+                                     faces=args.faces)
+    paths = sorted(iter_files(IMAGES_DIR, exclude=is_zoomed_out_copy))
+    return list(itertools.islice(itertools.cycle(paths), args.images)) if paths else []
+
+def run_serial(image_paths):
+    durations = {"face": [], "llm": []}
+    latencies = []
+    start = time.perf_counter()
+    with timed_stages(durations):
+        for image_path in image_paths:
+            image_start = time.perf_counter()
+            analyze_image.process_image(image_path)
+            latencies.append(time.perf_counter() - image_start)
+    wall_seconds = time.perf_counter() - start
+    return {
+        "wall_seconds": round(wall_seconds, 4),
+        "images_per_second": round(len(latencies) / wall_seconds, 3) if wall_seconds else None,
+        "latency": latency_summary(latencies),
+        "stages": {stage: latency_summary(values) for stage, values in durations.items()},
+    }
+
+def run_pipelined(image_paths, args, start_method=None):
+    if args.engine == "synthetic":
+        initializer = functools.partial(set_face_engine, SyntheticFaceEngine(detect_seconds=args.detect_seconds,
+                                                                             faces_per_image=args.faces))
+    else:
+        initializer = warm_up_face_engine
+    stats = analyze_image.process_images_pipelined(image_paths, workers=args.workers, prefetch=args.prefetch,
+                                                   initializer=initializer, start_method=start_method)
+    return {
+        "start_method": start_method or multiprocessing.get_start_method(),
+        "failures": sum(stage["failures"] for stage in stats["stages"]),
+        "wall_seconds": stats["wall_seconds"],
+        "images_per_second": stats["items_per_second"],
+        "consumer_waiting_seconds": stats["consumer_waiting_seconds"],
+        "stages": {stage["stage"]: stage for stage in stats["stages"]},
+    }
+
+def run_similarity(profiles_dir, max_pairs=MAX_SCALAR_PAIRS):
+    names, profiles = load_profiles(profiles_dir)
+    pairs = list(itertools.islice(itertools.combinations(range(len(profiles)), 2), max_pairs))
+    start = time.perf_counter()
+    for i, j in pairs:
+        calculate_similarity(profiles[i], profiles[j], verbose=False)
+    scalar_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    calculate_similarity_matrix(profiles)
+    matrix_seconds = time.perf_counter() - start
+    matrix_pairs = len(profiles) * (len(profiles) - 1) // 2
+    return {
+        "profiles": len(profiles),
+        "scalar_pairs": len(pairs),
+        "scalar_seconds": round(scalar_seconds, 4),
+        "scalar_pairs_per_second": round(len(pairs) / scalar_seconds, 1) if scalar_seconds else None,
+        "matrix_seconds": round(matrix_seconds, 4),
+        "matrix_pairs_per_second": round(matrix_pairs / matrix_seconds, 1) if matrix_seconds else None,
+    }
+
+# Function to list the metrics that got slower than the baseline report by more than the tolerance
+def find_regressions(report, baseline, tolerance=REGRESSION_TOLERANCE):
+    checks = [("pipeline.images_per_second", True), ("pipeline.latency.p95_ms", False),
+              ("similarity.scalar_pairs_per_second", True), ("similarity.matrix_pairs_per_second", True)]
+    regressions = []
+    for path, higher_is_better in checks:
+        current, previous = report, baseline
+        for key in path.split("."):
+            current = (current or {}).get(key)
+            previous = (previous or {}).get(key)
+        if not current or not previous:
+            continue
+        change = (previous - current) / previous if higher_is_better else (current - previous) / previous
+        if change > tolerance:
+            regressions.append({"metric": path, "baseline": previous, "current": current,
+                                "slowdown": round(change, 3)})
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark process_image and calculate_similarity offline against a fake Ollama server.")
+    parser.add_argument("--images", type=int, default=20, help="Number of images to process.")
+    parser.add_argument("--source", choices=["synthetic", "images"], default="synthetic",
+                        help="Synthetic faces, or the photos in IMAGES_DIR (cycled to --images).")
+    parser.add_argument("--size", type=int, default=640, help="Side of the synthetic face images in pixels.")
+    parser.add_argument("--faces", type=int, default=1,
+                        help="Faces per synthetic image; more than one turns on multi-face mode.")
+    parser.add_argument("--engine", choices=["synthetic", "insightface"], default="synthetic",
+                        help="Synthetic landmarks/embeddings, or the real insightface models.")
+    parser.add_argument("--detect-seconds", type=float, default=0.0,
+                        help="Simulated detector time per image for the synthetic engine.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake Ollama seconds per request.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform +/- jitter on --latency.")
+    parser.add_argument("--responses", help="JSON file mapping prompt substrings to canned replies.")
+    parser.add_argument("--query-mode", choices=["batched", "sequential", "session"], default=analyze_image.QUERY_MODE)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Client-side parallel requests per fake server.")
+    parser.add_argument("--endpoints", type=int, default=1, help="Fake Ollama servers to route requests across.")
+    parser.add_argument("--routing", choices=ROUTING_STRATEGIES, default=DEFAULT_STRATEGY)
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Face-stage worker processes (0 = serial, which also reports per-image latency).")
+    parser.add_argument("--prefetch", type=int, default=analyze_image.PIPELINE_PREFETCH)
+    parser.add_argument("--output", help="Optional path for the JSON report.")
+    parser.add_argument("--compare", metavar="BASELINE",
+                        help="Earlier JSON report; exit with status 1 if a metric regressed beyond --tolerance.")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own output.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    responses = None
+    if args.responses:
+        with open(args.responses) as f:
+            responses = json.load(f)
+
+    work_dir = tempfile.mkdtemp(prefix="pipeline_bench_")
+    servers = [FakeOllamaServer(latency=args.latency, jitter=args.jitter, responses=responses,
+                                models=[analyze_image.MODEL_NAME], seed=i).start() for i in range(max(1, args.endpoints))]
+    try:
+        image_paths = benchmark_images(args, work_dir)
+        if not image_paths:
+            print(f"No images to benchmark (source={args.source}).")
+            return
+
+        client = set_default_client(OllamaClient([server.url for server in servers], concurrency=args.concurrency,
+                                                 routing=args.routing))
+        if args.engine == "synthetic":
+            set_face_engine(SyntheticFaceEngine(detect_seconds=args.detect_seconds, faces_per_image=args.faces))
+        else:
+            warm_up_face_engine()
+        analyze_image.JSON_FILE_LOCATION = os.path.join(work_dir, "profiles")
+        os.makedirs(analyze_image.JSON_FILE_LOCATION)
+        analyze_image.USE_RESPONSE_CACHE = False  # every run must pay the model latency
+        get_payload_cache(directory=os.path.join(work_dir, "payloads"))
+        analyze_image.QUERY_MODE = args.query_mode
+        analyze_image.MULTI_FACE_MODE = args.faces > 1
+
+        pipeline_output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with pipeline_output:
+            pipeline = run_serial(image_paths) if args.workers == 0 else run_pipelined(image_paths, args)
+            spawn_check = None
+            if args.workers > 0:
+                spawn_check = run_pipelined(image_paths[:SPAWN_CHECK_IMAGES], args, start_method="spawn")
+        similarity = run_similarity(analyze_image.JSON_FILE_LOCATION)
+
+        report = {
+            "config": {
+                "images": len(image_paths), "source": args.source, "engine": args.engine,
+                "faces_per_image": args.faces, "latency": args.latency, "jitter": args.jitter, "query_mode": args.query_mode,
+                "concurrency": args.concurrency, "endpoints": len(servers), "routing": args.routing,
+                "workers": args.workers,
+            },
+            "pipeline": pipeline,
+            "spawn_check": spawn_check,
+            "ollama_requests": [server.stats() for server in servers],
+            "routing": client.stats(),
+            "trace": get_tracer().summary(),
+            "similarity": similarity,
+        }
+    finally:
+        for server in servers:
+            server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            report["regressions"] = find_regressions(report, json.load(f), args.tolerance)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    failures = {name: run["failures"] for name, run in (("pipeline", pipeline), ("spawn_check", spawn_check))
+                if run and run.get("failures")}
+    if failures:
+        print(f"Images failed in the pipelined run(s): {json.dumps(failures)}")
+    if report.get("regressions") or failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,44 @@
 import os
 import json
+import time
+import argparse
 from difflib import SequenceMatcher
+import numpy as np
+from utilities.profile_store import load_profile as load_stored_profile, iter_named_profiles
+
+FEATURES = [
+    ("body_structure.pose", 0.1),
+    ("head.physical_features.eyes.color", 0.1),
+    ("head.physical_features.facial_hair.llava13b_guess", 0.05),
+    ("head.physical_features.head_hair.llava13b_guess", 0.05),
+    ("head.gender.value", 0.1),
+    ("head.physical_features.skin_tone.llava13b_guess", 0.1),
+    ("head.wearing_hat.present", 0.1),
+    ("accessories.glasses.present", 0.05),
+    ("clothing.upper_body.type", 0.05),
+    ("clothing.upper_body.color", 0.05),
+    ("clothing.lower_body.type", 0.05),
+    ("clothing.lower_body.color", 0.05),
+    ("description", 0.05),
+    ("age_estimation.value", 0.05),
+    ("reference_images[0].embedding", 0.1)  # Special handling for embedding comparison
+]
+
+NUMBER_TOLERANCE = 5
+MATRIX_BLOCK_ROWS = 256
+MAX_BLOCK_ELEMENTS = 1 << 24  # floats materialized at once when comparing list features (~128 MB as float64)
+
+_MISSING = object()
+KIND_MISSING, KIND_NONE, KIND_STR, KIND_NUMBER, KIND_LIST, KIND_OTHER = range(6)
 
 def load_profile(path):
-    with open(path, 'r') as file:
-        return json.load(file)
+    # Handles both pretty-printed profiles and compact ones whose embeddings live in a memory-mapped sidecar
+    return load_stored_profile(path)
 
 def compare_strings(str1, str2):
     return SequenceMatcher(None, str1, str2).ratio()
 
-def compare_numbers(num1, num2, tolerance=5):
+def compare_numbers(num1, num2, tolerance=NUMBER_TOLERANCE):
     return 1 - min(abs(num1 - num2) / tolerance, 1)
 
 def compare_colors(color1, color2):
@@ -26,57 +55,52 @@ def compare_landmarks(landmarks1, landmarks2):
 def compare_feature(value1, value2):
     if value1 is None or value2 is None:
         return 0 if value1 != value2 else 1  # Handles None vs None as 100% similar
-    
+
     if isinstance(value1, str):
         return compare_strings(value1, value2)
     elif isinstance(value1, (int, float)):
         return compare_numbers(value1, value2)
-    elif isinstance(value1, list):
+    elif isinstance(value1, (list, np.ndarray)):
         return compare_landmarks(value1, value2)
-    
+
     return 0  # default case for unknown types
 
-def calculate_similarity(profile1, profile2):
-    features = [
-        ("body_structure.pose", 0.1),
-        ("head.physical_features.eyes.color", 0.1),
-        ("head.physical_features.facial_hair.llava13b_guess", 0.05),
-        ("head.physical_features.head_hair.llava13b_guess", 0.05),
-        ("head.gender.value", 0.1),
-        ("head.physical_features.skin_tone.llava13b_guess", 0.1),
-        ("head.wearing_hat.present", 0.1),
-        ("accessories.glasses.present", 0.05),
-        ("clothing.upper_body.type", 0.05),
-        ("clothing.upper_body.color", 0.05),
-        ("clothing.lower_body.type", 0.05),
-        ("clothing.lower_body.color", 0.05),
-        ("description", 0.05),
-        ("age_estimation.value", 0.05),
-        ("reference_images[0].embedding", 0.1)  # Special handling for embedding comparison
-    ]
-
-    total_weight = sum(weight for key, weight in features)
-    similarity_sum = 0
+# Function to turn a feature path like "reference_images[0].embedding" into dict keys and list indexes, once
+def compile_feature_path(feature):
+    steps = []
+    for key in feature.split('.'):
+        if key.endswith("]"):
+            base, idx = key[:-1].split("[")
+            steps.extend([base, int(idx)])
+        else:
+            steps.append(key)
+    return tuple(steps)
+
+COMPILED_FEATURES = [(feature, compile_feature_path(feature), weight) for feature, weight in FEATURES]
+TOTAL_WEIGHT = sum(weight for _, _, weight in COMPILED_FEATURES)
 
-    for feature, weight in features:
-        keys = feature.split('.')
-        val1 = profile1
-        val2 = profile2
+def extract_feature(profile, path):
+    value = profile
+    for step in path:
+        value = value[step]
+    return value
+
+def calculate_similarity(profile1, profile2, verbose=True):
+    similarity_sum = 0
 
+    for feature, path, weight in COMPILED_FEATURES:
         try:
-            for key in keys:
-                if key.endswith("]"):
-                    base, idx = key[:-1].split("[")
-                    idx = int(idx)
-                    val1 = val1[base][idx]
-                    val2 = val2[base][idx]
-                else:
-                    val1 = val1[key]
-                    val2 = val2[key]
-
-            similarity = compare_feature(val1, val2)
-            similarity_sum += similarity * weight
+            val1 = extract_feature(profile1, path)
+            val2 = extract_feature(profile2, path)
+        except (KeyError, IndexError) as e:
+            if verbose:
+                print(f"Feature {feature} caused an error: {e}")
+            continue  # If the feature is missing in one of the profiles it adds nothing
+
+        similarity = compare_feature(val1, val2)
+        similarity_sum += similarity * weight
 
+        if verbose:
             # Debugging statements
             print(f"Feature: {feature}")
             print(f"Value 1: {val1}")
@@ -85,24 +109,218 @@ def calculate_similarity(profile1, profile2):
             print(f"Weighted Similarity: {similarity * weight}")
             print()
 
-        except (KeyError, IndexError) as e:
-            print(f"Feature {feature} caused an error: {e}")
-            similarity_sum += 0  # If the feature is missing in one of the profiles
+    return (similarity_sum / TOTAL_WEIGHT) * 100
+
+def _value_kind(value):
+    if value is _MISSING:
+        return KIND_MISSING
+    if value is None:
+        return KIND_NONE
+    if isinstance(value, str):
+        return KIND_STR
+    if isinstance(value, (int, float)):
+        return KIND_NUMBER
+    if isinstance(value, (list, np.ndarray)):
+        return KIND_LIST
+    return KIND_OTHER
+
+class FeatureColumn:
+    """One feature extracted from every profile, split into typed arrays for vectorized comparison."""
+
+    def __init__(self, feature, weight, values):
+        self.feature = feature
+        self.weight = weight
+        self.values = values
+        self.kinds = np.array([_value_kind(value) for value in values], dtype=np.int8)
+        count = len(values)
+
+        # Strings: code each distinct value once; ratios are computed per distinct pair and memoized
+        self.strings = []
+        self.str_codes = np.full(count, -1, dtype=np.int64)
+        string_codes = {}
+        for i in np.flatnonzero(self.kinds == KIND_STR):
+            self.str_codes[i] = string_codes.setdefault(values[i], len(string_codes))
+        self.strings = list(string_codes)
+        self._ratios = {}
+
+        self.numbers = np.zeros(count, dtype=np.float64)
+        number_rows = np.flatnonzero(self.kinds == KIND_NUMBER)
+        self.numbers[number_rows] = [float(values[i]) for i in number_rows]
+
+        # Lists (landmarks, embeddings): one dense matrix per list length
+        self.list_groups = {}
+        self.list_length = np.full(count, -1, dtype=np.int64)
+        self.list_slot = np.full(count, -1, dtype=np.int64)
+        rows_by_length = {}
+        for i in np.flatnonzero(self.kinds == KIND_LIST):
+            rows_by_length.setdefault(len(values[i]), []).append(i)
+        for length, rows in rows_by_length.items():
+            try:
+                matrix = np.asarray([values[i] for i in rows], dtype=np.float64).reshape(len(rows), length)
+            except (TypeError, ValueError):
+                self.kinds[rows] = KIND_OTHER  # nested or non-numeric lists take the scalar path
+                continue
+            self.list_groups[length] = matrix
+            self.list_length[rows] = length
+            self.list_slot[rows] = np.arange(len(rows))
+
+    def _string_ratios(self, row_codes, col_codes):
+        ratios = np.empty((len(row_codes), len(col_codes)), dtype=np.float64)
+        for a, code_a in enumerate(row_codes):
+            for b, code_b in enumerate(col_codes):
+                key = (code_a, code_b)
+                ratio = self._ratios.get(key)
+                if ratio is None:
+                    ratio = 1.0 if code_a == code_b else compare_strings(self.strings[code_a], self.strings[code_b])
+                    self._ratios[key] = ratio
+                ratios[a, b] = ratio
+        return ratios
+
+    def _list_block(self, matrix_rows, matrix_cols):
+        """Mean of per-element compare_numbers between every row and column list, chunked to bound memory."""
+        length = matrix_rows.shape[1]
+        result = np.empty((matrix_rows.shape[0], matrix_cols.shape[0]), dtype=np.float64)
+        if length == 0:
+            result[:] = 0  # compare_landmarks divides by zero here; treat as no similarity
+            return result
+        cols_per_chunk = max(1, MAX_BLOCK_ELEMENTS // max(1, matrix_rows.shape[0] * length))
+        for start in range(0, matrix_cols.shape[0], cols_per_chunk):
+            chunk = matrix_cols[start:start + cols_per_chunk]
+            diff = np.abs(matrix_rows[:, None, :] - chunk[None, :, :]) / NUMBER_TOLERANCE
+            result[:, start:start + chunk.shape[0]] = (1 - np.minimum(diff, 1)).mean(axis=2)
+        return result
+
+    def similarity_block(self, rows):
+        """Similarity of profiles `rows` against every profile for this feature; matches compare_feature."""
+        rows = np.asarray(rows)
+        kinds_r = self.kinds[rows]
+        kinds_c = self.kinds
+        block = np.zeros((len(rows), len(self.kinds)), dtype=np.float64)
+        handled = np.zeros(block.shape, dtype=bool)
+
+        # Missing on either side contributes nothing
+        handled |= (kinds_r == KIND_MISSING)[:, None] | (kinds_c == KIND_MISSING)[None, :]
+
+        none_r = kinds_r == KIND_NONE
+        none_c = kinds_c == KIND_NONE
+        either_none = (none_r[:, None] | none_c[None, :]) & ~handled
+        block[either_none & none_r[:, None] & none_c[None, :]] = 1
+        handled |= either_none
+
+        for kind in (KIND_STR, KIND_NUMBER):
+            local_rows = np.flatnonzero(kinds_r == kind)
+            cols = np.flatnonzero(kinds_c == kind)
+            if not len(local_rows) or not len(cols):
+                continue
+            if kind == KIND_STR:
+                row_codes, row_inverse = np.unique(self.str_codes[rows[local_rows]], return_inverse=True)
+                col_codes, col_inverse = np.unique(self.str_codes[cols], return_inverse=True)
+                values = self._string_ratios(row_codes, col_codes)[row_inverse][:, col_inverse]
+            else:
+                diff = np.abs(self.numbers[rows[local_rows]][:, None] - self.numbers[cols][None, :]) / NUMBER_TOLERANCE
+                values = 1 - np.minimum(diff, 1)
+            block[np.ix_(local_rows, cols)] = values
+            handled[np.ix_(local_rows, cols)] = True
+
+        list_rows = kinds_r == KIND_LIST
+        # Lists of different lengths score 0, like compare_landmarks
+        handled |= list_rows[:, None] & (kinds_c == KIND_LIST)[None, :]
+        for length, matrix in self.list_groups.items():
+            local_rows = np.flatnonzero(list_rows & (self.list_length[rows] == length))
+            cols = np.flatnonzero(self.list_length == length)
+            if len(local_rows) and len(cols):
+                block[np.ix_(local_rows, cols)] = self._list_block(
+                    matrix[self.list_slot[rows[local_rows]]], matrix[self.list_slot[cols]])
+
+        # Whatever is left is a mixed-type pair; fall back to the scalar comparison
+        for local_row, col in zip(*np.nonzero(~handled)):
+            try:
+                block[local_row, col] = compare_feature(self.values[rows[local_row]], self.values[col])
+            except (TypeError, ValueError, ZeroDivisionError):
+                block[local_row, col] = 0
+        return block
+
+def extract_feature_columns(profiles):
+    """Extract every feature of every profile into columns, compiling the paths only once."""
+    columns = []
+    for feature, path, weight in COMPILED_FEATURES:
+        values = []
+        for profile in profiles:
+            try:
+                values.append(extract_feature(profile, path))
+            except (KeyError, IndexError, TypeError):
+                values.append(_MISSING)
+        columns.append(FeatureColumn(feature, weight, values))
+    return columns
+
+def iter_similarity_blocks(profiles, block_rows=MATRIX_BLOCK_ROWS, columns=None):
+    """Yield (row_start, block) pairs of the weighted similarity matrix (percent), block_rows rows at a time."""
+    columns = columns or extract_feature_columns(profiles)
+    count = len(profiles)
+    for start in range(0, count, block_rows):
+        rows = np.arange(start, min(start + block_rows, count))
+        block = np.zeros((len(rows), count), dtype=np.float64)
+        for column in columns:
+            block += column.weight * column.similarity_block(rows)
+        yield start, block / TOTAL_WEIGHT * 100
+
+def calculate_similarity_matrix(profiles, block_rows=MATRIX_BLOCK_ROWS):
+    """Full N x N weighted similarity matrix; entry [i, j] equals calculate_similarity(profiles[i], profiles[j])."""
+    matrix = np.empty((len(profiles), len(profiles)), dtype=np.float64)
+    for start, block in iter_similarity_blocks(profiles, block_rows):
+        matrix[start:start + block.shape[0]] = block
+    return matrix
+
+# Function to load every profile from a directory of JSON files or a .jsonl stream
+def load_profiles(source):
+    names, profiles = [], []
+    for name, profile in iter_named_profiles(source):
+        names.append(name)
+        profiles.append(profile)
+    return names, profiles
+
+def compare_all(source, output=None, top=10):
+    names, profiles = load_profiles(source)
+    start = time.perf_counter()
+    matrix = calculate_similarity_matrix(profiles)
+    print(f"Compared {len(profiles)} profiles ({len(profiles) ** 2} pairs) in {time.perf_counter() - start:.2f}s.")
+
+    if output:
+        np.save(output, matrix)
+        with open(f"{os.path.splitext(output)[0]}_names.json", 'w') as f:
+            json.dump(names, f)
+        print(f"Saved similarity matrix to {output}")
+
+    upper_rows, upper_cols = np.triu_indices(len(profiles), k=1)
+    order = np.argsort(-matrix[upper_rows, upper_cols])[:top]
+    for i in order:
+        row, col = upper_rows[i], upper_cols[i]
+        print(f"{names[row]} <-> {names[col]}: {matrix[row, col]:.5f}% similar")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two profiles, or every pair of profiles in a directory.")
+    parser.add_argument("profiles", nargs="*", help="Two profile JSON files to compare.")
+    parser.add_argument("--all", metavar="SOURCE",
+                        help="Compute the all-pairs similarity matrix for a profiles directory or a .jsonl stream.")
+    parser.add_argument("--output", help="With --all: save the matrix as .npy (names go to <output>_names.json).")
+    parser.add_argument("--top", type=int, default=10, help="With --all: number of most similar pairs to print.")
+    parser.add_argument("--quiet", action="store_true", help="Skip the per-feature debug output.")
+    args = parser.parse_args(argv)
 
-    return (similarity_sum / total_weight) * 100
+    if args.all:
+        compare_all(args.all, args.output, args.top)
+        return
 
-def main():
     # Paths to JSON files
-    bob_profile_path = "json_profiles/cat_png.json"
-    andy_profile_path = "json_profiles/andy_jpg.json"
+    bob_profile_path, andy_profile_path = args.profiles or ["json_profiles/cat_png.json", "json_profiles/andy_jpg.json"]
 
     # Load profiles
     bob_profile = load_profile(bob_profile_path)
     andy_profile = load_profile(andy_profile_path)
 
     # Calculate similarity
-    similarity_score = calculate_similarity(bob_profile, andy_profile)
-    print(f"Cat and Andy's profiles are {similarity_score:.5f}% similar.")
+    similarity_score = calculate_similarity(bob_profile, andy_profile, verbose=not args.quiet)
+    print(f"{os.path.basename(bob_profile_path)} and {os.path.basename(andy_profile_path)} are {similarity_score:.5f}% similar.")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
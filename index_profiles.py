@@ -0,0 +1,65 @@
+import argparse
+import os
+from compare_two_profiles import load_profile
+from utilities.embedding_index import (
+    EmbeddingIndex,
+    INDEX_DIR_NAME,
+    build_index_from_profiles,
+    build_index_from_stream,
+    profile_embedding
+)
+from utilities.profile_store import is_profile_stream, iter_stream_records, iter_profile_files, profile_name
+
+JSON_FILE_LOCATION = "json_profiles"
+
+def build(args):
+    index = EmbeddingIndex(args.index_dir)
+    if is_profile_stream(args.profiles_dir):
+        start_offset = index.stream_offsets.get(os.path.abspath(args.profiles_dir), 0)
+        records = iter_stream_records(args.profiles_dir, start_offset)
+        added = build_index_from_stream(index, records, args.profiles_dir, profile_name)
+    else:
+        added = build_index_from_profiles(index, iter_profile_files(args.profiles_dir),
+                                          lambda path: profile_embedding(load_profile(path)))
+    print(f"Indexed {added} new or changed profile(s); index now holds {len(index)} embeddings.")
+
+def query(args):
+    index = EmbeddingIndex(args.index_dir)
+    if args.id:
+        if args.id not in index:
+            print(f"Profile '{args.id}' is not in the index. Run 'build' first.")
+            return
+        embedding = index.embedding(args.id)
+        exclude = [args.id]
+    else:
+        embedding = profile_embedding(load_profile(args.profile))
+        exclude = []
+
+    for rank, (profile_id, score) in enumerate(index.query(embedding, k=args.k, exclude=exclude), start=1):
+        print(f"{rank:>3}. {profile_id}  cosine={score:.4f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query the profile embedding index.")
+    parser.add_argument("--profiles-dir", default=JSON_FILE_LOCATION,
+                        help="Directory of profile JSON files, or a .jsonl profile stream.")
+    parser.add_argument("--index-dir", default=None,
+                        help=f"Index location (default: {INDEX_DIR_NAME} inside the profiles directory or next to "
+                             f"the stream).")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("build", help="Add new or changed profiles to the index.")
+
+    query_parser = subparsers.add_parser("query", help="Find the nearest profiles by cosine similarity.")
+    target = query_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--profile", help="Path to a profile JSON to search with.")
+    target.add_argument("--id", help="ID of an indexed profile (its file name without .json).")
+    query_parser.add_argument("-k", type=int, default=5, help="Number of results.")
+
+    args = parser.parse_args(argv)
+    if args.index_dir is None:
+        base_dir = os.path.dirname(args.profiles_dir) if is_profile_stream(args.profiles_dir) else args.profiles_dir
+        args.index_dir = os.path.join(base_dir, INDEX_DIR_NAME)
+    {"build": build, "query": query}[args.command](args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import argparse
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+# Subcommand -> (module whose main() runs it, help); a module is only imported once its subcommand is chosen,
+# so e.g. `compare` never loads insightface, cv2 or the Ollama client
+COMMANDS = {
+    "analyze": ("analyze_image", "Generate profiles for the images (and videos) under IMAGES_DIR."),
+    "compare": ("compare_two_profiles", "Compare two profiles, or every pair of profiles in a directory."),
+    "index": ("index_profiles", "Build and query the profile embedding index."),
+    "daemon": ("analyze_daemon", "Run the resident analysis daemon with its watch folder and local API."),
+    "queue": ("queue_worker", "Enqueue images and run workers against the durable job queue."),
+    "bench": (None, "Benchmarks: pipeline (default), colors or startup."),
+}
+BENCHMARKS = {
+    "pipeline": "benchmark_pipeline",
+    "colors": "benchmark_dominant_color",
+    "startup": None,  # run by check_startup below, without importing anything heavy here
+}
+
+# Modules that must import quickly and without side effects; each is imported in a fresh interpreter
+STARTUP_MODULES = ("llava_cli", "analyze_image", "compare_two_profiles", "index_profiles", "analyze_daemon",
+                   "queue_worker", "utilities.standard_image_detection_utils")
+# Dependencies that may only load inside the subcommand (or function) that needs them
+HEAVY_MODULES = ("cv2", "PIL", "insightface", "onnxruntime", "sklearn", "scipy", "requests", "psutil")
+STARTUP_TARGET_SECONDS = 0.5  # median import time per module, interpreter startup excluded
+STARTUP_REPEATS = 5
+
+_IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "heavy": sorted(name for name in {heavy!r} if name in sys.modules)}}))
+"""
+
+# Function to time one import of a module in a fresh interpreter running from an empty working directory
+def probe_import(module, cwd):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, "-c", _IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                            cwd=cwd, env=env, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr.strip()}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+# Function to check every startup module against the import-time target; returns (report, failures)
+def check_startup(modules=STARTUP_MODULES, target=STARTUP_TARGET_SECONDS, repeats=STARTUP_REPEATS):
+    """Import each module repeats times and compare the median with target.
+
+    A module also fails if importing it loads one of HEAVY_MODULES or leaves anything behind in the
+    (empty) working directory it was imported from.
+    """
+    report = {"target_seconds": target, "repeats": repeats, "modules": {}}
+    failures = []
+    with tempfile.TemporaryDirectory(prefix="startup-") as cwd:
+        for module in modules:
+            probes = [probe_import(module, cwd) for _ in range(max(1, repeats))]
+            median = statistics.median(probe["seconds"] for probe in probes)
+            heavy = sorted({name for probe in probes for name in probe["heavy"]})
+            created = sorted(os.listdir(cwd))
+            report["modules"][module] = {"median_seconds": round(median, 4),
+                                         "max_seconds": round(max(probe["seconds"] for probe in probes), 4),
+                                         "heavy_imports": heavy, "created": created}
+            if median > target:
+                failures.append(f"{module}: median import {median:.3f}s exceeds the {target:.3f}s target")
+            if heavy:
+                failures.append(f"{module}: importing it loads {', '.join(heavy)}")
+            if created:
+                failures.append(f"{module}: importing it created {', '.join(created)}")
+    return report, failures
+
+def bench_startup(argv=None):
+    parser = argparse.ArgumentParser(prog="llava_cli.py bench startup",
+                                     description="Check module import times against the startup target.")
+    parser.add_argument("--target", type=float, default=STARTUP_TARGET_SECONDS,
+                        help="Maximum median import time per module, in seconds.")
+    parser.add_argument("--repeats", type=int, default=STARTUP_REPEATS, help="Fresh interpreters per module.")
+    parser.add_argument("--modules", nargs="+", default=list(STARTUP_MODULES))
+    parser.add_argument("--output", help="Optional path for the JSON report.")
+    args = parser.parse_args(argv)
+
+    report, failures = check_startup(args.modules, args.target, args.repeats)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if failures:
+        print("Startup check failed:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print(f"All {len(args.modules)} module(s) import within {args.target:.3f}s without heavy dependencies.")
+
+# Function to import a subcommand's module and hand it the remaining arguments
+def run_module(module_name, argv):
+    return importlib.import_module(module_name).main(argv)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Single entry point for the llava:13b profiling tools.",
+        epilog="\n".join(f"  {name:<8} {help_text}" for name, (_, help_text) in COMMANDS.items())
+               + "\n\nRun '<command> --help' for the options of a command.",
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=COMMANDS, metavar="command", help=", ".join(COMMANDS))
+    parser.add_argument("args", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.command != "bench":
+        return run_module(COMMANDS[args.command][0], args.args)
+    # `bench` without a benchmark name runs the pipeline benchmark, so its flags can follow directly
+    name = args.args[0] if args.args and args.args[0] in BENCHMARKS else "pipeline"
+    rest = args.args[1:] if args.args and args.args[0] == name else args.args
+    if name == "startup":
+        return bench_startup(rest)
+    return run_module(BENCHMARKS[name], rest)
+
+if __name__ == "__main__":
+    main()
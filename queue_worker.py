@@ -0,0 +1,148 @@
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+import analyze_image
+from utilities.face_engine import warm_up_face_engine
+from utilities.image_utils import is_zoomed_out_copy
+from utilities.job_queue import JobQueue, DEFAULT_QUEUE_PATH, DEFAULT_LEASE_SECONDS, DEFAULT_MAX_ATTEMPTS, STATUS_QUEUED, STATUS_LEASED
+from utilities.ollama_client import OllamaClient, set_default_client, DEFAULT_ROUTING
+from utilities.ollama_router import ROUTING_STRATEGIES
+from utilities.ollama_utils import install_and_setup_ollama, preload_model
+from utilities.scanner import iter_files
+
+POLL_INTERVAL = 2.0  # seconds an idle worker waits before asking the queue again
+ENQUEUE_BATCH = 1000  # paths inserted per queue transaction while a large tree is being scanned
+
+# Function to lazily yield the images to enqueue: files as given, directories by the images anywhere below them
+def collect_images(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            yield from iter_files(path, exclude=is_zoomed_out_copy)
+        else:
+            yield path
+
+@contextlib.contextmanager
+def keep_lease(queue, job, worker_id):
+    """Renew the job's lease from a background thread while the block runs."""
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(queue.lease_seconds / 3):
+            if not queue.heartbeat(job.id, worker_id):
+                print(f"Worker {worker_id} lost the lease on job {job.id} ({job.image_path}).")
+                return
+
+    thread = threading.Thread(target=renew, name=f"lease-{job.id}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+# Function to claim and process jobs until the queue is drained (or forever, when exit_when_empty is off)
+def run_worker(queue, worker_id, manifest=None, exit_when_empty=True, poll_interval=POLL_INTERVAL):
+    processed = 0
+    while True:
+        jobs = queue.claim(worker_id)
+        if not jobs:
+            stats = queue.stats()
+            # Retries waiting out their backoff and other workers' leases may still come back to the queue
+            if exit_when_empty and not stats[STATUS_QUEUED] and not stats[STATUS_LEASED]:
+                return processed
+            time.sleep(poll_interval)
+            continue
+
+        job = jobs[0]
+        start = time.perf_counter()
+        try:
+            with keep_lease(queue, job, worker_id):
+                output = analyze_image.process_image(job.image_path, manifest=manifest)
+        except Exception as e:
+            status = queue.fail(job.id, worker_id, e)
+            print(f"Job {job.id} failed (attempt {job.attempts}, now {status}): {job.image_path}: {e}")
+            continue
+        queue.complete(job.id, worker_id, output)
+        processed += 1
+        print(f"Worker {worker_id} finished job {job.id} in {time.perf_counter() - start:.2f}s: {job.image_path}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Durable job queue for profiling a large image backlog with many workers.")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="SQLite queue file shared by every worker.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="Add images (files or directories) to the queue.")
+    enqueue.add_argument("paths", nargs="*", default=[analyze_image.IMAGES_DIR])
+    enqueue.add_argument("--requeue", action="store_true", help="Also reset images that are done or dead.")
+
+    work = commands.add_parser("work", help="Claim and process queued images.")
+    work.add_argument("--endpoints", help="Ollama servers as host:port[=weight],... (default: OLLAMA_HOSTS or OLLAMA_HOST).")
+    work.add_argument("--routing", choices=ROUTING_STRATEGIES, default=DEFAULT_ROUTING)
+    work.add_argument("--threads", type=int, default=1, help="Jobs processed concurrently by this process.")
+    work.add_argument("--lease", type=float, default=DEFAULT_LEASE_SECONDS, help="Seconds a claimed job stays leased.")
+    work.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                      help="Attempts before a job is dead-lettered.")
+    work.add_argument("--forever", action="store_true", help="Keep polling for new jobs instead of exiting when drained.")
+    work.add_argument("--full", action="store_true", help="Ignore the manifest and re-process every image.")
+    work.add_argument("--query-mode", choices=["batched", "sequential", "session"], default=analyze_image.QUERY_MODE)
+    work.add_argument("--multi-face", action="store_true", default=analyze_image.MULTI_FACE_MODE)
+
+    commands.add_parser("status", help="Show job counts and the most recent dead letters.")
+    commands.add_parser("requeue-dead", help="Give dead-lettered jobs a fresh set of attempts.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "enqueue":
+        queue = JobQueue(args.queue)
+        image_paths = collect_images(args.paths)
+        added = total = 0
+        while True:
+            batch = list(itertools.islice(image_paths, ENQUEUE_BATCH))
+            if not batch:
+                break
+            added += queue.enqueue(batch, requeue=args.requeue)
+            total += len(batch)
+        print(f"Enqueued {added} of {total} image(s).")
+        print(json.dumps(queue.stats()))
+        return
+    if args.command == "status":
+        queue = JobQueue(args.queue)
+        print(json.dumps({"jobs": queue.stats(), "dead_letters": queue.dead_letters(10)}, indent=2))
+        return
+    if args.command == "requeue-dead":
+        print(f"Requeued {JobQueue(args.queue).requeue_dead()} dead job(s).")
+        return
+
+    analyze_image.QUERY_MODE = args.query_mode
+    analyze_image.MULTI_FACE_MODE = args.multi_face
+    client = set_default_client(OllamaClient(args.endpoints, routing=args.routing))
+    if len(client.endpoints) == 1:
+        if not install_and_setup_ollama(analyze_image.MODEL_NAME):
+            print("Ollama service failed to start. Exiting.")
+            return
+    else:
+        print(f"Routing ({args.routing}) across: {json.dumps(client.router.check_health())}")
+    preload_model(analyze_image.MODEL_NAME)
+    warm_up_face_engine()
+
+    queue = JobQueue(args.queue, lease_seconds=args.lease, max_attempts=args.max_attempts)
+    manifest = analyze_image.get_manifest() if analyze_image.INCREMENTAL_MODE and not args.full else None
+    worker_prefix = f"{socket.gethostname()}-{os.getpid()}"
+    threads = [threading.Thread(target=run_worker, args=(queue, f"{worker_prefix}-{i}", manifest, not args.forever),
+                                name=f"queue-worker-{i}") for i in range(max(1, args.threads))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    print(f"Queue: {json.dumps(queue.stats())}")
+    print(f"Endpoints: {json.dumps(client.stats(), indent=2)}")
+
+if __name__ == "__main__":
+    main()
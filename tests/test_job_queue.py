@@ -0,0 +1,65 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import pytest
+
+import analyze_image
+import queue_worker
+from utilities import face_engine, ollama_client
+from utilities.job_queue import JobQueue, STATUS_DEAD
+from utilities.ollama_client import OllamaClient
+from utilities.synthetic_faces import SyntheticFaceEngine, make_synthetic_face
+
+class _FailingHandler(BaseHTTPRequestHandler):
+    """Answers every Ollama call with HTTP 500, like a server whose model runner crashed."""
+
+    def _fail(self):
+        body = b'{"error": "model runner has unexpectedly stopped"}'
+        self.send_response(500)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _fail
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def failing_endpoints():
+    servers = [ThreadingHTTPServer(("127.0.0.1", 0), _FailingHandler) for _ in range(2)]
+    threads = [threading.Thread(target=server.serve_forever, daemon=True) for server in servers]
+    for thread in threads:
+        thread.start()
+    yield [f"http://127.0.0.1:{server.server_address[1]}" for server in servers]
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def test_job_is_dead_lettered_with_the_endpoint_error(tmp_path, monkeypatch, failing_endpoints):
+    image_path = str(tmp_path / "face.jpg")
+    cv2.imwrite(image_path, make_synthetic_face(0))
+    client = OllamaClient(",".join(failing_endpoints), retries=1, backoff=0.01, health_interval=0)
+    monkeypatch.setattr(ollama_client, "_DEFAULT_CLIENT", client)
+    monkeypatch.setattr(face_engine, "_ENGINE", SyntheticFaceEngine())
+    monkeypatch.setattr(analyze_image, "JSON_FILE_LOCATION", str(tmp_path / "profiles"))
+    monkeypatch.setattr(analyze_image, "USE_RESPONSE_CACHE", False)
+    monkeypatch.setattr(analyze_image, "QUERY_MODE", "batched")
+
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"), max_attempts=2, retry_delay=0)
+    queue.enqueue([image_path])
+    try:
+        assert queue_worker.run_worker(queue, "test-worker", poll_interval=0.01) == 0
+        stats = queue.stats()
+        dead = queue.dead_letters()
+    finally:
+        queue.close()
+        client.close()
+
+    assert stats[STATUS_DEAD] == 1
+    assert dead[0]["image_path"] == image_path
+    assert dead[0]["attempts"] == 2
+    assert "HTTP 500" in dead[0]["last_error"]
+    assert "model runner has unexpectedly stopped" in dead[0]["last_error"]
@@ -0,0 +1,31 @@
+import json
+import os
+import subprocess
+import sys
+
+from llava_cli import REPO_DIR, STARTUP_MODULES, STARTUP_TARGET_SECONDS
+
+def run_python(code, cwd):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")])))
+    result = subprocess.run([sys.executable, "-c", code], cwd=cwd, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+def test_entry_modules_meet_the_startup_target(tmp_path):
+    # A fresh interpreter, so nothing this test session already imported hides a slow or heavy import
+    output = run_python("import json, llava_cli\n"
+                        "report, failures = llava_cli.check_startup()\n"
+                        "print(json.dumps({'report': report, 'failures': failures}))", tmp_path)
+    result = json.loads(output.strip().splitlines()[-1])
+
+    assert result["failures"] == []
+    assert set(result["report"]["modules"]) == set(STARTUP_MODULES)
+    for module, timing in result["report"]["modules"].items():
+        assert timing["median_seconds"] <= STARTUP_TARGET_SECONDS, module
+        assert timing["heavy_imports"] == [], module
+
+def test_imports_have_no_filesystem_side_effects(tmp_path):
+    run_python("import analyze_image\nimport utilities.standard_image_detection_utils", tmp_path)
+
+    assert not (tmp_path / "json_maps").exists()
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,104 @@
+import json
+
+CERTAINTY_MIN = 1
+CERTAINTY_MAX = 100
+
+BATCHED_PROMPT_HEADER = (
+    "Answer every question below about the person in this image. "
+    "Reply with a single JSON object and nothing else. Use the question keys as the JSON keys; "
+    "each value must be an object with an \"answer\" string that follows the question's instructions "
+    "and a \"certainty\" integer from 1 to 100 saying how certain you are about that answer."
+)
+
+# Function to build the JSON schema the whole reply must follow
+def build_response_schema(keys):
+    field_schema = {
+        "type": "object",
+        "properties": {
+            "answer": {"type": "string"},
+            "certainty": {"type": "integer", "minimum": CERTAINTY_MIN, "maximum": CERTAINTY_MAX},
+        },
+        "required": ["answer", "certainty"],
+    }
+    return {
+        "type": "object",
+        "properties": {key: field_schema for key in keys},
+        "required": list(keys),
+    }
+
+# Function to build one prompt that asks every attribute question at once
+def build_batched_prompt(instructions):
+    lines = [BATCHED_PROMPT_HEADER, ""]
+    for key, instruction in instructions.items():
+        lines.append(f'"{key}": {instruction}')
+    return "\n".join(lines)
+
+def validate_field(value):
+    """Validate one field of the reply against the schema and return (answer, certainty)."""
+    if not isinstance(value, dict):
+        raise ValueError(f"expected an object, got {type(value).__name__}")
+
+    answer = value.get("answer")
+    if isinstance(answer, (int, float)) and not isinstance(answer, bool):
+        answer = str(answer)
+    if not isinstance(answer, str) or not answer.strip():
+        raise ValueError("missing or empty 'answer'")
+
+    certainty = value.get("certainty")
+    try:
+        certainty = int(round(float(certainty)))
+    except (TypeError, ValueError):
+        raise ValueError(f"'certainty' is not a number: {certainty!r}")
+    if not CERTAINTY_MIN <= certainty <= CERTAINTY_MAX:
+        raise ValueError(f"'certainty' {certainty} is outside {CERTAINTY_MIN}-{CERTAINTY_MAX}")
+
+    return answer.strip(), certainty
+
+def parse_batched_response(text, keys):
+    """Parse the model's JSON reply; returns (answers, certainties, errors) with errors keyed by failed field."""
+    answers, certainties, errors = {}, {}, {}
+    try:
+        data = json.loads(text) if text else None
+    except json.JSONDecodeError as e:
+        data = None
+        reason = f"reply is not valid JSON: {e}"
+    else:
+        reason = "reply is not a JSON object"
+
+    if not isinstance(data, dict):
+        return answers, certainties, {key: reason for key in keys}
+
+    for key in keys:
+        if key not in data:
+            errors[key] = "field missing from reply"
+            continue
+        try:
+            answers[key], certainties[key] = validate_field(data[key])
+        except ValueError as e:
+            errors[key] = str(e)
+    return answers, certainties, errors
+
+def query_attributes_batched(instructions, ask_json, retries=1):
+    """Ask every attribute and its certainty in one structured call, re-asking only the fields that fail validation.
+
+    ask_json(prompt, schema) must return the raw JSON text from the model (or None).
+    Returns (answers, certainties, errors); fields still failing after the retries are left in errors.
+    """
+    keys = list(instructions)
+    answers, certainties, errors = parse_batched_response(
+        ask_json(build_batched_prompt(instructions), build_response_schema(keys)), keys)
+
+    for attempt in range(retries):
+        if not errors:
+            break
+        failed = {key: instructions[key] for key in errors}
+        print(f"Retrying {len(failed)} field(s) that failed validation: {', '.join(failed)}")
+        errors = {}
+        for key, instruction in failed.items():
+            field_answers, field_certainties, field_errors = parse_batched_response(
+                ask_json(build_batched_prompt({key: instruction}), build_response_schema([key])), [key])
+            answers.update(field_answers)
+            certainties.update(field_certainties)
+            errors.update(field_errors)
+
+    return answers, certainties, errors
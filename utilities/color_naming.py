@@ -0,0 +1,90 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from utilities.named_color_table import NAMED_COLORS
+
+COLOR_NAME_CACHE_SIZE = 4096
+
+_TABLE_NAMES = None
+_TABLE_LAB = None
+
+# LRU memo of hex value -> name shared by the single and batch lookups
+_MEMO = OrderedDict()
+_MEMO_STATS = {"hits": 0, "misses": 0}
+_MEMO_LOCK = threading.Lock()
+
+# Function to convert "#rrggbb" strings to an (N, 3) uint8 RGB array
+def hex_to_rgb_array(hex_colors):
+    values = [int(h.lstrip('#'), 16) for h in hex_colors]
+    packed = np.asarray(values, dtype=np.uint32).reshape(-1)
+    return np.stack([(packed >> 16) & 0xff, (packed >> 8) & 0xff, packed & 0xff], axis=1).astype(np.uint8)
+
+# Function to convert sRGB (0-255) to CIELAB (D65), vectorized over the first axis
+def rgb_to_lab(rgb):
+    rgb = np.asarray(rgb, dtype=np.float64) / 255.0
+    linear = np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92)
+    matrix = np.array([[0.4124564, 0.3575761, 0.1804375],
+                       [0.2126729, 0.7151522, 0.0721750],
+                       [0.0193339, 0.1191920, 0.9503041]])
+    xyz = linear @ matrix.T
+    xyz /= np.array([0.95047, 1.0, 1.08883])
+
+    epsilon = 216 / 24389
+    kappa = 24389 / 27
+    f = np.where(xyz > epsilon, np.cbrt(xyz), (kappa * xyz + 16) / 116)
+    l = 116 * f[:, 1] - 16
+    a = 500 * (f[:, 0] - f[:, 1])
+    b = 200 * (f[:, 1] - f[:, 2])
+    return np.stack([l, a, b], axis=1)
+
+def _load_table():
+    """Convert the bundled named-color table to CIELAB once per process."""
+    global _TABLE_NAMES, _TABLE_LAB
+    if _TABLE_LAB is None:
+        _TABLE_NAMES = [name for name, _ in NAMED_COLORS]
+        _TABLE_LAB = rgb_to_lab(hex_to_rgb_array([hex_value for _, hex_value in NAMED_COLORS]))
+    return _TABLE_NAMES, _TABLE_LAB
+
+def _nearest_names(hex_colors):
+    """Vectorized nearest-neighbour search (CIE76 distance) against the named-color table."""
+    names, table_lab = _load_table()
+    query_lab = rgb_to_lab(hex_to_rgb_array(hex_colors))
+    distances = ((query_lab[:, None, :] - table_lab[None, :, :]) ** 2).sum(axis=2)
+    return [names[i] for i in distances.argmin(axis=1)]
+
+def get_color_name(hex_color):
+    """Return the closest bundled color name for a "#rrggbb" value without any network access."""
+    return get_color_names([hex_color])[0]
+
+def get_color_names(hex_colors):
+    """Name several hex colors (e.g. every region of one image) in a single vectorized lookup."""
+    keys = [h.lower() if h else None for h in hex_colors]
+    with _MEMO_LOCK:
+        names = {}
+        missing = []
+        for key in keys:
+            if key is None or key in names or key in missing:
+                continue
+            if key in _MEMO:
+                _MEMO.move_to_end(key)
+                names[key] = _MEMO[key]
+                _MEMO_STATS["hits"] += 1
+            else:
+                missing.append(key)
+                _MEMO_STATS["misses"] += 1
+
+    if missing:
+        resolved = dict(zip(missing, _nearest_names(missing)))
+        names.update(resolved)
+        with _MEMO_LOCK:
+            for key, name in resolved.items():
+                _MEMO[key] = name
+                if len(_MEMO) > COLOR_NAME_CACHE_SIZE:
+                    _MEMO.popitem(last=False)
+    return ["unknown" if key is None else names[key] for key in keys]
+
+def color_name_cache_info():
+    """Return hit/miss counters and the current size of the color-name memo."""
+    with _MEMO_LOCK:
+        return {"hits": _MEMO_STATS["hits"], "misses": _MEMO_STATS["misses"], "size": len(_MEMO),
+                "maxsize": COLOR_NAME_CACHE_SIZE}
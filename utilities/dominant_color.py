@@ -0,0 +1,89 @@
+import numpy as np
+from collections import Counter
+
+REGION_SIZE = (50, 25)  # (width, height) every region is resized to before clustering
+HISTOGRAM_BITS = 4  # 16 levels per channel -> 4096 color bins
+KMEANS_CLUSTERS = 3
+KMEANS_ITERATIONS = 10
+KMEANS_SEED = 0
+
+BACKENDS = ("histogram", "kmeans_numpy", "sklearn")
+
+# Function to format a BGR color as an RGB hex string (truncating like the original KMeans path)
+def bgr_to_hex(color):
+    return '#%02x%02x%02x' % (int(color[2]), int(color[1]), int(color[0]))
+
+def _stack_regions(regions):
+    """Resize every non-empty region to REGION_SIZE and stack them into an (R, P, 3) uint8 array."""
+    import cv2
+
+    valid = [i for i, region in enumerate(regions) if region is not None and region.size > 0]
+    if not valid:
+        return valid, np.empty((0, REGION_SIZE[0] * REGION_SIZE[1], 3), dtype=np.uint8)
+    pixels = np.stack([cv2.resize(regions[i], REGION_SIZE).reshape(-1, 3) for i in valid])
+    return valid, pixels
+
+def dominant_colors_histogram(pixels, bits=HISTOGRAM_BITS):
+    """Mode of a quantized color histogram per region; returns the mean BGR color of the winning bin."""
+    regions, _, _ = pixels.shape
+    nbins = 1 << (3 * bits)
+    quantized = (pixels >> (8 - bits)).astype(np.int64)
+    bins = (quantized[..., 0] << (2 * bits)) | (quantized[..., 1] << bits) | quantized[..., 2]
+
+    # One bincount for all regions: offset each region's bins into its own block
+    offsets = np.arange(regions, dtype=np.int64)[:, None] * nbins
+    counts = np.bincount((bins + offsets).ravel(), minlength=regions * nbins).reshape(regions, nbins)
+    mask = bins == counts.argmax(axis=1)[:, None]
+
+    sums = (pixels.astype(np.float64) * mask[..., None]).sum(axis=1)
+    return sums / mask.sum(axis=1)[:, None]
+
+def dominant_colors_kmeans(pixels, k=KMEANS_CLUSTERS, iterations=KMEANS_ITERATIONS, seed=KMEANS_SEED):
+    """Fixed-iteration, fixed-seed k-means run on every region at once; returns the largest cluster's BGR center."""
+    data = pixels.astype(np.float32)
+    regions, points, _ = data.shape
+    rng = np.random.default_rng(seed)
+    centers = data[:, rng.choice(points, size=k, replace=False), :]
+    cluster_ids = np.arange(k)
+
+    for _ in range(iterations):
+        distances = ((data[:, :, None, :] - centers[:, None, :, :]) ** 2).sum(axis=3)
+        onehot = (distances.argmin(axis=2)[..., None] == cluster_ids).astype(np.float32)
+        counts = onehot.sum(axis=1)
+        sums = np.einsum('rpk,rpc->rkc', onehot, data)
+        # Empty clusters keep their previous center
+        centers = np.where(counts[..., None] > 0, sums / np.maximum(counts, 1)[..., None], centers)
+
+    distances = ((data[:, :, None, :] - centers[:, None, :, :]) ** 2).sum(axis=3)
+    counts = (distances.argmin(axis=2)[..., None] == cluster_ids).sum(axis=1)
+    return centers[np.arange(regions), counts.argmax(axis=1)]
+
+def dominant_color_sklearn(region_pixels):
+    """Original per-region scikit-learn KMeans path, seeded so repeated runs agree."""
+    from sklearn.cluster import KMeans
+
+    kmeans = KMeans(n_clusters=KMEANS_CLUSTERS, random_state=KMEANS_SEED)
+    labels = kmeans.fit_predict(region_pixels)
+    label_counts = Counter(labels)
+    return kmeans.cluster_centers_[label_counts.most_common(1)[0][0]]
+
+def detect_hex_colors(regions, backend="histogram"):
+    """Return the dominant color of every region as "#rrggbb"; empty regions fall back to black."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown dominant color backend '{backend}'. Expected one of {BACKENDS}.")
+
+    results = ['#000000'] * len(regions)
+    valid, pixels = _stack_regions(regions)
+    if not valid:
+        return results
+
+    if backend == "histogram":
+        colors = dominant_colors_histogram(pixels)
+    elif backend == "kmeans_numpy":
+        colors = dominant_colors_kmeans(pixels)
+    else:
+        colors = [dominant_color_sklearn(region_pixels) for region_pixels in pixels]
+
+    for i, color in zip(valid, colors):
+        results[i] = bgr_to_hex(color)
+    return results
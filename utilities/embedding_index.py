@@ -0,0 +1,245 @@
+import json
+import os
+import numpy as np
+
+INDEX_DIR_NAME = ".embedding_index"
+EMBEDDINGS_FILE = "embeddings.f32"
+IDS_FILE = "ids.jsonl"
+META_FILE = "meta.json"
+INITIAL_CAPACITY = 1024
+QUERY_BLOCK_ROWS = 65536  # rows scored per matmul, keeps query memory flat for large indexes
+
+# Function to pull the reference embedding out of a profile dict
+def profile_embedding(profile):
+    return profile["reference_images"][0]["embedding"]
+
+class EmbeddingIndex:
+    """Normalized float32 embeddings in a memory-mapped matrix, with an append-only ID map."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.dim = None
+        self.count = 0
+        self.capacity = 0
+        self.ids = []
+        self.id_to_row = {}
+        self.sources = {}  # profile id -> mtime_ns of the file it was indexed from
+        self.stream_offsets = {}  # JSONL stream path -> byte offset already indexed
+        self._dead_rows = set()  # rows of removed profiles (or lost id records), never returned by query
+        self._matrix = None
+        self._pending_ids = []
+
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            self.dim, self.count, self.capacity = meta["dim"], meta["count"], meta["capacity"]
+            self.stream_offsets = meta.get("stream_offsets", {})
+            self._load_ids()
+
+    def _load_ids(self):
+        """Rebuild the row -> id map from ids.jsonl; the last record written for a row wins.
+
+        A record with "removed" set is a tombstone: its row stays allocated but holds no profile.
+        """
+        ids_path = os.path.join(self.directory, IDS_FILE)
+        if not os.path.exists(ids_path):
+            return
+        committed = []
+        uncommitted = False
+        row_records = {}
+        with open(ids_path, 'r') as f:
+            for line in f:
+                record = json.loads(line)
+                if record["row"] >= self.count:
+                    # Appended after the last saved meta (crash mid-save); its row will be handed out again
+                    uncommitted = True
+                    continue
+                committed.append(line)
+                row_records[record["row"]] = record
+        if uncommitted:
+            # Drop the uncommitted tail now, or a later reload would see it next to the record reusing its row
+            with open(ids_path + ".tmp", 'w') as f:
+                f.writelines(committed)
+            os.replace(ids_path + ".tmp", ids_path)
+
+        self.ids = [None] * self.count
+        for row, record in row_records.items():
+            if record.get("removed"):
+                continue
+            self.ids[row] = record["id"]
+            self.id_to_row[record["id"]] = row
+            self.sources[record["id"]] = record.get("mtime_ns")
+        # An id whose row was later taken over by another id keeps no stale entry
+        for profile_id, row in list(self.id_to_row.items()):
+            if self.ids[row] != profile_id:
+                del self.id_to_row[profile_id]
+                self.sources.pop(profile_id, None)
+        self._dead_rows = {row for row, profile_id in enumerate(self.ids) if profile_id is None}
+
+    @property
+    def _path(self):
+        return os.path.join(self.directory, EMBEDDINGS_FILE)
+
+    def _open_matrix(self):
+        if self._matrix is None and self.capacity:
+            self._matrix = np.memmap(self._path, dtype=np.float32, mode='r+', shape=(self.capacity, self.dim))
+        return self._matrix
+
+    def _ensure_capacity(self, rows):
+        if rows <= self.capacity:
+            return
+        new_capacity = max(INITIAL_CAPACITY, self.capacity)
+        while new_capacity < rows:
+            new_capacity *= 2
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        with open(self._path, 'ab') as f:
+            f.truncate(new_capacity * self.dim * 4)
+        self.capacity = new_capacity
+
+    def __len__(self):
+        return self.count - len(self._dead_rows)
+
+    def __contains__(self, profile_id):
+        return profile_id in self.id_to_row
+
+    def embedding(self, profile_id):
+        """Return the stored (normalized) embedding of a profile."""
+        return self._open_matrix()[self.id_to_row[profile_id]]
+
+    def add(self, profile_id, embedding, mtime_ns=None):
+        """Add or replace one embedding; returns its row."""
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        if self.dim is None:
+            self.dim = vector.shape[0]
+        if vector.shape[0] != self.dim:
+            raise ValueError(f"Embedding for {profile_id} has {vector.shape[0]} dims, index expects {self.dim}.")
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+
+        row = self.id_to_row.get(profile_id)
+        if row is None:
+            row = self.count
+            self._ensure_capacity(row + 1)
+            self.ids.append(profile_id)
+            self.count += 1
+        self._open_matrix()[row] = vector
+        self.id_to_row[profile_id] = row
+        self.sources[profile_id] = mtime_ns
+        self._pending_ids.append({"id": profile_id, "row": row, "mtime_ns": mtime_ns})
+        return row
+
+    def remove(self, profile_id):
+        """Drop a profile from the index; returns False if it was not indexed.
+
+        Its row is not reused: a tombstone record in ids.jsonl keeps it empty across reloads.
+        """
+        row = self.id_to_row.pop(profile_id, None)
+        if row is None:
+            return False
+        self.ids[row] = None
+        self._dead_rows.add(row)
+        self.sources.pop(profile_id, None)
+        self._pending_ids.append({"id": profile_id, "row": row, "removed": True})
+        return True
+
+    def save(self):
+        """Flush the matrix and write the metadata that marks the new rows as complete."""
+        if self._matrix is not None:
+            self._matrix.flush()
+        if self._pending_ids:
+            with open(os.path.join(self.directory, IDS_FILE), 'a') as f:
+                f.writelines(json.dumps(record) + "\n" for record in self._pending_ids)
+            self._pending_ids = []
+        meta_path = os.path.join(self.directory, META_FILE)
+        with open(meta_path + ".tmp", 'w') as f:
+            json.dump({"dim": self.dim, "count": self.count, "capacity": self.capacity,
+                       "stream_offsets": self.stream_offsets}, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def query(self, embedding, k=5, exclude=()):
+        """Return the top-k (profile_id, cosine_similarity) pairs for an embedding."""
+        if not self.count:
+            return []
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector = vector / norm
+
+        matrix = self._open_matrix()
+        excluded_rows = {self.id_to_row[i] for i in exclude if i in self.id_to_row}
+        skipped_rows = np.array(sorted(excluded_rows | self._dead_rows), dtype=np.int64)
+        wanted = k
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, self.count, QUERY_BLOCK_ROWS):
+            end = min(start + QUERY_BLOCK_ROWS, self.count)
+            scores = matrix[start:end] @ vector
+            # Excluded and removed rows are masked before the partition, so the top k are all live rows
+            in_block = skipped_rows[(skipped_rows >= start) & (skipped_rows < end)]
+            scores[in_block - start] = -np.inf
+            top = np.argpartition(-scores, min(wanted, scores.shape[0]) - 1)[:wanted]
+            best_rows = np.concatenate([best_rows, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+            if best_rows.shape[0] > wanted:
+                keep = np.argpartition(-best_scores, wanted - 1)[:wanted]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+        results = []
+        for i in np.argsort(-best_scores):
+            if best_scores[i] == -np.inf:
+                break  # fewer than k live rows
+            results.append((self.ids[int(best_rows[i])], float(best_scores[i])))
+        return results
+
+def build_index_from_profiles(index, profiles, load_embedding):
+    """Add new or changed profiles to the index, and remove those whose file is gone.
+
+    profiles yields (profile_id, path) pairs; load_embedding(path) is only called for files whose
+    mtime differs from what the index recorded, so re-builds don't re-parse unchanged profiles.
+    Entries indexed without a source mtime are left alone.
+    """
+    added = 0
+    listed = set()
+    for profile_id, path in profiles:
+        listed.add(profile_id)
+        mtime_ns = os.stat(path).st_mtime_ns
+        if index.sources.get(profile_id) == mtime_ns:
+            continue
+        try:
+            embedding = load_embedding(path)
+        except (KeyError, IndexError, ValueError) as e:
+            print(f"Skipping {path}: no usable embedding ({e})")
+            continue
+        index.add(profile_id, embedding, mtime_ns=mtime_ns)
+        added += 1
+    removed = [profile_id for profile_id, mtime_ns in index.sources.items()
+               if mtime_ns is not None and profile_id not in listed]
+    for profile_id in removed:
+        index.remove(profile_id)
+    if removed:
+        print(f"Removed {len(removed)} profile(s) whose file no longer exists.")
+    index.save()
+    return added
+
+def build_index_from_stream(index, records, stream_path, name_for):
+    """Add the records of a JSONL profile stream that were appended since the last build.
+
+    records yields (next_offset, profile) pairs, normally read from the offset stored in index.stream_offsets;
+    later records for the same name replace earlier ones.
+    """
+    key = os.path.abspath(stream_path)
+    added = 0
+    for next_offset, profile in records:
+        try:
+            index.add(name_for(profile, f"record@{next_offset}"), profile_embedding(profile))
+            added += 1
+        except (KeyError, IndexError, ValueError) as e:
+            print(f"Skipping record ending at byte {next_offset} of {stream_path}: no usable embedding ({e})")
+        index.stream_offsets[key] = next_offset
+    index.save()
+    return added
@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+import numpy as np
+from utilities.image_utils import zoom_out_and_pad_array, to_original_coordinates
+
+DEFAULT_MODEL_PACK = "buffalo_l"
+DEFAULT_DET_SIZE = (640, 640)
+DEFAULT_DET_THRESH = 0.5
+DEFAULT_CTX_ID = 0  # 0 = first GPU, -1 = CPU only
+# Only load the models generate_face_profile actually reads (bbox/kps, 106 landmarks, embedding);
+# the default FaceAnalysis also loads genderage and the 3d landmark model on every start.
+DEFAULT_ALLOWED_MODULES = ["detection", "landmark_2d_106", "recognition"]
+
+_ENGINE = None
+_ENGINE_LOCK = threading.Lock()
+
+class FaceAnalysisEngine:
+    """Long-lived insightface detector that loads its ONNX models once per process."""
+
+    def __init__(self, model_pack=DEFAULT_MODEL_PACK, det_size=DEFAULT_DET_SIZE, det_thresh=DEFAULT_DET_THRESH,
+                 ctx_id=DEFAULT_CTX_ID, providers=None, intra_op_num_threads=None, inter_op_num_threads=None,
+                 allowed_modules=None):
+        self.model_pack = model_pack
+        self.det_size = tuple(det_size)
+        self.det_thresh = det_thresh
+        self.ctx_id = ctx_id
+        self.providers = providers
+        self.intra_op_num_threads = intra_op_num_threads
+        self.inter_op_num_threads = inter_op_num_threads
+        self.allowed_modules = list(allowed_modules or DEFAULT_ALLOWED_MODULES)
+        self.app = None
+        self.load_seconds = None
+        self.warmed_up = False
+        self._lock = threading.Lock()
+
+    def prepare(self):
+        """Load and prepare the ONNX models if that has not happened yet."""
+        if self.app is not None:
+            return self.app
+        with self._lock:
+            if self.app is None:
+                # insightface (and onnxruntime under it) only loads once a process actually needs the models
+                from insightface.app import FaceAnalysis
+
+                start = time.perf_counter()
+                kwargs = {}
+                if self.providers:
+                    kwargs["providers"] = list(self.providers)
+                app = FaceAnalysis(name=self.model_pack, allowed_modules=self.allowed_modules, **kwargs)
+                if self.intra_op_num_threads or self.inter_op_num_threads:
+                    self._apply_thread_settings(app)
+                app.prepare(ctx_id=self.ctx_id, det_thresh=self.det_thresh, det_size=self.det_size)
+                self.load_seconds = time.perf_counter() - start
+                print(f"Face analysis models loaded in {self.load_seconds:.2f}s (det_size={self.det_size}).")
+                self.app = app
+        return self.app
+
+    def _apply_thread_settings(self, app):
+        """Rebuild each model's onnxruntime session with the configured thread counts."""
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if self.intra_op_num_threads:
+            options.intra_op_num_threads = int(self.intra_op_num_threads)
+        if self.inter_op_num_threads:
+            options.inter_op_num_threads = int(self.inter_op_num_threads)
+        for model in app.models.values():
+            providers = model.session.get_providers()
+            model.session = onnxruntime.InferenceSession(model.model_file, sess_options=options, providers=providers)
+
+    def warm_up(self):
+        """Load the models and run one dummy inference so the first real image pays no cold-start cost."""
+        app = self.prepare()
+        if not self.warmed_up:
+            start = time.perf_counter()
+            dummy = np.zeros((self.det_size[1], self.det_size[0], 3), dtype=np.uint8)
+            app.get(dummy)
+            rec_model = app.models.get("recognition")
+            if rec_model is not None:
+                rec_model.get_feat([np.zeros((rec_model.input_size[1], rec_model.input_size[0], 3), dtype=np.uint8)])
+            self.warmed_up = True
+            print(f"Face analysis warm-up finished in {time.perf_counter() - start:.2f}s.")
+        return self
+
+    def get(self, img, max_num=0):
+        """Detect faces in a single BGR image."""
+        return self.prepare().get(img, max_num=max_num)
+
+    def get_with_zoom_out(self, img, pyramid=(), max_num=0):
+        """Detect faces, retrying on zoomed-out, padded copies of the array when nothing is found.
+
+        Every scale runs in this engine's session and nothing touches disk. Coordinates of faces found on a
+        zoomed-out copy are mapped back to the original image. Returns (faces, (zoom_factor, padding)), where
+        the scale is (1.0, 0) for a direct hit.
+        """
+        faces = self.get(img, max_num=max_num)
+        if faces:
+            return faces, (1.0, 0)
+
+        for zoom_factor, padding in pyramid:
+            faces = self.get(zoom_out_and_pad_array(img, zoom_factor, padding), max_num=max_num)
+            if not faces:
+                continue
+            for face in faces:
+                face.bbox = to_original_coordinates(face.bbox.reshape(2, 2), zoom_factor, padding).reshape(4)
+                for key in ("kps", "landmark_2d_106"):
+                    if face.get(key) is not None:
+                        face[key] = to_original_coordinates(face[key], zoom_factor, padding)
+            return faces, (zoom_factor, padding)
+        return [], None
+
+def engine_config_from_env():
+    """Read engine settings from FACE_ENGINE_* environment variables."""
+    config = {}
+    if os.environ.get("FACE_ENGINE_DET_SIZE"):
+        width, height = os.environ["FACE_ENGINE_DET_SIZE"].lower().split("x")
+        config["det_size"] = (int(width), int(height))
+    if os.environ.get("FACE_ENGINE_CTX_ID"):
+        config["ctx_id"] = int(os.environ["FACE_ENGINE_CTX_ID"])
+    if os.environ.get("FACE_ENGINE_PROVIDERS"):
+        config["providers"] = os.environ["FACE_ENGINE_PROVIDERS"].split(",")
+    if os.environ.get("FACE_ENGINE_THREADS"):
+        config["intra_op_num_threads"] = int(os.environ["FACE_ENGINE_THREADS"])
+    return config
+
+def get_face_engine(**config):
+    """Return the process-wide FaceAnalysisEngine, creating it on first use."""
+    global _ENGINE
+    if _ENGINE is None:
+        with _ENGINE_LOCK:
+            if _ENGINE is None:
+                settings = engine_config_from_env()
+                settings.update(config)
+                _ENGINE = FaceAnalysisEngine(**settings)
+    return _ENGINE
+
+def set_face_engine(engine):
+    """Replace the process-wide engine (e.g. with a synthetic one for offline benchmarks)."""
+    global _ENGINE
+    with _ENGINE_LOCK:
+        _ENGINE = engine
+    return engine
+
+def warm_up_face_engine(**config):
+    """Create the process-wide engine if needed and warm it up."""
+    return get_face_engine(**config).warm_up()
@@ -0,0 +1,205 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_VERSION = "0.0.0-fake"
+DEFAULT_MODELS = ("llava:13b",)
+DEFAULT_CERTAINTY = 80
+CERTAINTY_PROMPT_MARKER = "On a scale of 1-100"
+FALLBACK_RESPONSE = "Unknown"
+
+# Canned answers per attribute key, used for schema-constrained (batched) replies and matched by key in prompts
+DEFAULT_ANSWERS = {
+    "description": "A person with short brown hair looking at the camera.",
+    "wearing_hat": "no",
+    "eye_color": "brown",
+    "hair_color": "brunette",
+    "facial_hair_color": "none",
+    "pose": "front",
+    "age_estimation": "35",
+    "gender": "male",
+    "skin_tone": "tan",
+    "wearing_glasses": "no",
+    "upper_body_visible": "yes",
+    "lower_body_visible": "no",
+}
+
+class FakeOllamaServer:
+    """Local stand-in for the Ollama REST API with configurable latency and canned responses.
+
+    Serves /api/chat, /api/generate, /api/tags, /api/version and /api/ps. Every chat/generate call sleeps for
+    latency (+/- jitter) seconds, so throughput can be measured without a GPU or a real model.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, responses=None, models=DEFAULT_MODELS,
+                 seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.responses = dict(responses or {})  # prompt substring -> canned reply
+        self.models = list(models)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._contexts = 0
+        self.httpd = ThreadingHTTPServer((host, port), _FakeOllamaHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "max_in_flight": self.max_in_flight}
+
+    def _simulate_work(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+        time.sleep(delay)
+        with self._lock:
+            self.in_flight -= 1
+        return delay
+
+    def _next_context(self):
+        with self._lock:
+            self._contexts += 1
+            return [self._contexts] * 8
+
+    def reply_for(self, prompt, format=None):
+        """Pick the canned reply for a prompt and an optional format (a JSON schema or "json")."""
+        if isinstance(format, dict):
+            keys = list((format.get("properties") or {}).keys())
+            return json.dumps({key: {"answer": DEFAULT_ANSWERS.get(key, FALLBACK_RESPONSE), "certainty": DEFAULT_CERTAINTY}
+                               for key in keys})
+        for marker, reply in self.responses.items():
+            if marker in prompt:
+                return reply
+        if CERTAINTY_PROMPT_MARKER in prompt:
+            return str(DEFAULT_CERTAINTY)
+        if format == "json":
+            return "{}"
+        return FALLBACK_RESPONSE
+
+    def timings(self, prompt, reply, delay):
+        """Ollama-style token counters and nanosecond durations for a reply."""
+        eval_count = max(1, len(reply.split()))
+        prompt_eval_count = max(1, len(prompt.split()))
+        total = int(delay * 1e9)
+        return {
+            "total_duration": total,
+            "load_duration": 0,
+            "prompt_eval_count": prompt_eval_count,
+            "prompt_eval_duration": total // 4,
+            "eval_count": eval_count,
+            "eval_duration": total - total // 4,
+        }
+
+class _FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body go out in separate writes; don't let delayed ACKs stall them
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        fake = self.server.fake
+        if self.path == "/api/version":
+            self._send_json({"version": FAKE_VERSION})
+        elif self.path == "/api/tags":
+            self._send_json({"models": [{"name": name, "model": name} for name in fake.models]})
+        elif self.path == "/api/ps":
+            self._send_json({"models": [{"name": name, "model": name, "size_vram": 0} for name in fake.models]})
+        else:
+            self._send_json({"error": f"unknown endpoint {self.path}"}, status=404)
+
+    def do_POST(self):
+        fake = self.server.fake
+        try:
+            request = self._read_json()
+        except ValueError:
+            self._send_json({"error": "invalid JSON body"}, status=400)
+            return
+        model = request.get("model")
+        if model not in fake.models:
+            self._send_json({"error": f"model '{model}' not found"}, status=404)
+            return
+
+        if self.path == "/api/chat":
+            prompt = "\n".join(message.get("content", "") for message in request.get("messages") or [])
+            reply = fake.reply_for(prompt, request.get("format"))
+            delay = fake._simulate_work()
+            self._send_json({"model": model, "message": {"role": "assistant", "content": reply}, "done": True,
+                             **fake.timings(prompt, reply, delay)})
+        elif self.path == "/api/generate":
+            prompt = request.get("prompt", "")
+            reply = fake.reply_for(prompt, request.get("format")) if prompt else ""
+            delay = fake._simulate_work() if prompt else 0.0
+            self._send_json({"model": model, "response": reply, "done": True, "context": fake._next_context(),
+                             **fake.timings(prompt, reply, delay)})
+        else:
+            self._send_json({"error": f"unknown endpoint {self.path}"}, status=404)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server for offline benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds per chat/generate request.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform +/- jitter on the latency, in seconds.")
+    parser.add_argument("--responses", help="JSON file mapping prompt substrings to canned replies.")
+    args = parser.parse_args()
+
+    responses = None
+    if args.responses:
+        with open(args.responses) as f:
+            responses = json.load(f)
+    server = FakeOllamaServer(args.host, args.port, args.latency, args.jitter, responses)
+    print(f"Fake Ollama server listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import io
+import os
+import time
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Longest side handed to detection and color extraction; larger photos are decoded at reduced size
+MAX_DECODE_SIDE = 1920
+# EXIF orientations that swap width and height
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+def peak_rss_bytes():
+    """High-water mark of this process's resident memory, or None where the platform doesn't report it."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+class LoadedImage:
+    """A decoded BGR buffer shared by every stage, with the mapping back to original-resolution coordinates."""
+
+    def __init__(self, path, array, original_size, data=None, decode_seconds=0.0):
+        self.path = path
+        self.array = array
+        self.original_size = original_size  # (width, height) after EXIF orientation
+        self.data = data  # encoded file bytes, kept so later stages never re-read the file
+        self.decode_seconds = decode_seconds
+        self.peak_rss_bytes = peak_rss_bytes()
+        self.scale = array.shape[1] / original_size[0] if original_size[0] else 1.0
+
+    @classmethod
+    def from_array(cls, array, source, data=None):
+        """Wrap an array that was decoded elsewhere (e.g. a video frame)."""
+        return cls(source, array, (array.shape[1], array.shape[0]), data=data)
+
+    def to_original(self, points):
+        """Map (x, y) points from buffer coordinates to the original image."""
+        return np.asarray(points, dtype=np.float32) / self.scale
+
+    def to_buffer(self, points):
+        """Map (x, y) points from original-image coordinates to the buffer."""
+        return np.asarray(points, dtype=np.float32) * self.scale
+
+    def stats(self):
+        return {
+            "original_size": list(self.original_size),
+            "decoded_size": [self.array.shape[1], self.array.shape[0]],
+            "scale": round(self.scale, 4),
+            "decode_ms": round(self.decode_seconds * 1000, 2),
+            "buffer_bytes": int(self.array.nbytes),
+            "peak_rss_bytes": self.peak_rss_bytes,
+        }
+
+def load_image(path, max_side=MAX_DECODE_SIDE):
+    """Decode an image once into a BGR array, using JPEG draft (DCT-scaled) decoding for oversized photos."""
+    from PIL import Image, ImageOps
+
+    start = time.perf_counter()
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    try:
+        img = Image.open(io.BytesIO(data))
+        width, height = img.size
+        orientation = img.getexif().get(0x0112, 1)
+        if orientation in TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+
+        longest = max(img.size)
+        if max_side and longest > max_side:
+            # For JPEGs this makes the decoder skip straight to a 1/2, 1/4 or 1/8 scale that is still >= the target
+            target = (max(1, img.size[0] * max_side // longest), max(1, img.size[1] * max_side // longest))
+            img.draft('RGB', target)
+        img = ImageOps.exif_transpose(img).convert('RGB')
+        if max_side and max(img.size) > max_side:
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+    except (OSError, SyntaxError) as e:
+        raise ValueError(f"Unable to load image at {path}: {e}")
+
+    array = np.ascontiguousarray(np.asarray(img)[:, :, ::-1])  # RGB -> BGR, the layout cv2/insightface expect
+    return LoadedImage(path, array, (width, height), data=data, decode_seconds=time.perf_counter() - start)
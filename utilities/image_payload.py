@@ -0,0 +1,149 @@
+import base64
+import os
+import threading
+from collections import OrderedDict
+from utilities.image_loader import LoadedImage, load_image, MAX_DECODE_SIDE
+from utilities.response_cache import image_content_hash
+
+# llava-1.6 tiles images into a grid of 336px crops up to 672px; anything larger is downscaled by the server anyway
+PAYLOAD_MAX_SIDE = 672
+PAYLOAD_JPEG_QUALITY = 90
+DEFAULT_PAYLOAD_DIR = os.path.join(".cache", "payloads")
+DEFAULT_MAX_MEMORY_BYTES = 64 * 2**20
+# Face crops are widened by this fraction of the box on every side so hair, ears and shoulders stay in view
+FACE_CROP_MARGIN = 0.5
+
+_PAYLOAD_CACHE = None
+_PAYLOAD_CACHE_LOCK = threading.Lock()
+
+# Function to resize a BGR buffer to the model's input side and JPEG-encode it
+def encode_payload(array, max_side=PAYLOAD_MAX_SIDE, quality=PAYLOAD_JPEG_QUALITY):
+    import cv2
+
+    height, width = array.shape[:2]
+    scale = max_side / max(height, width)
+    if scale < 1:
+        array = cv2.resize(array, (max(1, round(width * scale)), max(1, round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".jpg", array, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("Unable to JPEG-encode the image payload")
+    return encoded.tobytes()
+
+# Function to cut a face bbox (original-image coordinates), widened by margin, out of a decoded buffer
+def crop_region(image, region, margin=FACE_CROP_MARGIN):
+    x1, y1, x2, y2 = (float(v) * image.scale for v in region)
+    pad_x, pad_y = (x2 - x1) * margin, (y2 - y1) * margin
+    height, width = image.array.shape[:2]
+    left, top = max(0, int(x1 - pad_x)), max(0, int(y1 - pad_y))
+    right, bottom = min(width, int(x2 + pad_x)), min(height, int(y2 + pad_y))
+    if right <= left or bottom <= top:
+        return image.array
+    return image.array[top:bottom, left:right]
+
+class PayloadCache:
+    """Base64 image payloads for the vision model, prepared once per image content.
+
+    Payloads are resized to max_side and JPEG-encoded, then kept in an in-memory LRU bounded by max_memory_bytes
+    and keyed by content hash. An optional disk tier (atomic writes) lets re-runs and worker processes share them.
+    """
+
+    def __init__(self, directory=DEFAULT_PAYLOAD_DIR, max_memory_bytes=DEFAULT_MAX_MEMORY_BYTES,
+                 max_side=PAYLOAD_MAX_SIDE, quality=PAYLOAD_JPEG_QUALITY):
+        self.directory = directory
+        self.max_memory_bytes = max_memory_bytes
+        self.max_side = max_side
+        self.quality = quality
+        self.memory_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, content_hash, region=None):
+        key = f"{content_hash}_{self.max_side}_q{self.quality}"
+        if region is not None:
+            key += "_" + "_".join(str(int(round(float(v)))) for v in region)
+        return key
+
+    def _disk_path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.jpg")
+
+    def _remember(self, key, payload):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+            self._entries[key] = payload
+            self.memory_bytes += len(payload)
+            while self.memory_bytes > self.max_memory_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self.memory_bytes -= len(evicted)
+
+    def _read_disk(self, key):
+        if not self.directory:
+            return None
+        try:
+            with open(self._disk_path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, key, encoded):
+        if not self.directory:
+            return
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(encoded)
+        os.replace(tmp_path, path)
+
+    def get(self, image_path, image=None, region=None):
+        """Return the base64 payload for an image, preparing it from image (a LoadedImage) or the file on a miss.
+
+        region is an optional face bbox in original-image coordinates; the payload is then a crop around it.
+        """
+        key = self._key(image_content_hash(image_path), region)
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return payload
+
+        encoded = self._read_disk(key)
+        if encoded is not None:
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            if not isinstance(image, LoadedImage):
+                # Crops need more source pixels than the whole-image payload does
+                image = load_image(image_path, max_side=self.max_side if region is None else MAX_DECODE_SIDE)
+            array = image.array if region is None else crop_region(image, region)
+            encoded = encode_payload(array, self.max_side, self.quality)
+            self._write_disk(key, encoded)
+
+        payload = base64.b64encode(encoded).decode('ascii')
+        self._remember(key, payload)
+        return payload
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "memory_bytes": self.memory_bytes,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+            }
+
+def get_payload_cache(**config):
+    """Return the process-wide PayloadCache, creating it on first use."""
+    global _PAYLOAD_CACHE
+    if _PAYLOAD_CACHE is None:
+        with _PAYLOAD_CACHE_LOCK:
+            if _PAYLOAD_CACHE is None:
+                _PAYLOAD_CACHE = PayloadCache(**config)
+    return _PAYLOAD_CACHE
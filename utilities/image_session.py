@@ -0,0 +1,73 @@
+import threading
+from utilities.ollama_client import get_default_client
+
+# First turn of every session: sends the image once and produces the context every question branches from
+SESSION_PRIMER = "Here is a photo of a person. Answer each of the following questions about this photo."
+PRIMER_OPTIONS = {"num_predict": 1}  # the primer's reply is thrown away, so don't let the model generate one
+
+class ImageSession:
+    """One conversation about one image over /api/generate.
+
+    The image goes out once, with a priming turn; every question then continues from the primer's context, and a
+    follow-up (e.g. a certainty question) continues from the context of the turn it follows up on. The server
+    reuses the cached prefix instead of re-encoding the image and re-evaluating the shared prompt each time.
+    Turns run one at a time, on the server the primer went to, so they land on the same slot and its KV cache.
+    """
+
+    def __init__(self, model, image, client=None, keep_alive=None, options=None, primer=SESSION_PRIMER):
+        self.model = model
+        self.image = image  # base64 payload, or a callable returning it (only called if the model is asked)
+        self.client = client or get_default_client()
+        self.keep_alive = keep_alive
+        self.options = options
+        self.primer = primer
+        self.endpoint = None  # the server the primer went to; later turns follow it to reuse its KV cache
+        self.base_context = None
+        self._contexts = {}  # prompt -> context after that turn, for follow-ups
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.image_sends = 0
+        self.prompt_tokens_evaluated = 0
+        self.context_tokens_reused = 0
+        self.eval_tokens = 0
+
+    def _generate(self, prompt, images=None, context=None, format=None, options=None):
+        response = self.client.generate(self.model, prompt, images=images, context=context, format=format,
+                                        options=options, keep_alive=self.keep_alive, endpoint=self.endpoint)
+        self.turns += 1
+        self.prompt_tokens_evaluated += response.get("prompt_eval_count") or 0
+        self.eval_tokens += response.get("eval_count") or 0
+        if context:
+            self.context_tokens_reused += len(context)
+        return response
+
+    def _prime(self):
+        image = self.image() if callable(self.image) else self.image
+        self.endpoint = self.client.choose_endpoint()
+        response = self._generate(self.primer, images=[image], options=dict(self.options or {}, **PRIMER_OPTIONS))
+        self.image_sends += 1
+        self.base_context = response.get("context") or []
+
+    def ask(self, prompt, format=None, follow_up_of=None):
+        """Ask one question about the image and return the reply text.
+
+        follow_up_of names an earlier prompt of this session to continue from; otherwise the turn continues
+        from the primer.
+        """
+        with self._lock:
+            if self.base_context is None:
+                self._prime()
+            context = self._contexts.get(follow_up_of) or self.base_context
+            response = self._generate(prompt, context=context, format=format, options=self.options)
+            self._contexts[prompt] = response.get("context") or context
+            return response.get("response")
+
+    def stats(self):
+        """Token accounting: context_tokens_reused is prompt evaluation a fresh request per question would redo."""
+        return {
+            "turns": self.turns,
+            "image_sends": self.image_sends,
+            "prompt_tokens_evaluated": self.prompt_tokens_evaluated,
+            "context_tokens_reused": self.context_tokens_reused,
+            "eval_tokens": self.eval_tokens,
+        }
@@ -1,7 +1,14 @@
-from PIL import Image, ImageOps
+import numpy as np
+
+# Scales and white paddings tried, in order, when no face is found at full size
+ZOOM_OUT_PYRAMID = ((0.5, 100), (0.35, 150), (0.25, 200))
+# Name marker of the temporary files the old on-disk zoom-out fallback left next to the originals
+ZOOMED_OUT_MARKER = "_zoomed_out."
 
 def zoom_out_and_pad(image_path, zoom_factor=0.5, padding=100):
     """Zoom out an image and add padding around it."""
+    from PIL import Image, ImageOps
+
     with Image.open(image_path) as img:
         # Resize image to zoom out
         new_size = (int(img.width * zoom_factor), int(img.height * zoom_factor))
@@ -13,4 +20,21 @@ def zoom_out_and_pad(image_path, zoom_factor=0.5, padding=100):
         # Save the new image to a temporary file
         new_image_path = image_path.replace('.', '_zoomed_out.')
         img_with_padding.save(new_image_path)
-        return new_image_path
\ No newline at end of file
+        return new_image_path
+
+def zoom_out_and_pad_array(img, zoom_factor=0.5, padding=100):
+    """Zoom out an already-decoded BGR array and pad it with white, entirely in memory."""
+    import cv2
+
+    new_size = (max(1, int(img.shape[1] * zoom_factor)), max(1, int(img.shape[0] * zoom_factor)))
+    resized = cv2.resize(img, new_size, interpolation=cv2.INTER_AREA)
+    return cv2.copyMakeBorder(resized, padding, padding, padding, padding, cv2.BORDER_CONSTANT,
+                              value=(255, 255, 255))
+
+def to_original_coordinates(points, zoom_factor, padding):
+    """Map (x, y) points from a zoomed-out, padded image back to the original image."""
+    return (np.asarray(points, dtype=np.float32) - padding) / zoom_factor
+
+def is_zoomed_out_copy(filename):
+    """Check if a file is a leftover of the old on-disk zoom-out fallback."""
+    return ZOOMED_OUT_MARKER in filename
@@ -0,0 +1,202 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Oldest span events are dropped beyond this, so long-running processes keep bounded memory
+MAX_TRACE_EVENTS = 100000
+METRIC_PREFIX = "llava_pipeline"
+# Ollama reports these counters (tokens) and durations (nanoseconds) on every non-streaming reply
+LLM_COUNTERS = ("prompt_eval_count", "eval_count")
+LLM_DURATIONS = ("total_duration", "load_duration", "prompt_eval_duration", "eval_duration")
+
+_TRACER = None
+_TRACER_LOCK = threading.Lock()
+
+class Tracer:
+    """Collects timed stage spans and Ollama eval stats, and aggregates them per stage and per model.
+
+    Spans are kept as Chrome trace events (open the JSON trace in chrome://tracing or Perfetto); aggregates feed
+    the end-of-run summary and the Prometheus text endpoint. Events from worker processes can be merged in.
+    """
+
+    def __init__(self, max_events=MAX_TRACE_EVENTS):
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=max_events)
+        self._recorded = 0
+        self._taken = 0  # events already handed out by take_events()
+        self.stages = {}  # stage -> {"count", "failures", "seconds", "max_seconds"}
+        self.llm = {}  # model -> {"requests", counters..., durations in nanoseconds...}
+
+    @contextmanager
+    def stage(self, name, **attrs):
+        """Time the enclosed block as one span of the named stage."""
+        start_wall = time.time()
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield attrs
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            if failed:
+                attrs["failed"] = True
+            self.merge([{
+                "name": name, "cat": "stage", "ph": "X",
+                "ts": int(start_wall * 1e6), "dur": int(seconds * 1e6),
+                "pid": os.getpid(), "tid": threading.get_ident(), "args": attrs,
+            }])
+
+    def record_llm(self, model, endpoint, response, seconds):
+        """Record one Ollama reply's eval stats (token counts and load/prompt/eval durations)."""
+        stats = {key: response.get(key) for key in LLM_COUNTERS + LLM_DURATIONS if response.get(key) is not None}
+        stats.update(model=model, endpoint=endpoint)
+        self.merge([{
+            "name": f"ollama {endpoint}", "cat": "llm", "ph": "X",
+            "ts": int((time.time() - seconds) * 1e6), "dur": int(seconds * 1e6),
+            "pid": os.getpid(), "tid": threading.get_ident(), "args": stats,
+        }])
+
+    def merge(self, events):
+        """Add events (recorded here or returned by another process's take_events) and update the aggregates."""
+        with self._lock:
+            for event in events:
+                self._events.append(event)
+                self._recorded += 1
+                seconds = event["dur"] / 1e6
+                if event["cat"] == "stage":
+                    totals = self.stages.setdefault(event["name"], {"count": 0, "failures": 0, "seconds": 0.0,
+                                                                    "max_seconds": 0.0})
+                    totals["count"] += 1
+                    totals["failures"] += 1 if event["args"].get("failed") else 0
+                    totals["seconds"] += seconds
+                    totals["max_seconds"] = max(totals["max_seconds"], seconds)
+                else:
+                    args = event["args"]
+                    totals = self.llm.setdefault(args.get("model"), dict(
+                        {"requests": 0, "wall_seconds": 0.0},
+                        **{key: 0 for key in LLM_COUNTERS + LLM_DURATIONS}))
+                    totals["requests"] += 1
+                    totals["wall_seconds"] += seconds
+                    for key in LLM_COUNTERS + LLM_DURATIONS:
+                        totals[key] += args.get(key) or 0
+
+    def take_events(self):
+        """Return and forget the events recorded since the last call (used to ship worker spans to the parent)."""
+        with self._lock:
+            new = min(self._recorded - self._taken, len(self._events))
+            self._taken = self._recorded
+            return list(self._events)[len(self._events) - new:] if new else []
+
+    def summary(self):
+        """Per-stage totals plus per-model token throughput and where the model's time went."""
+        with self._lock:
+            stages = {name: {"count": totals["count"], "failures": totals["failures"],
+                             "total_seconds": round(totals["seconds"], 4),
+                             "mean_ms": round(1000 * totals["seconds"] / totals["count"], 3),
+                             "max_ms": round(1000 * totals["max_seconds"], 3)}
+                      for name, totals in self.stages.items()}
+            llm = {}
+            for model, totals in self.llm.items():
+                eval_seconds = totals["eval_duration"] / 1e9
+                prompt_seconds = totals["prompt_eval_duration"] / 1e9
+                llm[model] = {
+                    "requests": totals["requests"],
+                    "wall_seconds": round(totals["wall_seconds"], 4),
+                    "load_seconds": round(totals["load_duration"] / 1e9, 4),
+                    "prompt_eval_seconds": round(prompt_seconds, 4),
+                    "eval_seconds": round(eval_seconds, 4),
+                    "prompt_tokens": totals["prompt_eval_count"],
+                    "eval_tokens": totals["eval_count"],
+                    "prompt_tokens_per_second": round(totals["prompt_eval_count"] / prompt_seconds, 2) if prompt_seconds else None,
+                    "eval_tokens_per_second": round(totals["eval_count"] / eval_seconds, 2) if eval_seconds else None,
+                }
+        return {"stages": stages, "llm": llm}
+
+    def write_trace(self, path):
+        """Write the spans (Chrome trace format) plus the summary to a JSON file."""
+        with self._lock:
+            events = list(self._events)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms", "summary": self.summary()}, f)
+        return path
+
+    def prometheus_text(self):
+        """Render the aggregates in the Prometheus text exposition format."""
+        summary = self.summary()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{_escape_label(label)}"' for key, label in labels.items())
+                lines.append(f"{METRIC_PREFIX}_{name}{{{label_text}}} {value}")
+
+        stages = summary["stages"]
+        metric("stage_calls_total", "counter", "Completed stage spans.",
+               [({"stage": name}, totals["count"]) for name, totals in stages.items()])
+        metric("stage_failures_total", "counter", "Stage spans that raised.",
+               [({"stage": name}, totals["failures"]) for name, totals in stages.items()])
+        metric("stage_seconds_total", "counter", "Wall time spent in each stage.",
+               [({"stage": name}, totals["total_seconds"]) for name, totals in stages.items()])
+
+        llm = summary["llm"]
+        for key, help_text in (("requests", "Ollama requests."),
+                               ("prompt_tokens", "Prompt tokens evaluated by Ollama."),
+                               ("eval_tokens", "Tokens generated by Ollama."),
+                               ("load_seconds", "Time Ollama spent loading the model."),
+                               ("prompt_eval_seconds", "Time Ollama spent evaluating prompts."),
+                               ("eval_seconds", "Time Ollama spent generating tokens."),
+                               ("wall_seconds", "Client-side wall time of Ollama requests.")):
+            metric(f"ollama_{key}_total", "counter", help_text,
+                   [({"model": model}, totals[key]) for model, totals in llm.items()])
+        return "\n".join(lines) + "\n"
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def get_tracer():
+    """Return the process-wide Tracer, creating it on first use."""
+    global _TRACER
+    if _TRACER is None:
+        with _TRACER_LOCK:
+            if _TRACER is None:
+                _TRACER = Tracer()
+    return _TRACER
+
+def trace_stage(name, **attrs):
+    """Shortcut for get_tracer().stage(name, **attrs)."""
+    return get_tracer().stage(name, **attrs)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.tracer.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def serve_metrics(port, host="127.0.0.1", tracer=None):
+    """Serve the tracer's aggregates as Prometheus text on http://host:port/metrics from a daemon thread."""
+    httpd = ThreadingHTTPServer((host, port), _MetricsHandler)
+    httpd.daemon_threads = True
+    httpd.tracer = tracer or get_tracer()
+    threading.Thread(target=httpd.serve_forever, name="metrics", daemon=True).start()
+    print(f"Serving Prometheus metrics on http://{host}:{httpd.server_address[1]}/metrics")
+    return httpd
@@ -0,0 +1,172 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+DEFAULT_QUEUE_PATH = os.path.join(".cache", "jobs.sqlite3")
+DEFAULT_LEASE_SECONDS = 300  # a claimed job returns to the queue if its worker doesn't finish or renew it in time
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_DELAY = 30  # seconds before the first retry; doubled for every further attempt
+STATUS_QUEUED = "queued"
+STATUS_LEASED = "leased"
+STATUS_DONE = "done"
+STATUS_DEAD = "dead"
+
+Job = namedtuple("Job", ["id", "image_path", "attempts", "lease_expires"])
+
+class JobQueue:
+    """Durable SQLite work queue of image paths, shared by any number of worker threads and processes.
+
+    claim() hands out jobs under a lease; the worker completes, fails or renews (heartbeat) it. Jobs whose lease
+    expires go back to the queue, failed jobs are retried with exponential backoff, and a job that used up
+    max_attempts is dead-lettered with its last error instead of being retried forever.
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 retry_delay=DEFAULT_RETRY_DELAY):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit mode so claims can take the write lock up front with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                image_path TEXT NOT NULL UNIQUE,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                lease_owner TEXT,
+                lease_expires REAL,
+                last_error TEXT,
+                result TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at);
+        """)
+
+    def _transaction(self, work):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def enqueue(self, image_paths, requeue=False):
+        """Add images to the queue; returns how many were added.
+
+        Paths already in the queue are left alone unless requeue is set, which resets finished and dead jobs.
+        """
+        now = time.time()
+
+        def work(conn):
+            added = 0
+            for image_path in image_paths:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO jobs (image_path, status, available_at, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)", (image_path, STATUS_QUEUED, now, now, now))
+                if not cursor.rowcount and requeue:
+                    cursor = conn.execute(
+                        "UPDATE jobs SET status = ?, attempts = 0, available_at = ?, last_error = NULL, updated_at = ? "
+                        "WHERE image_path = ? AND status IN (?, ?)",
+                        (STATUS_QUEUED, now, now, image_path, STATUS_DONE, STATUS_DEAD))
+                added += cursor.rowcount
+            return added
+        return self._transaction(work)
+
+    def claim(self, worker_id, limit=1):
+        """Lease up to limit ready jobs (queued and due, or with an expired lease) to worker_id."""
+        now = time.time()
+
+        def work(conn):
+            # A lease that expired means its worker died mid-job: that counts as a failed attempt
+            expired = conn.execute(
+                "SELECT id, attempts FROM jobs WHERE status = ? AND lease_expires < ?", (STATUS_LEASED, now)).fetchall()
+            for job_id, attempts in expired:
+                self._record_failure(conn, job_id, attempts, "lease expired", now)
+
+            rows = conn.execute(
+                "SELECT id, image_path, attempts FROM jobs WHERE status = ? AND available_at <= ? ORDER BY id LIMIT ?",
+                (STATUS_QUEUED, now, limit)).fetchall()
+            jobs = []
+            for job_id, image_path, attempts in rows:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = ?, lease_owner = ?, lease_expires = ?, updated_at = ? "
+                    "WHERE id = ?", (STATUS_LEASED, attempts + 1, worker_id, now + self.lease_seconds, now, job_id))
+                jobs.append(Job(job_id, image_path, attempts + 1, now + self.lease_seconds))
+            return jobs
+        return self._transaction(work)
+
+    def _record_failure(self, conn, job_id, attempts, error, now):
+        if attempts >= self.max_attempts:
+            conn.execute("UPDATE jobs SET status = ?, lease_owner = NULL, lease_expires = NULL, last_error = ?, "
+                         "updated_at = ? WHERE id = ?", (STATUS_DEAD, error, now, job_id))
+            return STATUS_DEAD
+        retry_at = now + self.retry_delay * 2 ** max(0, attempts - 1)
+        conn.execute("UPDATE jobs SET status = ?, available_at = ?, lease_owner = NULL, lease_expires = NULL, "
+                     "last_error = ?, updated_at = ? WHERE id = ?", (STATUS_QUEUED, retry_at, error, now, job_id))
+        return STATUS_QUEUED
+
+    def heartbeat(self, job_id, worker_id):
+        """Renew a job's lease; returns False if the worker no longer holds it (it expired and was re-claimed)."""
+        now = time.time()
+        return self._transaction(lambda conn: conn.execute(
+            "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND status = ? AND lease_owner = ?",
+            (now + self.lease_seconds, now, job_id, STATUS_LEASED, worker_id)).rowcount == 1)
+
+    def complete(self, job_id, worker_id, result=None):
+        """Mark a leased job done; returns False if the worker had lost the lease."""
+        now = time.time()
+        return self._transaction(lambda conn: conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ? "
+            "WHERE id = ? AND status = ? AND lease_owner = ?",
+            (STATUS_DONE, result, now, job_id, STATUS_LEASED, worker_id)).rowcount == 1)
+
+    def fail(self, job_id, worker_id, error):
+        """Record a failed attempt; returns the job's new status (queued for a retry, or dead), or None if the
+        worker had lost the lease."""
+        now = time.time()
+
+        def work(conn):
+            row = conn.execute("SELECT attempts FROM jobs WHERE id = ? AND status = ? AND lease_owner = ?",
+                               (job_id, STATUS_LEASED, worker_id)).fetchone()
+            if row is None:
+                return None
+            return self._record_failure(conn, job_id, row[0], str(error)[:2000], now)
+        return self._transaction(work)
+
+    def requeue_dead(self):
+        """Give every dead-lettered job a fresh set of attempts; returns how many were requeued."""
+        now = time.time()
+        return self._transaction(lambda conn: conn.execute(
+            "UPDATE jobs SET status = ?, attempts = 0, available_at = ?, updated_at = ? WHERE status = ?",
+            (STATUS_QUEUED, now, now, STATUS_DEAD)).rowcount)
+
+    def dead_letters(self, limit=100):
+        with self._lock:
+            rows = self._conn.execute("SELECT id, image_path, attempts, last_error FROM jobs WHERE status = ? "
+                                      "ORDER BY updated_at DESC LIMIT ?", (STATUS_DEAD, limit)).fetchall()
+        return [dict(zip(("id", "image_path", "attempts", "last_error"), row)) for row in rows]
+
+    def stats(self):
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in (STATUS_QUEUED, STATUS_LEASED, STATUS_DONE, STATUS_DEAD)}
+        counts.update(dict(rows))
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,121 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from utilities.response_cache import file_sha256
+
+MANIFEST_FILE_NAME = ".manifest.sqlite3"
+STATUS_IN_PROGRESS = "in_progress"
+STATUS_DONE = "done"
+
+class RunManifest:
+    """Records, per input image, its content hash, pipeline/stage versions, output path and finished stage outputs."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS images (
+                image_path TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                pipeline_version TEXT NOT NULL,
+                output_path TEXT,
+                status TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS stages (
+                image_path TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                version TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                output TEXT NOT NULL,
+                PRIMARY KEY (image_path, stage)
+            );
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def _key(image_path):
+        return os.path.abspath(image_path)
+
+    def lookup(self, image_path):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash, size, mtime_ns, pipeline_version, output_path, status FROM images "
+                "WHERE image_path = ?", (self._key(image_path),)).fetchone()
+        if row is None:
+            return None
+        keys = ("content_hash", "size", "mtime_ns", "pipeline_version", "output_path", "status")
+        return dict(zip(keys, row))
+
+    def content_hash(self, image_path, entry=None):
+        """Hash the image, reusing the recorded hash when size and mtime are unchanged."""
+        stat = os.stat(image_path)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["content_hash"]
+        return file_sha256(image_path)
+
+    def stage_version(self, image_path, stage, content_hash):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version FROM stages WHERE image_path = ? AND stage = ? AND content_hash = ?",
+                (self._key(image_path), stage, content_hash)).fetchone()
+        return row[0] if row else None
+
+    def plan(self, image_path, pipeline_version, stage_versions, force_stages=()):
+        """Return (content_hash, stages_to_run, skip); skip is True when the existing profile is fully current."""
+        entry = self.lookup(image_path)
+        content_hash = self.content_hash(image_path, entry)
+        stages = []
+        for stage, version in stage_versions.items():
+            if stage in force_stages or self.stage_version(image_path, stage, content_hash) != version:
+                stages.append(stage)
+
+        up_to_date = (entry is not None and entry["status"] == STATUS_DONE and entry["content_hash"] == content_hash
+                      and entry["pipeline_version"] == pipeline_version
+                      and entry["output_path"] and os.path.exists(entry["output_path"]))
+        # With no stale stages but a missing or outdated profile, the caller only reassembles it from stage outputs
+        return content_hash, stages, not stages and up_to_date
+
+    def mark_started(self, image_path, content_hash, pipeline_version, output_path):
+        stat = os.stat(image_path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO images (image_path, content_hash, size, mtime_ns, pipeline_version, "
+                "output_path, status, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self._key(image_path), content_hash, stat.st_size, stat.st_mtime_ns, pipeline_version,
+                 output_path, STATUS_IN_PROGRESS, time.time()))
+            self._conn.commit()
+
+    def save_stage(self, image_path, stage, version, content_hash, output):
+        """Persist a finished stage's output so a crashed or partially forced run can reuse it."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stages (image_path, stage, version, content_hash, output) VALUES (?, ?, ?, ?, ?)",
+                (self._key(image_path), stage, version, content_hash, json.dumps(output)))
+            self._conn.commit()
+
+    def load_stage(self, image_path, stage, content_hash):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT output FROM stages WHERE image_path = ? AND stage = ? AND content_hash = ?",
+                (self._key(image_path), stage, content_hash)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def mark_done(self, image_path, output_path):
+        with self._lock:
+            self._conn.execute("UPDATE images SET status = ?, output_path = ?, updated_at = ? WHERE image_path = ?",
+                               (STATUS_DONE, output_path, time.time(), self._key(image_path)))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
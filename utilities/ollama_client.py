@@ -0,0 +1,230 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from utilities.instrumentation import get_tracer
+from utilities.ollama_router import EndpointRouter, parse_endpoints, DEFAULT_STRATEGY, HEALTH_CHECK_INTERVAL
+
+DEFAULT_OLLAMA_PORT = 11434
+DEFAULT_OLLAMA_URL = os.environ.get("OLLAMA_HOST", f"http://127.0.0.1:{DEFAULT_OLLAMA_PORT}")
+# OLLAMA_HOST is often the server's bind address; a client reaches a wildcard bind over loopback
+WILDCARD_HOSTS = {"": "127.0.0.1", "0.0.0.0": "127.0.0.1", "::": "::1"}
+# Several inference hosts, e.g. "gpu1:11434=2,gpu2:11434" (optional =weight); takes precedence over OLLAMA_HOST
+DEFAULT_OLLAMA_HOSTS = os.environ.get("OLLAMA_HOSTS")
+DEFAULT_ROUTING = os.environ.get("OLLAMA_ROUTING", DEFAULT_STRATEGY)
+# Match the server's OLLAMA_NUM_PARALLEL so every slot stays busy without queueing on the server
+DEFAULT_CONCURRENCY = int(os.environ.get("OLLAMA_NUM_PARALLEL", "4"))
+DEFAULT_TIMEOUT = (5, 600)  # (connect, read) seconds; llava:13b generations can be slow
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5  # seconds, doubled after every failed attempt
+MAX_BACKOFF = 10
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+_DEFAULT_CLIENT = None
+_DEFAULT_CLIENT_LOCK = threading.Lock()
+
+class OllamaClientError(RuntimeError):
+    """Raised when an Ollama request fails for good; the message says why."""
+
+    def __init__(self, message, endpoint=None, status_code=None):
+        super().__init__(message)
+        self.endpoint = endpoint
+        self.status_code = status_code
+
+# Function to turn "host[:port]" or a URL into a base URL without trailing slash
+def normalize_endpoint(endpoint):
+    """Read endpoints the way the ollama CLI reads OLLAMA_HOST: without a scheme the port defaults to 11434
+    ("0.0.0.0" -> "http://127.0.0.1:11434"); a URL with a scheme but no port keeps the scheme's default."""
+    endpoint = endpoint.strip().rstrip("/")
+    has_scheme = endpoint.startswith(("http://", "https://"))
+    parts = urlsplit(endpoint if has_scheme else f"http://{endpoint}")
+    try:
+        port = parts.port
+    except ValueError:
+        raise ValueError(f"Invalid Ollama endpoint '{endpoint}': bad port")
+    host = parts.hostname or ""
+    host = WILDCARD_HOSTS.get(host, host)
+    if ":" in host:
+        host = f"[{host}]"  # IPv6 literal
+    if port is None and not has_scheme:
+        port = DEFAULT_OLLAMA_PORT
+    netloc = f"{host}:{port}" if port is not None else host
+    return f"{parts.scheme}://{netloc}{parts.path}".rstrip("/")
+
+class OllamaClient:
+    """Pooled HTTP client for the Ollama REST API with retries, timeouts and bounded parallelism.
+
+    endpoint may list several servers ("host:port[=weight],..." or a list); requests are then routed across
+    them by an EndpointRouter and concurrency applies per endpoint.
+    """
+
+    def __init__(self, endpoint=None, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, routing=DEFAULT_ROUTING,
+                 health_interval=HEALTH_CHECK_INTERVAL):
+        entries = parse_endpoints(endpoint or DEFAULT_OLLAMA_HOSTS or DEFAULT_OLLAMA_URL)
+        self.router = EndpointRouter([(normalize_endpoint(url), weight) for url, weight in entries], routing)
+        self.endpoints = self.router.endpoints
+        if len(self.endpoints) > 1 and health_interval:
+            self.router.start_health_checks(health_interval)
+        self.concurrency = max(1, int(concurrency))
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+        # requests is only imported once a client is built, so importing the pipeline stays cheap
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        # One keep-alive pool per endpoint, sized so every in-flight request gets its own connection
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.endpoints), pool_maxsize=self.concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._semaphores = {endpoint: threading.BoundedSemaphore(self.concurrency) for endpoint in self.endpoints}
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def choose_endpoint(self):
+        """The endpoint the router would send the next request to (e.g. to pin a multi-turn session there)."""
+        return self.router.choose()
+
+    def _request(self, method, path, payload=None, endpoint=None):
+        """Send one request, retrying connection errors and retryable status codes with exponential backoff.
+
+        Unless the request is pinned to an endpoint, every attempt is routed and a retry avoids the endpoint
+        that just failed.
+        """
+        import requests
+
+        delay = self.backoff
+        last_error = None
+        failed = ()
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(min(delay, MAX_BACKOFF) * (0.5 + random.random()))
+                delay *= 2
+            target = self.router.acquire(endpoint, exclude=failed)
+            url = f"{target}{path}"
+            response = None
+            start = time.perf_counter()
+            try:
+                with self._semaphores[target]:
+                    response = self.session.request(method, url, json=payload, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                last_error = OllamaClientError(f"{method} {url} failed: {e}", endpoint=target)
+            finally:
+                # Client errors (unknown model, bad request) say nothing about the endpoint's health
+                self.router.release(target, ok=response is not None and response.status_code < 500,
+                                    seconds=time.perf_counter() - start)
+            if response is None:
+                failed = (target,)
+                continue
+
+            if response.status_code == 200:
+                try:
+                    return response.json()
+                except ValueError:
+                    # e.g. a proxy's error page served with 200; callers only expect OllamaClientError
+                    raise OllamaClientError(f"{method} {url} returned a non-JSON response: "
+                                            f"{response.text.strip()[:500]}", endpoint=target, status_code=200)
+
+            detail = response.text.strip()[:500]
+            last_error = OllamaClientError(f"{method} {url} returned HTTP {response.status_code}: {detail}",
+                                           endpoint=target, status_code=response.status_code)
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                break
+            failed = (target,)
+
+        raise last_error
+
+    def post(self, path, payload, endpoint=None):
+        return self._request("POST", path, payload, endpoint)
+
+    def get(self, path, endpoint=None):
+        return self._request("GET", path, endpoint=endpoint)
+
+    def chat(self, model, messages, format=None, options=None, keep_alive=None, endpoint=None):
+        """Run a non-streaming /api/chat call and return the full response (message plus eval stats)."""
+        payload = {"model": model, "messages": messages, "stream": False}
+        if format is not None:
+            payload["format"] = format
+        if options:
+            payload["options"] = options
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        return self._post_model_call("/api/chat", model, payload, endpoint)
+
+    def generate(self, model, prompt, images=None, context=None, format=None, options=None, keep_alive=None,
+                 endpoint=None):
+        """Run a non-streaming /api/generate call and return the full response; endpoint pins the server."""
+        payload = {"model": model, "prompt": prompt, "stream": False}
+        for key, value in (("images", images), ("context", context), ("format", format),
+                           ("options", options), ("keep_alive", keep_alive)):
+            if value is not None:
+                payload[key] = value
+        return self._post_model_call("/api/generate", model, payload, endpoint)
+
+    def _post_model_call(self, path, model, payload, endpoint=None):
+        """POST a chat/generate request and record its eval stats (tokens, load/prompt/eval time) in the tracer."""
+        start = time.perf_counter()
+        response = self.post(path, payload, endpoint)
+        get_tracer().record_llm(model, path, response, time.perf_counter() - start)
+        return response
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    workers = self.concurrency * len(self.endpoints)
+                    self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ollama")
+        return self._executor
+
+    def submit(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the client's worker pool and return a Future."""
+        return self._get_executor().submit(fn, *args, **kwargs)
+
+    def submit_chat(self, model, messages, **kwargs):
+        return self.submit(self.chat, model, messages, **kwargs)
+
+    def map_chat(self, model, prompts, **kwargs):
+        """Send several single-message chats concurrently; results come back in prompt order."""
+        futures = [self.submit_chat(model, [{"role": "user", "content": prompt}], **kwargs) for prompt in prompts]
+        return [future.result() for future in futures]
+
+    async def achat(self, model, messages, **kwargs):
+        """asyncio wrapper around chat() that runs on the client's worker pool."""
+        return await asyncio.wrap_future(self.submit_chat(model, messages, **kwargs))
+
+    def stats(self):
+        """Per-endpoint routing counters: weight, health, in-flight and total requests, failures, busy time."""
+        return self.router.stats()
+
+    def close(self):
+        self.router.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.session.close()
+
+def get_default_client():
+    """Return the process-wide OllamaClient, creating it on first use."""
+    global _DEFAULT_CLIENT
+    if _DEFAULT_CLIENT is None:
+        with _DEFAULT_CLIENT_LOCK:
+            if _DEFAULT_CLIENT is None:
+                _DEFAULT_CLIENT = OllamaClient()
+    return _DEFAULT_CLIENT
+
+def set_default_client(client):
+    """Replace the process-wide client (e.g. to point every caller at another server)."""
+    global _DEFAULT_CLIENT
+    with _DEFAULT_CLIENT_LOCK:
+        previous, _DEFAULT_CLIENT = _DEFAULT_CLIENT, client
+    if previous is not None and previous is not client:
+        previous.close()
+    return client
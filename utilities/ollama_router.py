@@ -0,0 +1,147 @@
+import threading
+import time
+
+ROUTING_STRATEGIES = ("least_loaded", "weighted")
+DEFAULT_STRATEGY = "least_loaded"
+HEALTH_CHECK_INTERVAL = 10.0  # seconds between active probes of every endpoint
+HEALTH_CHECK_TIMEOUT = 2.0
+FAILURE_THRESHOLD = 2  # consecutive failed requests before an endpoint is taken out of rotation
+FAILURE_COOLDOWN = 30.0  # seconds an unhealthy endpoint waits before it is tried again without a passing probe
+
+# Function to parse "host:port[=weight],..." (e.g. an OLLAMA_HOSTS value) into (endpoint, weight) pairs
+def parse_endpoints(spec):
+    endpoints = []
+    for item in spec.split(",") if isinstance(spec, str) else spec:
+        item = item.strip()
+        if not item:
+            continue
+        endpoint, _, weight = item.partition("=")
+        endpoints.append((endpoint.strip(), float(weight) if weight else 1.0))
+    return endpoints
+
+class EndpointRouter:
+    """Spreads requests over several Ollama endpoints and keeps unhealthy ones out of rotation.
+
+    least_loaded picks the healthy endpoint with the fewest in-flight requests relative to its weight;
+    weighted hands out requests in proportion to the weights (smooth weighted round-robin). An endpoint that
+    fails FAILURE_THRESHOLD requests in a row is skipped until a health probe passes or the cooldown expires.
+    When every endpoint is unhealthy, all of them are tried rather than failing outright.
+    """
+
+    def __init__(self, endpoints, strategy=DEFAULT_STRATEGY, failure_threshold=FAILURE_THRESHOLD,
+                 cooldown=FAILURE_COOLDOWN):
+        if strategy not in ROUTING_STRATEGIES:
+            raise ValueError(f"Unknown routing strategy '{strategy}'; expected one of {', '.join(ROUTING_STRATEGIES)}")
+        if not endpoints:
+            raise ValueError("At least one Ollama endpoint is required")
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._state = {endpoint: {"weight": weight, "in_flight": 0, "requests": 0, "failures": 0,
+                                  "consecutive_failures": 0, "healthy": True, "retry_at": 0.0, "current": 0.0,
+                                  "seconds": 0.0}
+                       for endpoint, weight in endpoints}
+        self._health_thread = None
+        self._stop = threading.Event()
+
+    @property
+    def endpoints(self):
+        return list(self._state)
+
+    def _candidates(self, exclude=()):
+        now = time.monotonic()
+        usable = [endpoint for endpoint, state in self._state.items()
+                  if endpoint not in exclude and (state["healthy"] or now >= state["retry_at"])]
+        return usable or [endpoint for endpoint in self._state if endpoint not in exclude] or list(self._state)
+
+    def choose(self, exclude=()):
+        """Pick the endpoint for the next request without reserving it (e.g. to pin a session to it)."""
+        with self._lock:
+            return self._choose(self._candidates(exclude))
+
+    def _choose(self, candidates):
+        if self.strategy == "least_loaded":
+            return min(candidates, key=lambda endpoint: (
+                self._state[endpoint]["in_flight"] / self._state[endpoint]["weight"], self._state[endpoint]["requests"]))
+        # Smooth weighted round-robin: every candidate gains its weight, the leader is picked and pays the total
+        total = sum(self._state[endpoint]["weight"] for endpoint in candidates)
+        for endpoint in candidates:
+            self._state[endpoint]["current"] += self._state[endpoint]["weight"]
+        chosen = max(candidates, key=lambda endpoint: self._state[endpoint]["current"])
+        self._state[chosen]["current"] -= total
+        return chosen
+
+    def acquire(self, endpoint=None, exclude=()):
+        """Reserve an endpoint for one request (the given one, or the router's pick) and return it."""
+        with self._lock:
+            if endpoint is None:
+                endpoint = self._choose(self._candidates(exclude))
+            state = self._state[endpoint]
+            state["in_flight"] += 1
+            state["requests"] += 1
+            return endpoint
+
+    def release(self, endpoint, ok=True, seconds=0.0):
+        """Finish a request started with acquire(); failures count towards taking the endpoint out of rotation."""
+        with self._lock:
+            state = self._state[endpoint]
+            state["in_flight"] -= 1
+            state["seconds"] += seconds
+            if ok:
+                state["consecutive_failures"] = 0
+                state["healthy"] = True
+                return
+            state["failures"] += 1
+            state["consecutive_failures"] += 1
+            if state["consecutive_failures"] >= self.failure_threshold:
+                if state["healthy"]:
+                    print(f"Taking Ollama endpoint {endpoint} out of rotation after "
+                          f"{state['consecutive_failures']} failed request(s).")
+                self._mark_unhealthy(state)
+
+    def _mark_unhealthy(self, state):
+        state["healthy"] = False
+        state["retry_at"] = time.monotonic() + self.cooldown
+
+    def check_health(self, timeout=HEALTH_CHECK_TIMEOUT):
+        """Probe /api/version on every endpoint and update its health; returns {endpoint: healthy}."""
+        import requests
+
+        results = {}
+        for endpoint in self.endpoints:
+            try:
+                healthy = requests.get(f"{endpoint}/api/version", timeout=timeout).status_code == 200
+            except requests.RequestException:
+                healthy = False
+            with self._lock:
+                state = self._state[endpoint]
+                if healthy and not state["healthy"]:
+                    print(f"Ollama endpoint {endpoint} is healthy again.")
+                if healthy:
+                    state["healthy"] = True
+                    state["consecutive_failures"] = 0
+                else:
+                    self._mark_unhealthy(state)
+            results[endpoint] = healthy
+        return results
+
+    def start_health_checks(self, interval=HEALTH_CHECK_INTERVAL):
+        """Probe every endpoint from a daemon thread every interval seconds."""
+        if self._health_thread is None:
+            def run():
+                while not self._stop.wait(interval):
+                    self.check_health()
+            self._health_thread = threading.Thread(target=run, name="ollama-health", daemon=True)
+            self._health_thread.start()
+        return self
+
+    def close(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            return {endpoint: {"weight": state["weight"], "healthy": state["healthy"], "in_flight": state["in_flight"],
+                               "requests": state["requests"], "failures": state["failures"],
+                               "busy_seconds": round(state["seconds"], 3)}
+                    for endpoint, state in self._state.items()}
@@ -2,10 +2,9 @@ import os
 import subprocess
 import shutil
 import platform
-import psutil
-import requests
 import time
 import socket
+from utilities.ollama_client import get_default_client, OllamaClientError
 
 OLLAMA_DIR = os.path.join(os.getcwd(), "ollama")
 OLLAMA_ZIP_PATH = os.path.join(os.getcwd(), "ollama-windows.zip")
@@ -14,6 +13,17 @@ OLLAMA_RUNNERS_DIR = os.path.join(OLLAMA_DIR, "lib", "ollama", "runners")
 OLLAMA_LIB_DIR = os.path.join(OLLAMA_DIR, "lib", "ollama")
 OLLAMA_PORT = 11434  # Define the port used by Ollama
 OLLAMA_PROCESS = None
+# Readiness probing of /api/version: total wait, first retry delay (doubled per attempt) and the cap on that delay
+READY_TIMEOUT = 60
+READY_INITIAL_DELAY = 0.1
+READY_MAX_DELAY = 2.0
+READY_PROBE_TIMEOUT = 1.0
+START_ATTEMPTS = 3
+# keep_alive sent with every request: -1 pins the model in memory for the whole batch; Ollama resets the expiry on
+# each request, so requests without it would drop the pin back to the server default
+MODEL_KEEP_ALIVE = -1
+RELEASED_KEEP_ALIVE = "5m"  # server default, restored when we leave a shared server running
+OLLAMA_INSTALL_HINT = "Install it from https://ollama.com/download (Linux: curl -fsSL https://ollama.com/install.sh | sh)."
 
 DEFAULT_MODELS_DIR = os.path.join(os.path.expanduser("~"), ".ollama", "models")
 
@@ -28,6 +38,12 @@ def is_ollama_installed(ollama_path):
     """Check if the Ollama executable is available."""
     return os.path.isfile(ollama_path)
 
+def find_ollama_executable():
+    """Return the Ollama executable: the bundled one on Windows, otherwise whatever `ollama` is on PATH."""
+    if is_windows() and is_ollama_installed(OLLAMA_EXE_PATH):
+        return OLLAMA_EXE_PATH
+    return shutil.which("ollama")
+
 def is_model_downloaded(model_name, model_dir=DEFAULT_MODELS_DIR):
     """Check if the specified model is already downloaded."""
     model_path = os.path.join(model_dir, model_name)
@@ -39,6 +55,8 @@ def is_model_downloaded(model_name, model_dir=DEFAULT_MODELS_DIR):
 
 def download_file(url, local_path):
     """Download a file from a URL to a local path."""
+    import requests
+
     with requests.get(url, stream=True) as r:
         r.raise_for_status()
         with open(local_path, 'wb') as f:
@@ -68,11 +86,12 @@ def pull_model(model_name):
     print(f"Pulling model '{model_name}'... This may take a while.")
     
     # Ensure the environment variable is set
-    os.environ['OLLAMA_RUNNERS_DIR'] = OLLAMA_RUNNERS_DIR
-    os.environ['PATH'] = f"{os.environ['PATH']};{OLLAMA_EXE_PATH}"
+    if is_windows():
+        os.environ['OLLAMA_RUNNERS_DIR'] = OLLAMA_RUNNERS_DIR
+        os.environ['PATH'] = f"{os.environ['PATH']};{OLLAMA_EXE_PATH}"
 
     try:
-        subprocess.run([OLLAMA_EXE_PATH, 'pull', model_name], check=True)
+        subprocess.run([find_ollama_executable() or OLLAMA_EXE_PATH, 'pull', model_name], check=True)
         print(f"Model '{model_name}' pulled successfully.")
     except subprocess.CalledProcessError as e:
         print(f"Failed to pull model '{model_name}': {e}")
@@ -87,6 +106,8 @@ def install_ollama_pkg():
 
 def kill_existing_ollama_service():
     """Kill any existing Ollama service instances to free up the port."""
+    import psutil
+
     for process in psutil.process_iter(['pid', 'name', 'username']):
         try:
             if process.info['name'] == 'ollama.exe' and process.info['username'] == os.getlogin():
@@ -106,6 +127,8 @@ def kill_existing_ollama_service():
 
 def clear_gpu_memory():
     """Clear the GPU memory by killing processes using GPU."""
+    import psutil
+
     try:
         result = subprocess.run(["nvidia-smi", "--query-compute-apps=pid", "--format=csv,noheader"], capture_output=True, text=True, check=True)
         pids = result.stdout.strip().split("\n")
@@ -137,37 +160,125 @@ def is_port_in_use(port):
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         return s.connect_ex(('127.0.0.1', port)) == 0
 
-def start_ollama_service_windows():
-    """Start Ollama service on Windows."""
-    global OLLAMA_PROCESS
-    print("Starting Ollama service...")
+def ollama_base_url():
+    """Base URL of the server the default client talks to (OLLAMA_HOST, or the local default)."""
+    return get_default_client().endpoints[0]
 
-    retries = 3
-    while retries > 0:
-        if is_port_in_use(OLLAMA_PORT):
-            print(f"Port {OLLAMA_PORT} is already in use. Assuming Ollama service is running.")
-            return True  # Treat it as success if the port is already in use
+def probe_ollama(base_url=None, timeout=READY_PROBE_TIMEOUT):
+    """Return the server version if the Ollama API answers, else None."""
+    import requests
 
-        os.environ['OLLAMA_RUNNERS_DIR'] = OLLAMA_RUNNERS_DIR
-        os.environ['PATH'] = f"{os.environ['PATH']};{OLLAMA_LIB_DIR}"
+    try:
+        response = requests.get(f"{base_url or ollama_base_url()}/api/version", timeout=timeout)
+        if response.status_code == 200:
+            return response.json().get("version", "unknown")
+    except (requests.RequestException, ValueError):
+        pass
+    return None
+
+def wait_for_ollama_ready(timeout=READY_TIMEOUT, base_url=None, process=None):
+    """Poll /api/version with exponential backoff until the API answers; returns the version or None on timeout.
+
+    Gives up early if process (the server we spawned) exits.
+    """
+    deadline = time.monotonic() + timeout
+    delay = READY_INITIAL_DELAY
+    while True:
+        version = probe_ollama(base_url)
+        if version is not None:
+            return version
+        if process is not None and process.poll() is not None:
+            print(f"Ollama exited with code {process.returncode} before becoming ready.")
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, READY_MAX_DELAY)
+
+def start_ollama_service():
+    """Make sure an Ollama API is serving: reuse a running server, otherwise start `ollama serve` and wait for it."""
+    global OLLAMA_PROCESS
+    version = probe_ollama()
+    if version is not None:
+        print(f"Reusing the Ollama server at {ollama_base_url()} (version {version}).")
+        return True
+
+    executable = find_ollama_executable()
+    if executable is None:
+        print(f"Ollama is not installed. {OLLAMA_INSTALL_HINT}")
+        return False
 
-        # Use start command to open a new terminal window
-        command = f'start cmd /C {OLLAMA_EXE_PATH} serve'
-        print(f"Executing command: {command}")
-        OLLAMA_PROCESS = subprocess.Popen(command, shell=True, env=os.environ)
+    print("Starting Ollama service...")
+    for attempt in range(1, START_ATTEMPTS + 1):
+        start = time.perf_counter()
+        if is_windows():
+            os.environ['OLLAMA_RUNNERS_DIR'] = OLLAMA_RUNNERS_DIR
+            os.environ['PATH'] = f"{os.environ['PATH']};{OLLAMA_LIB_DIR}"
+
+            # Use start command to open a new terminal window
+            command = f'start cmd /C {executable} serve'
+            print(f"Executing command: {command}")
+            OLLAMA_PROCESS = subprocess.Popen(command, shell=True, env=os.environ)
+            watched = None  # `start` returns immediately, so the shell's exit says nothing about the server
+        else:
+            OLLAMA_PROCESS = subprocess.Popen([executable, "serve"], stdout=subprocess.DEVNULL,
+                                              stderr=subprocess.DEVNULL, start_new_session=True)
+            watched = OLLAMA_PROCESS
 
-        # Wait and check if the service starts properly
-        time.sleep(10)
-        if is_port_in_use(OLLAMA_PORT):
-            print("Ollama service started successfully.")
+        version = wait_for_ollama_ready(process=watched)
+        if version is not None:
+            print(f"Ollama service (version {version}) ready in {time.perf_counter() - start:.2f}s.")
             return True
-        
-        retries -= 1
-        print("Retrying Ollama service start...")
+        stop_ollama_service()
+        print(f"Ollama service did not become ready (attempt {attempt}/{START_ATTEMPTS}).")
 
     print("Failed to start Ollama service. Please check and try again.")
     return False
 
+def start_ollama_service_windows():
+    """Start Ollama service on Windows."""
+    return start_ollama_service()
+
+def is_model_available(model_name):
+    """Check whether the server already has the model, via /api/tags."""
+    if ":" not in model_name:
+        model_name = f"{model_name}:latest"
+    try:
+        models = get_default_client().get("/api/tags").get("models") or []
+    except OllamaClientError as e:
+        print(f"Could not list the server's models: {e}")
+        return False
+    return any(model.get("name") == model_name or model.get("model") == model_name for model in models)
+
+def preload_model(model_name, keep_alive=MODEL_KEEP_ALIVE):
+    """Load the model into memory (an empty generate request) and pin it there for keep_alive, on every endpoint.
+
+    Returns the longest load time a server reported, in seconds, or None if every preload failed.
+    """
+    client = get_default_client()
+    load_times = []
+    for endpoint in client.endpoints:
+        start = time.perf_counter()
+        try:
+            response = client.generate(model_name, "", keep_alive=keep_alive, endpoint=endpoint)
+        except OllamaClientError as e:
+            print(f"Failed to preload model '{model_name}' on {endpoint}: {e}")
+            continue
+        load_times.append((response.get("load_duration") or 0) / 1e9)
+        print(f"Model '{model_name}' loaded and pinned on {endpoint} in {time.perf_counter() - start:.2f}s "
+              f"(server load time {load_times[-1]:.2f}s).")
+    return max(load_times) if load_times else None
+
+def release_model(model_name, keep_alive=RELEASED_KEEP_ALIVE):
+    """Drop the pin on a model in servers we leave running, so it unloads after the normal idle time."""
+    client = get_default_client()
+    for endpoint in client.endpoints:
+        try:
+            client.generate(model_name, "", keep_alive=keep_alive, endpoint=endpoint)
+        except OllamaClientError as e:
+            print(f"Failed to release model '{model_name}' on {endpoint}: {e}")
+
 def stop_ollama_service():
     """Stop Ollama service if it was started by this script."""
     global OLLAMA_PROCESS
@@ -177,27 +288,29 @@ def stop_ollama_service():
         OLLAMA_PROCESS = None
         print("Ollama service has been stopped.")
 
-def install_and_setup_ollama(model_name):
-    """Install and set up Ollama, including pulling the required model."""
-    if not is_ollama_installed(OLLAMA_EXE_PATH):
+def install_and_setup_ollama(model_name, restart=False):
+    """Install and set up Ollama, including pulling the required model. Returns True when the API is ready.
+
+    An already running server is reused unless restart is set.
+    """
+    if find_ollama_executable() is None and probe_ollama() is None:
         if is_windows():
             install_ollama_windows()
         else:
-            raise NotImplementedError("Install logic for non-Windows platforms is not implemented.")
-    
-    install_ollama_pkg()
+            print(f"Ollama is not installed. {OLLAMA_INSTALL_HINT}")
+            return False
 
     # Start the Ollama service before pulling the model
-    if is_windows():
+    if restart:
         kill_existing_ollama_service()  # Ensure no leftover processes are running
 
-        if not start_ollama_service_windows():
-            print("Error: Failed to start Ollama service. Exiting.")
-            return
+    if not start_ollama_service():
+        print("Error: Failed to start Ollama service. Exiting.")
+        return False
 
     # Check if model is already downloaded, if not then pull the model
-    if is_model_downloaded(model_name, DEFAULT_MODELS_DIR):
-        print(f"Model '{model_name}' is already downloaded in {DEFAULT_MODELS_DIR}.")
+    if is_model_available(model_name):
+        print(f"Model '{model_name}' is already available on the server.")
     else:
         try:
             print(f"Attempting to pull the model '{model_name}'...")
@@ -208,14 +321,24 @@ def install_and_setup_ollama(model_name):
         except Exception as e:
             print(f"Unexpected error occurred: {e}")
             raise
+    return True
 
 def get_story_response_from_model(model_name, user_message):
-    """Get response content from the model specifically for story writing."""
+    """Get response content from the model specifically for story writing.
+
+    A failed request raises OllamaClientError, so callers (and the job queue's retries and dead letters) see
+    the endpoint's real error instead of a None answer.
+    """
     user_messages = [{'role': 'user', 'content': user_message}]
-    import ollama
-    try:
-        responses = ollama.chat(model=model_name, messages=user_messages, stream=True)
-        return ''.join(chunk['message']['content'] for chunk in responses if 'message' in chunk and 'content' in chunk['message'])
-    except Exception as e:
-        print(f"An error occurred while retrieving the model's response: {e}")
-        return None
\ No newline at end of file
+    response = get_default_client().chat(model_name, user_messages, keep_alive=MODEL_KEEP_ALIVE)
+    return response['message']['content']
+
+def get_json_response_from_model(model_name, user_message, schema=None):
+    """Get a JSON-formatted response from the model, constrained to a JSON schema when one is given.
+
+    Raises OllamaClientError like get_story_response_from_model.
+    """
+    user_messages = [{'role': 'user', 'content': user_message}]
+    response = get_default_client().chat(model_name, user_messages, format=schema or 'json',
+                                         keep_alive=MODEL_KEEP_ALIVE)
+    return response['message']['content']
@@ -0,0 +1,106 @@
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+class StageStats:
+    """Per-stage counters: items handled, failures and busy time."""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.failures = 0
+        self.busy_seconds = 0.0
+
+    def record(self, seconds, failed=False):
+        self.items += 1
+        self.busy_seconds += seconds
+        if failed:
+            self.failures += 1
+
+    def summary(self, wall_seconds):
+        return {
+            "stage": self.name,
+            "items": self.items,
+            "failures": self.failures,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "items_per_second": round(self.items / wall_seconds, 3) if wall_seconds else None,
+            "seconds_per_item": round(self.busy_seconds / self.items, 3) if self.items else None,
+        }
+
+def _timed_call(fn, item):
+    """Run fn(item) in a worker and return (result, seconds, error) so failures don't kill the pool."""
+    start = time.perf_counter()
+    try:
+        return fn(item), time.perf_counter() - start, None
+    except Exception as e:
+        return None, time.perf_counter() - start, e
+
+def run_pipelined(items, producer_fn, consumer_fn, workers=1, max_pending=2, needs_producer=None,
+                  initializer=None, producer_name="producer", consumer_name="consumer", on_error=None,
+                  start_method=None):
+    """Run producer_fn on upcoming items in a process pool while consumer_fn handles the current one.
+
+    producer_fn(item) runs in worker processes and must be picklable; consumer_fn(item, produced) runs here,
+    in order. At most max_pending producer results are held at once, which bounds memory. Items for which
+    needs_producer(item) is False skip the pool and reach the consumer with produced=None.
+    start_method picks how workers start (fork, spawn or forkserver; None is the platform default). Spawned
+    workers re-import modules instead of inheriting the parent's state, so initializer must set what they need.
+    Returns per-stage stats plus total wall time.
+    """
+    producer_stats = StageStats(producer_name)
+    consumer_stats = StageStats(consumer_name)
+    waiting_seconds = 0.0
+    pending = deque()
+    items = iter(items)
+    start = time.perf_counter()
+
+    def report_error(item, error):
+        if on_error is not None:
+            on_error(item, error)
+        else:
+            print(f"An error occurred while processing {item}: {error}")
+
+    mp_context = multiprocessing.get_context(start_method) if start_method else None
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, mp_context=mp_context) as pool:
+        exhausted = False
+        while True:
+            # Keep the producers up to max_pending items ahead of the consumer
+            while not exhausted and len(pending) < max(1, max_pending):
+                item = next(items, None)
+                if item is None:
+                    exhausted = True
+                    break
+                if needs_producer is None or needs_producer(item):
+                    pending.append((item, pool.submit(_timed_call, producer_fn, item)))
+                else:
+                    pending.append((item, None))
+            if not pending:
+                break
+
+            item, future = pending.popleft()
+            produced = None
+            if future is not None:
+                wait_start = time.perf_counter()
+                produced, seconds, error = future.result()
+                waiting_seconds += time.perf_counter() - wait_start
+                producer_stats.record(seconds, failed=error is not None)
+                if error is not None:
+                    report_error(item, error)
+                    continue
+
+            consumer_start = time.perf_counter()
+            try:
+                consumer_fn(item, produced)
+                consumer_stats.record(time.perf_counter() - consumer_start)
+            except Exception as e:
+                consumer_stats.record(time.perf_counter() - consumer_start, failed=True)
+                report_error(item, e)
+
+    wall_seconds = time.perf_counter() - start
+    return {
+        "wall_seconds": round(wall_seconds, 3),
+        "items_per_second": round(consumer_stats.items / wall_seconds, 3) if wall_seconds else None,
+        "consumer_waiting_seconds": round(waiting_seconds, 3),
+        "stages": [producer_stats.summary(wall_seconds), consumer_stats.summary(wall_seconds)],
+    }
@@ -0,0 +1,205 @@
+import json
+import os
+import numpy as np
+from utilities.scanner import iter_files
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+STORAGE_JSON = "json"  # original pretty-printed JSON with inline embeddings
+STORAGE_COMPACT = "compact"  # compact JSON plus a raw float32 sidecar holding the embeddings
+STORAGE_MODES = (STORAGE_JSON, STORAGE_COMPACT)
+EMBEDDING_SIDECAR_SUFFIX = ".emb.f32"
+EMBEDDING_DTYPE = "float32"
+
+# Function to serialize a profile compactly, using orjson when it is installed
+def dumps_compact(profile):
+    if orjson is not None:
+        return orjson.dumps(profile, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(profile, separators=(',', ':')).encode('utf-8')
+
+def loads_profile(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _atomic_write(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def sidecar_path_for(json_path):
+    return f"{os.path.splitext(json_path)[0]}{EMBEDDING_SIDECAR_SUFFIX}"
+
+def write_profile(profile, json_path, storage=STORAGE_JSON):
+    """Write a profile in the requested storage mode; compact mode moves embeddings into a float32 sidecar."""
+    if storage not in STORAGE_MODES:
+        raise ValueError(f"Unknown profile storage '{storage}'. Expected one of {STORAGE_MODES}.")
+    directory = os.path.dirname(json_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)  # mirror and sharded layouts nest profiles in folders
+
+    if storage == STORAGE_JSON:
+        with open(json_path, 'w') as f:
+            json.dump(profile, f, indent=2)
+        return json_path
+
+    references = profile.get("reference_images") or []
+    embeddings = [np.asarray(ref["embedding"], dtype=np.float32) for ref in references if "embedding" in ref]
+    if embeddings:
+        matrix = np.stack(embeddings)
+        sidecar = sidecar_path_for(json_path)
+        _atomic_write(sidecar, matrix.tobytes())
+
+        compact_references = []
+        row = 0
+        for ref in references:
+            ref = dict(ref)
+            if "embedding" in ref:
+                del ref["embedding"]
+                ref.update({
+                    "embedding_file": os.path.basename(sidecar),
+                    "embedding_row": row,
+                    "embedding_rows": matrix.shape[0],
+                    "embedding_dim": matrix.shape[1],
+                    "embedding_dtype": EMBEDDING_DTYPE,
+                })
+                row += 1
+            compact_references.append(ref)
+        profile = dict(profile, reference_images=compact_references)
+
+    _atomic_write(json_path, dumps_compact(profile))
+    return json_path
+
+def load_profile(path, mmap=True):
+    """Load a profile in either storage mode.
+
+    Sidecar embeddings come back as read-only float32 arrays backed by a memory map (no copy, no float parsing);
+    with mmap=False they are read into memory instead.
+    """
+    with open(path, 'rb') as f:
+        profile = loads_profile(f.read())
+
+    directory = os.path.dirname(path)
+    matrices = {}
+    for ref in profile.get("reference_images") or []:
+        if "embedding_file" not in ref:
+            continue
+        sidecar = os.path.join(directory, ref["embedding_file"])
+        if sidecar not in matrices:
+            shape = (ref["embedding_rows"], ref["embedding_dim"])
+            if mmap:
+                matrices[sidecar] = np.memmap(sidecar, dtype=ref["embedding_dtype"], mode='r', shape=shape)
+            else:
+                matrices[sidecar] = np.fromfile(sidecar, dtype=ref["embedding_dtype"]).reshape(shape)
+        ref["embedding"] = matrices[sidecar][ref["embedding_row"]]
+    return profile
+
+STREAM_FLUSH_EVERY = 32  # profiles between flush+fsync in streaming mode
+
+class ProfileStreamWriter:
+    """Append-only JSONL writer: one profile per line, flushed (and fsynced) every flush_every profiles."""
+
+    def __init__(self, path, flush_every=STREAM_FLUSH_EVERY, fsync=True):
+        self.path = path
+        self.flush_every = max(1, flush_every)
+        self.fsync = fsync
+        self._unflushed = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'ab')
+        # A crash can leave a partial last line; start on a fresh line so new records stay parseable
+        if self._file.tell() > 0:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self._file.write(b"\n")
+
+    def write(self, profile):
+        """Append one profile and return the byte offset of its line."""
+        offset = self._file.tell()
+        self._file.write(dumps_compact(profile) + b"\n")
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self.flush()
+        return offset
+
+    def flush(self):
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._unflushed = 0
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def is_profile_stream(path):
+    return path.endswith(".jsonl")
+
+def iter_stream_records(path, start_offset=0):
+    """Lazily yield (next_offset, profile) from a JSONL stream, starting at a byte offset.
+
+    A trailing line that is incomplete (the writer crashed mid-record) is skipped.
+    """
+    with open(path, 'rb') as f:
+        f.seek(start_offset)
+        offset = start_offset
+        for line in f:
+            next_offset = offset + len(line)
+            if line.strip():
+                if not line.endswith(b"\n"):
+                    break  # partial record at the end of the file
+                try:
+                    profile = loads_profile(line)
+                except ValueError:
+                    print(f"Skipping unreadable record at byte {offset} of {path}")
+                    offset = next_offset
+                    continue
+                yield next_offset, profile
+            offset = next_offset
+
+# Function to derive the name a profile would have had as a standalone file (e.g. "andy_jpg", "group_jpg_face1",
+# "2024/cam1/andy_jpg", "lobby_mp4_id0_front")
+def profile_name(profile, fallback):
+    metadata = profile.get("metadata") or {}
+    if metadata.get("profile_id"):
+        return metadata["profile_id"]
+    if metadata.get("output_key"):
+        # Unique per source path, so a/img.jpg and b/img.jpg from a recursive scan keep separate ids
+        name = metadata["output_key"]
+    elif metadata.get("filename"):
+        # Profiles written before output_key existed
+        name = os.path.basename(metadata["filename"].replace("\\", "/")).replace('.', '_')
+    else:
+        return fallback
+    if metadata.get("face_index") is not None:
+        name += f"_face{metadata['face_index']}"
+    return name
+
+def iter_named_profiles(source):
+    """Lazily yield (name, profile) from a profiles directory or a .jsonl stream."""
+    if is_profile_stream(source):
+        for number, (_, profile) in enumerate(iter_stream_records(source), start=1):
+            yield profile_name(profile, f"record{number}"), profile
+        return
+
+    for name, path in sorted(iter_profile_files(source)):
+        yield name, load_profile(path)
+
+# Function to list (name, path) for every profile under a directory, in any output layout, without parsing them
+def iter_profile_files(profiles_dir):
+    # Nested profiles are named by their path relative to the directory, e.g. "2024/cam1/andy_jpg"
+    for path in iter_files(profiles_dir, (".json",)):
+        yield os.path.relpath(path, profiles_dir)[:-len(".json")].replace(os.sep, "/"), path
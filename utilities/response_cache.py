@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+
+DEFAULT_CACHE_PATH = os.path.join(".cache", "model_responses.sqlite3")
+DEFAULT_MAX_ENTRIES = 100000
+DEFAULT_MAX_AGE_SECONDS = 30 * 24 * 3600
+EVICT_EVERY_N_PUTS = 100
+
+# Function to hash a file's content in chunks
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+@lru_cache(maxsize=1024)
+def _cached_file_sha256(path, mtime_ns, size):
+    return file_sha256(path)
+
+def image_content_hash(image_path):
+    """Content hash of an image, memoized on (path, mtime, size) so repeated prompts don't re-read the file."""
+    if image_path is None:
+        return None
+    stat = os.stat(image_path)
+    return _cached_file_sha256(os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size)
+
+def make_cache_key(model, image_hash, prompt, options=None):
+    """Key a response by model, image content, prompt text and generation options."""
+    material = json.dumps([model, image_hash, prompt, options], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """Persistent SQLite cache of model responses with age- and size-based eviction."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES, max_age_seconds=DEFAULT_MAX_AGE_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                image_hash TEXT,
+                prompt TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._conn.commit()
+
+    def get(self, model, image_hash, prompt, options=None):
+        """Return the cached response or None; expired entries count as misses."""
+        key = make_cache_key(model, image_hash, prompt, options)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (self.max_age_seconds and now - row[1] > self.max_age_seconds):
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, model, image_hash, prompt, response, options=None):
+        key = make_cache_key(model, image_hash, prompt, options)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, image_hash, prompt, response, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", (key, model, image_hash, prompt, response, now, now))
+            self._conn.commit()
+            self._puts += 1
+            evict_now = self._puts % EVICT_EVERY_N_PUTS == 0
+        if evict_now:
+            self.evict()
+
+    def delete(self, model, image_hash, prompt, options=None):
+        key = make_cache_key(model, image_hash, prompt, options)
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def get_or_compute(self, model, image_hash, prompt, compute, options=None, validate=None):
+        """Return the cached response, or call compute() and cache its result unless it is None.
+
+        With validate, only responses for which validate(response) is true are cached, so a malformed reply is
+        asked again next run instead of being replayed; a cached response that fails it is dropped and recomputed.
+        """
+        response = self.get(model, image_hash, prompt, options)
+        if response is not None and validate is not None and not validate(response):
+            self.delete(model, image_hash, prompt, options)
+            response = None
+        if response is None:
+            response = compute()
+            if response is not None and (validate is None or validate(response)):
+                self.put(model, image_hash, prompt, response, options)
+        return response
+
+    def evict(self):
+        """Drop entries older than max_age_seconds, then the least recently used beyond max_entries."""
+        with self._lock:
+            removed = 0
+            if self.max_age_seconds:
+                cursor = self._conn.execute("DELETE FROM responses WHERE created_at < ?",
+                                            (time.time() - self.max_age_seconds,))
+                removed += cursor.rowcount
+            if self.max_entries:
+                cursor = self._conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at DESC "
+                    "LIMIT -1 OFFSET ?)", (self.max_entries,))
+                removed += cursor.rowcount
+            self._conn.commit()
+            self.evictions += removed
+            return removed
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,154 @@
+import hashlib
+import os
+import threading
+import time
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# "flat" keeps the historical <name>_<ext> files in one directory (nested files get a path hash appended);
+# "mirror" recreates the source folders; "sharded" spreads files over 256x256 hash-named folders
+OUTPUT_LAYOUTS = ("flat", "mirror", "sharded")
+PATH_HASH_LENGTH = 12  # hex digits of the relative-path hash that keep nested names apart
+PROGRESS_INTERVAL = 10.0  # seconds between progress lines
+
+# Function to lazily walk a tree with os.scandir, yielding the DirEntry of every matching file
+def iter_entries(root, extensions=None, exclude=None, skip_dirs=(), skip_hidden=True, follow_symlinks=False):
+    """Depth-first, iterative (no recursion limit) and lazy: nothing is listed ahead of the consumer beyond the
+    directory being read, so million-file trees start yielding immediately in constant memory per level.
+
+    exclude(name) drops files by name; skip_dirs are directory paths left out entirely (e.g. the output folder).
+    """
+    skipped = {os.path.abspath(path) for path in skip_dirs}
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        subdirectories = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if skip_hidden and entry.name.startswith('.'):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=follow_symlinks):
+                            if os.path.abspath(entry.path) not in skipped:
+                                subdirectories.append(entry.path)
+                            continue
+                        if not entry.is_file(follow_symlinks=follow_symlinks):
+                            continue
+                    except OSError:
+                        continue
+                    if extensions and not entry.name.lower().endswith(extensions):
+                        continue
+                    if exclude is not None and exclude(entry.name):
+                        continue
+                    yield entry
+        except OSError as e:
+            print(f"Unable to scan {directory}: {e}")
+        # Reversed so subfolders are visited in the order they were listed
+        stack.extend(reversed(subdirectories))
+
+def iter_files(root, extensions=IMAGE_EXTENSIONS, **options):
+    """Lazily yield the paths of the matching files under root (see iter_entries)."""
+    for entry in iter_entries(root, extensions, **options):
+        yield entry.path
+
+# Function to get a file's path relative to the source root; files outside it count as root files
+def source_relpath(path, root):
+    try:
+        relative = os.path.relpath(os.path.abspath(path), os.path.abspath(root))
+    except ValueError:  # another drive on Windows
+        return os.path.basename(path)
+    if relative == os.curdir or relative.startswith(os.pardir + os.sep) or relative == os.pardir:
+        return os.path.basename(path)
+    return relative
+
+# Function to map a source file to its output path (without extension) under the output root, collision-free
+def output_relpath(path, root, layout="flat", suffix=""):
+    if layout not in OUTPUT_LAYOUTS:
+        raise ValueError(f"Unknown output layout '{layout}'. Expected one of {OUTPUT_LAYOUTS}.")
+    relative = source_relpath(path, root)
+    directory, filename = os.path.split(relative)
+    name = filename.replace('.', '_')
+    if layout == "mirror":
+        return os.path.join(directory, name + suffix)
+
+    digest = hashlib.sha1(relative.replace(os.sep, "/").encode('utf-8')).hexdigest()
+    if layout == "sharded":
+        return os.path.join(digest[:2], digest[2:4], f"{name}_{digest[:PATH_HASH_LENGTH]}{suffix}")
+    if not directory:
+        return name + suffix  # root files keep the names earlier runs gave them
+    return f"{name}_{digest[:PATH_HASH_LENGTH]}{suffix}"
+
+class ProgressReporter:
+    """Prints throughput and an ETA while a lazily scanned stream is being processed.
+
+    The total comes from the caller or from count_in_background(), which walks the tree on a side thread (a
+    cheap scandir pass) so processing starts at once and the ETA appears as soon as the count is known.
+    """
+
+    def __init__(self, total=None, interval=PROGRESS_INTERVAL, label="images"):
+        self.total = total
+        self.interval = interval
+        self.label = label
+        self.done = 0
+        self.counting = False
+        self._start = time.monotonic()
+        self._last_report = self._start
+        self._lock = threading.Lock()
+
+    def count_in_background(self, make_iterable):
+        """Count make_iterable() on a daemon thread and use the result as the total."""
+        self.counting = True
+
+        def count():
+            total = sum(1 for _ in make_iterable())
+            with self._lock:
+                self.total = total
+                self.counting = False
+
+        threading.Thread(target=count, name="progress-count", daemon=True).start()
+        return self
+
+    def update(self, count=1):
+        with self._lock:
+            self.done += count
+            now = time.monotonic()
+            if now - self._last_report < self.interval:
+                return
+            self._last_report = now
+        self.report()
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = time.monotonic() - self._start
+            rate = self.done / elapsed if elapsed > 0 else 0.0
+            remaining = max(0, self.total - self.done) if self.total is not None else None
+            return {
+                "done": self.done,
+                "total": self.total,
+                "elapsed_seconds": round(elapsed, 1),
+                "per_second": round(rate, 3),
+                "eta_seconds": round(remaining / rate, 1) if remaining is not None and rate > 0 else None,
+            }
+
+    def report(self):
+        stats = self.snapshot()
+        if stats["total"] is None:
+            progress = f"{stats['done']} {self.label}" + (" (still counting)" if self.counting else "")
+        else:
+            percent = 100 * stats["done"] / stats["total"] if stats["total"] else 100.0
+            progress = f"{stats['done']}/{stats['total']} {self.label} ({percent:.1f}%)"
+        eta = f", ETA {format_duration(stats['eta_seconds'])}" if stats["eta_seconds"] is not None else ""
+        print(f"Progress: {progress} in {format_duration(stats['elapsed_seconds'])} "
+              f"at {stats['per_second']:.2f}/s{eta}")
+        return stats
+
+# Function to format seconds as e.g. "1h02m", "4m05s" or "12s"
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m"
+    if minutes:
+        return f"{minutes}m{seconds:02d}s"
+    return f"{seconds}s"
@@ -1,16 +1,17 @@
 import os
-import cv2
 import json
-import pathlib
 import numpy as np
-from sklearn.cluster import KMeans
-from collections import Counter
-from insightface.app import FaceAnalysis
-import requests
-
-# Create the output directory if it doesn't exist
-output_dir = "json_maps"
-pathlib.Path(output_dir).mkdir(parents=True, exist_ok=True)
+from utilities.face_engine import get_face_engine
+from utilities.color_naming import get_color_names
+from utilities.dominant_color import detect_hex_colors
+from utilities.image_utils import ZOOM_OUT_PYRAMID
+from utilities.image_loader import LoadedImage, load_image
+from utilities.instrumentation import trace_stage
+
+# "local" names colors from the bundled table; "api" keeps the old thecolorapi.com lookup
+COLOR_NAMING_BACKEND = "local"
+# "histogram" / "kmeans_numpy" run all regions in one vectorized pass; "sklearn" is the original per-region KMeans
+DOMINANT_COLOR_BACKEND = "histogram"
 
 # Function to resolve relative paths
 def resolve_relative_path(path: str) -> str:
@@ -18,111 +19,146 @@ def resolve_relative_path(path: str) -> str:
 
 # Generalized function to detect the dominant color in a region
 def detect_hex_color(region_img):
-    if region_img is None or region_img.size == 0:
-        return '#000000'  # Return black as a fallback color
-
-    region_img = cv2.resize(region_img, (50, 25))
-    region_img = region_img.reshape((region_img.shape[0] * region_img.shape[1], 3))
-
-    kmeans = KMeans(n_clusters=3)
-    labels = kmeans.fit_predict(region_img)
-    label_counts = Counter(labels)
-
-    dominant_color = kmeans.cluster_centers_[label_counts.most_common(1)[0][0]]
-    dominant_color_rgb = dominant_color[::-1]
-    dominant_color_hex = '#%02x%02x%02x' % (int(dominant_color_rgb[0]), int(dominant_color_rgb[1]), int(dominant_color_rgb[2]))
-    
-    return dominant_color_hex
+    return detect_hex_colors([region_img], backend=DOMINANT_COLOR_BACKEND)[0]
 
 def get_color_name_from_api(hex_color):
+    import requests
+
     response = requests.get(f"https://www.thecolorapi.com/id?hex={hex_color.lstrip('#')}")
     if response.status_code == 200:
         color_data = response.json()
         return color_data['name']['value']
     return "unknown"
 
-def get_eye_regions(image, landmarks):
+# Function to name every region color of an image in one call
+def name_colors(hex_colors):
+    if COLOR_NAMING_BACKEND == "api":
+        return [get_color_name_from_api(hex_color) if hex_color else "unknown" for hex_color in hex_colors]
+    return get_color_names(hex_colors)
+
+# Pixel offsets below are tuned for full-resolution photos; scale shrinks them for downscaled buffers
+def get_eye_regions(image, landmarks, scale=1.0):
     left_eye_coords = landmarks["eyes"]["left_eye"]
     right_eye_coords = landmarks["eyes"]["right_eye"]
+    offset = max(1, int(round(10 * scale)))
 
-    left_eye_region = image[max(0, int(left_eye_coords[1]) - 10):min(image.shape[0], int(left_eye_coords[1]) + 10),
-                            max(0, int(left_eye_coords[0]) - 10):min(image.shape[1], int(left_eye_coords[0]) + 10)]
-    right_eye_region = image[max(0, int(right_eye_coords[1]) - 10):min(image.shape[0], int(right_eye_coords[1]) + 10),
-                             max(0, int(right_eye_coords[0]) - 10):min(image.shape[1], int(right_eye_coords[0]) + 10)]
+    left_eye_region = image[max(0, int(left_eye_coords[1]) - offset):min(image.shape[0], int(left_eye_coords[1]) + offset),
+                            max(0, int(left_eye_coords[0]) - offset):min(image.shape[1], int(left_eye_coords[0]) + offset)]
+    right_eye_region = image[max(0, int(right_eye_coords[1]) - offset):min(image.shape[0], int(right_eye_coords[1]) + offset),
+                             max(0, int(right_eye_coords[0]) - offset):min(image.shape[1], int(right_eye_coords[0]) + offset)]
 
     return left_eye_region, right_eye_region
 
-def get_facial_hair_region(image, landmarks):
+def get_facial_hair_region(image, landmarks, scale=1.0):
     mouth_left_corner = landmarks["mouth"]["left_corner"]
     mouth_right_corner = landmarks["mouth"]["right_corner"]
+    offset = max(1, int(round(20 * scale)))
 
-    facial_hair_region = image[max(0, int(mouth_left_corner[1]) - 20):min(image.shape[0], int(mouth_left_corner[1]) + 20),
-                               max(0, int(mouth_left_corner[0]) - 20):min(image.shape[1], int(mouth_right_corner[0]) + 20)]
+    facial_hair_region = image[max(0, int(mouth_left_corner[1]) - offset):min(image.shape[0], int(mouth_left_corner[1]) + offset),
+                               max(0, int(mouth_left_corner[0]) - offset):min(image.shape[1], int(mouth_right_corner[0]) + offset)]
 
     return facial_hair_region
 
-def get_head_hair_region(image, landmarks):
+def get_head_hair_region(image, landmarks, scale=1.0):
     eye_left = int(landmarks["eyes"]["left_eye"][0])
     eye_right = int(landmarks["eyes"]["right_eye"][0])
     nose_bottom = int(landmarks["nose"][1])
     
-    hair_start = max(0, nose_bottom - 60)
-    hair_end = nose_bottom - 20
+    hair_start = max(0, nose_bottom - int(round(60 * scale)))
+    hair_end = nose_bottom - int(round(20 * scale))
     hair_region = image[hair_start:hair_end, eye_left:eye_right]
     
     return hair_region
 
-def generate_face_profile(image_path: str) -> dict:
-    app = FaceAnalysis()
-    app.prepare(ctx_id=0)
-
-    img = cv2.imread(image_path)
-    if img is None:
-        raise ValueError(f"Unable to load image at {image_path}")
-
-    faces = app.get(img)
-    if not faces:
-        raise ValueError("No face detected in the image.")
-
-    face = faces[0]
-    embedding = face.embedding.tolist()
-
-    landmarks = {
+# Function to pick the landmarks the profile records, in the coordinates of the given points array
+def select_landmarks(points):
+    return {
         "eyes": {
-            "left_eye": face.landmark_2d_106[36].tolist(),
-            "right_eye": face.landmark_2d_106[45].tolist()
+            "left_eye": points[36].tolist(),
+            "right_eye": points[45].tolist()
         },
-        "nose": face.landmark_2d_106[30].tolist(),
+        "nose": points[30].tolist(),
         "mouth": {
-            "left_corner": face.landmark_2d_106[48].tolist(),
-            "right_corner": face.landmark_2d_106[54].tolist()
+            "left_corner": points[48].tolist(),
+            "right_corner": points[54].tolist()
         }
     }
 
-    left_eye_region, right_eye_region = get_eye_regions(img, landmarks)
-
-    # Validate if the eye regions are non-empty before detection
-    if left_eye_region.size > 0:
-        left_eye_color = detect_hex_color(left_eye_region)
-        left_eye_color_guess = get_color_name_from_api(left_eye_color)
-    else:
-        left_eye_color = "#000000"
-        left_eye_color_guess = "unknown"
-
-    if right_eye_region.size > 0:
-        right_eye_color = detect_hex_color(right_eye_region)
-        right_eye_color_guess = get_color_name_from_api(right_eye_color)
-    else:
-        right_eye_color = "#000000"
-        right_eye_color_guess = "unknown"
-
-    facial_hair_region = get_facial_hair_region(img, landmarks)
-    facial_hair_color = detect_hex_color(facial_hair_region)
-    facial_hair_color_name = get_color_name_from_api(facial_hair_color)
-
-    head_hair_region = get_head_hair_region(img, landmarks)
-    head_hair_color = detect_hex_color(head_hair_region)
-    head_hair_color_name = get_color_name_from_api(head_hair_color)
+def generate_face_profile(image, engine=None) -> dict:
+    return generate_face_profiles(image, engine, max_faces=1)[0]
+
+def generate_face_profiles(image, engine=None, max_faces=0) -> list:
+    """Build one profile per detected face from a single detector pass.
+
+    The regions of every face are colored in one batched extraction and named in one lookup. With max_faces=1
+    this is the original single-face behaviour (the detector's first face); otherwise faces are ordered left to
+    right so face indices stay stable between runs.
+    """
+    # Accept a path or an already decoded LoadedImage so callers can share one buffer across stages
+    if not isinstance(image, LoadedImage):
+        with trace_stage("decode", image=image):
+            image = load_image(image)
+    faces = detect_faces(image, engine, max_faces)
+    if not faces:
+        raise ValueError("No face detected in the image.")
+    return profile_faces(image, faces)
+
+# Function to run the detector on a decoded image; returns the faces (possibly none) in buffer coordinates
+def detect_faces(image, engine=None, max_faces=0, zoom_out=True):
+    # Reuse the process-wide detector instead of loading the ONNX models for every image
+    if engine is None:
+        engine = get_face_engine()
+
+    with trace_stage("detection", image=image.path):
+        if zoom_out:
+            # Falls back to zoomed-out, padded copies of the decoded array; landmarks come back in buffer coordinates
+            faces, scale = engine.get_with_zoom_out(image.array, ZOOM_OUT_PYRAMID)
+        else:
+            faces, scale = engine.get(image.array), (1.0, 0)
+    # The pyramid returns ([], None) when even the zoomed-out copies have no face
+    if faces and scale != (1.0, 0):
+        print(f"Face found in {image.path} after zooming out to {scale[0]:.2f}x with {scale[1]}px padding.")
+    if max_faces == 1:
+        return faces[:1]
+    return sorted(faces, key=lambda face: float(face.bbox[0]))[:max_faces or None]
+
+# Function to build the profiles of detected faces: region colors in one batched pass, names in one lookup
+def profile_faces(image, faces, face_indices=None):
+    image_path = image.path
+    img = image.array
+    if face_indices is None:
+        face_indices = range(len(faces))
+
+    # Regions are cut from the decoded buffer; the profiles record landmarks at the original resolution
+    regions = []
+    for face in faces:
+        buffer_landmarks = select_landmarks(face.landmark_2d_106)
+        left_eye_region, right_eye_region = get_eye_regions(img, buffer_landmarks, image.scale)
+        facial_hair_region = get_facial_hair_region(img, buffer_landmarks, image.scale)
+        head_hair_region = get_head_hair_region(img, buffer_landmarks, image.scale)
+        regions.extend([left_eye_region, right_eye_region, facial_hair_region, head_hair_region])
+
+    # Extract the four dominant colors of every face in one pass; empty regions come back as black
+    with trace_stage("color_extraction", image=image_path, backend=DOMINANT_COLOR_BACKEND, faces=len(faces)):
+        colors = detect_hex_colors(regions, backend=DOMINANT_COLOR_BACKEND)
+
+    # Name every region in one lookup; empty eye regions (the first two of each face) stay "unknown"
+    lookups = []
+    for i, (color, region) in enumerate(zip(colors, regions)):
+        is_eye_region = i % 4 < 2
+        lookups.append(None if is_eye_region and region.size == 0 else color)
+    with trace_stage("color_naming", image=image_path, backend=COLOR_NAMING_BACKEND, faces=len(faces)):
+        names = name_colors(lookups)
+
+    return [build_face_profile(image, face, face_index, colors[4 * i:4 * i + 4], names[4 * i:4 * i + 4])
+            for i, (face, face_index) in enumerate(zip(faces, face_indices))]
+
+# Function to assemble one face's profile from its detection and its four region colors and names
+def build_face_profile(image, face, face_index, colors, names):
+    left_eye_color, right_eye_color, facial_hair_color, head_hair_color = colors
+    left_eye_color_guess, right_eye_color_guess, facial_hair_color_name, head_hair_color_name = names
+    embedding = face.embedding.tolist()
+    landmarks = select_landmarks(image.to_original(face.landmark_2d_106))
 
     return {
         "reference_images": [
@@ -158,5 +194,9 @@ def generate_face_profile(image_path: str) -> dict:
             "height": "unknown",
             "build": "unknown",
             "movement": "unknown"
-        }
+        },
+        "image_stats": image.stats(),
+        "face_index": face_index,
+        "bbox": [round(float(v), 2) for v in image.to_original(face.bbox.reshape(2, 2)).reshape(4)],
+        "det_score": round(float(face.det_score), 4)
     }
\ No newline at end of file
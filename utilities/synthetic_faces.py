@@ -0,0 +1,110 @@
+import os
+import time
+import numpy as np
+import cv2
+
+EMBEDDING_DIM = 512
+# Landmark positions as fractions of the face box, at the 106-point indices generate_face_profile reads
+LANDMARK_LAYOUT = {
+    36: (0.35, 0.42),  # left eye
+    45: (0.65, 0.42),  # right eye
+    30: (0.50, 0.60),  # nose
+    48: (0.38, 0.75),  # left mouth corner
+    54: (0.62, 0.75),  # right mouth corner
+}
+FACE_BOX = (0.2, 0.15, 0.8, 0.9)  # x1, y1, x2, y2 as fractions of the image
+
+# Function to get the face boxes of an image with faces side by side in equal-width slots
+def face_boxes(width, height, faces=1):
+    slot = width / faces
+    return [(i * slot + FACE_BOX[0] * slot, FACE_BOX[1] * height, i * slot + FACE_BOX[2] * slot, FACE_BOX[3] * height)
+            for i in range(faces)]
+
+# Function to draw simple faces (skin oval, hair, eyes, mouth) side by side, with colors picked from the seed
+def make_synthetic_face(seed, size=(640, 640), faces=1):
+    rng = np.random.default_rng(seed)
+    width, height = size
+    img = np.full((height, width, 3), rng.integers(150, 256, size=3), dtype=np.uint8)
+    for box in face_boxes(width, height, faces):
+        _draw_face(img, [int(v) for v in box], rng)
+    img = img.astype(np.int16) + rng.normal(0, 6, size=img.shape).astype(np.int16)
+    return np.clip(img, 0, 255).astype(np.uint8)
+
+def _draw_face(img, box, rng):
+    x1, y1, x2, y2 = box
+    center = ((x1 + x2) // 2, (y1 + y2) // 2)
+    axes = ((x2 - x1) // 2, (y2 - y1) // 2)
+    hair, skin, eyes, mouth = (tuple(int(c) for c in rng.integers(0, 256, size=3)) for _ in range(4))
+    cv2.ellipse(img, (center[0], y1 + axes[1] // 2), (axes[0], axes[1] // 2 + 10), 0, 180, 360, hair, -1)
+    cv2.ellipse(img, center, axes, 0, 0, 360, skin, -1)
+
+    def point(index):
+        fx, fy = LANDMARK_LAYOUT[index]
+        return int(x1 + fx * (x2 - x1)), int(y1 + fy * (y2 - y1))
+
+    radius = max(3, (x2 - x1) // 20)
+    cv2.circle(img, point(36), radius, eyes, -1)
+    cv2.circle(img, point(45), radius, eyes, -1)
+    cv2.line(img, point(48), point(54), mouth, max(2, radius // 2))
+
+# Function to write count synthetic faces to a directory and return their paths
+def write_synthetic_faces(directory, count, size=(640, 640), seed=0, faces=1):
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"synthetic_{i:04d}.jpg")
+        cv2.imwrite(path, make_synthetic_face(seed + i, size, faces))
+        paths.append(path)
+    return paths
+
+class SyntheticFace(dict):
+    """Mimics insightface's Face: a dict whose keys are also attributes."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+class SyntheticFaceEngine:
+    """Drop-in for FaceAnalysisEngine that 'detects' the face drawn by make_synthetic_face.
+
+    Landmarks come from the fixed layout and the embedding is a deterministic projection of the pixels, so
+    similar images get similar embeddings. detect_seconds simulates detector cost per call.
+    """
+
+    def __init__(self, detect_seconds=0.0, seed=0, faces_per_image=1):
+        self.detect_seconds = detect_seconds
+        self.faces_per_image = faces_per_image
+        self.warmed_up = False
+        self._projection = np.random.default_rng(seed).standard_normal((16 * 16 * 3, EMBEDDING_DIM)).astype(np.float32)
+
+    def prepare(self):
+        return self
+
+    def warm_up(self):
+        self.warmed_up = True
+        return self
+
+    def _face(self, img, box):
+        x1, y1, x2, y2 = box
+        landmarks = np.zeros((106, 2), dtype=np.float32)
+        for index, (fx, fy) in LANDMARK_LAYOUT.items():
+            landmarks[index] = (x1 + fx * (x2 - x1), y1 + fy * (y2 - y1))
+        crop = img[max(0, int(y1)):int(y2), max(0, int(x1)):int(x2)]
+        pixels = cv2.resize(crop, (16, 16), interpolation=cv2.INTER_AREA).astype(np.float32).reshape(-1) / 255.0
+        embedding = (pixels - pixels.mean()) @ self._projection
+        return SyntheticFace(bbox=np.array([x1, y1, x2, y2], dtype=np.float32), kps=landmarks[[36, 45, 30, 48, 54]],
+                             det_score=0.99, landmark_2d_106=landmarks, embedding=embedding)
+
+    def get(self, img, max_num=0):
+        if self.detect_seconds:
+            time.sleep(self.detect_seconds)
+        height, width = img.shape[:2]
+        return [self._face(img, box) for box in face_boxes(width, height, self.faces_per_image)]
+
+    def get_with_zoom_out(self, img, pyramid=(), max_num=0):
+        return self.get(img, max_num=max_num), (1.0, 0)
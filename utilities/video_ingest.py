@@ -0,0 +1,151 @@
+from collections import OrderedDict, namedtuple
+import numpy as np
+from utilities.image_loader import LoadedImage, MAX_DECODE_SIDE
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v', '.webm')
+# Frames analysed per second of video; CCTV rarely changes faster than this
+DEFAULT_SAMPLE_FPS = 2.0
+FALLBACK_FPS = 25.0  # used when the container doesn't report a frame rate
+# Cosine similarity at or above which a face is the same person as a recently seen one
+DEFAULT_MATCH_THRESHOLD = 0.5
+# Identities kept for matching; one that hasn't been seen for this many other identities counts as new again
+DEFAULT_RECENT_IDENTITIES = 64
+# Nose offset from the eye midpoint, as a fraction of the eye distance, beyond which the face is turned
+POSE_YAW_THRESHOLD = 0.2
+
+# image is the (possibly downscaled) buffer the detector sees; frame is the full-resolution BGR frame
+VideoFrame = namedtuple("VideoFrame", ["index", "seconds", "image", "frame"])
+FaceMatch = namedtuple("FaceMatch", ["identity", "pose", "similarity", "new_identity", "new_pose"])
+
+# Function to check whether a file name looks like a video the ingestor can read
+def is_video_file(filename):
+    return filename.lower().endswith(VIDEO_EXTENSIONS)
+
+# Function to stream sampled frames of a video as LoadedImages without holding more than one frame in memory
+def iter_video_frames(video_path, sample_fps=DEFAULT_SAMPLE_FPS, every_n_frames=None, max_side=MAX_DECODE_SIDE,
+                      max_frames=None):
+    """Yield VideoFrame(index, seconds, image, frame) for every sampled frame.
+
+    Sampling is every_n_frames when given, otherwise the stride that gives sample_fps (None or 0 keeps every
+    frame). Skipped frames are only grabbed, never converted to BGR. Frames larger than max_side are downscaled;
+    image.to_original maps coordinates back to the full frame.
+    """
+    import cv2
+
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError(f"Unable to open video: {video_path}")
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or FALLBACK_FPS
+        if every_n_frames:
+            stride = max(1, int(every_n_frames))
+        else:
+            stride = max(1, round(fps / sample_fps)) if sample_fps else 1
+
+        index = 0
+        yielded = 0
+        while max_frames is None or yielded < max_frames:
+            if index % stride:
+                if not capture.grab():
+                    break
+                index += 1
+                continue
+            ok, frame = capture.read()
+            if not ok:
+                break
+            image = frame_to_image(frame, f"{video_path}#{index}", max_side)
+            yield VideoFrame(index, round(index / fps, 3), image, frame)
+            yielded += 1
+            index += 1
+    finally:
+        capture.release()
+
+# Function to wrap a decoded frame, downscaling it to max_side like load_image does for stills
+def frame_to_image(frame, source, max_side=MAX_DECODE_SIDE):
+    height, width = frame.shape[:2]
+    scale = max_side / max(height, width) if max_side else 1.0
+    if scale >= 1:
+        return LoadedImage.from_array(frame, source)
+    import cv2
+
+    resized = cv2.resize(frame, (max(1, round(width * scale)), max(1, round(height * scale))),
+                         interpolation=cv2.INTER_AREA)
+    return LoadedImage(source, resized, (width, height))
+
+# Function to bucket a face's head pose from its landmarks ("left", "front" or "right")
+def pose_bucket(landmarks):
+    left_eye = np.asarray(landmarks["eyes"]["left_eye"], dtype=np.float32)
+    right_eye = np.asarray(landmarks["eyes"]["right_eye"], dtype=np.float32)
+    nose = np.asarray(landmarks["nose"], dtype=np.float32)
+    eye_distance = float(np.linalg.norm(right_eye - left_eye))
+    if eye_distance == 0:
+        return "front"
+    yaw = float(nose[0] - (left_eye[0] + right_eye[0]) / 2) / eye_distance
+    if yaw <= -POSE_YAW_THRESHOLD:
+        return "left"
+    if yaw >= POSE_YAW_THRESHOLD:
+        return "right"
+    return "front"
+
+class FaceDeduplicator:
+    """Matches face embeddings against recently seen identities so each person/pose is analysed once.
+
+    Embeddings are L2-normalised and compared by cosine similarity against the latest embedding of each of the
+    most recent max_identities identities (so slow drift across a clip keeps matching). A face is new when no
+    identity reaches threshold; a known identity in a pose bucket it hasn't been seen in is a new pose.
+    """
+
+    def __init__(self, threshold=DEFAULT_MATCH_THRESHOLD, max_identities=DEFAULT_RECENT_IDENTITIES, prefix="id"):
+        self.threshold = threshold
+        self.max_identities = max_identities
+        self.prefix = prefix
+        self._recent = OrderedDict()  # identity -> latest normalised embedding, least recently seen first
+        self._poses = {}  # identity -> pose buckets already analysed
+        self._next_id = 0
+        self.faces = 0
+        self.new_identities = 0
+        self.new_poses = 0
+
+    def match(self, embedding, pose="front"):
+        """Return a FaceMatch for one face, registering it as a new identity or pose when it is one."""
+        vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = float(np.linalg.norm(vector))
+        vector = vector / norm if norm else vector
+        self.faces += 1
+
+        identity, similarity = None, 0.0
+        if self._recent:
+            identities = list(self._recent)
+            scores = np.stack([self._recent[key] for key in identities]) @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                identity, similarity = identities[best], float(scores[best])
+
+        new_identity = identity is None
+        if new_identity:
+            identity = f"{self.prefix}{self._next_id}"
+            self._next_id += 1
+            self.new_identities += 1
+            self._poses[identity] = set()
+        self._recent[identity] = vector
+        self._recent.move_to_end(identity)
+        while len(self._recent) > self.max_identities:
+            evicted, _ = self._recent.popitem(last=False)
+            self._poses.pop(evicted, None)
+
+        new_pose = pose not in self._poses[identity]
+        if new_pose:
+            self._poses[identity].add(pose)
+            if not new_identity:
+                self.new_poses += 1
+        return FaceMatch(identity, pose, round(similarity, 4), new_identity, new_pose)
+
+    def stats(self):
+        return {
+            "faces": self.faces,
+            "identities": self._next_id,
+            "new_identities": self.new_identities,
+            "new_poses": self.new_poses,
+            "analysed": self.new_identities + self.new_poses,
+            "deduplicated": self.faces - self.new_identities - self.new_poses,
+        }